@@ -1,15 +1,25 @@
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, jsonify, request, send_from_directory
+import atexit
+import click
 from flask_cors import CORS
 import os
+import time
 from dotenv import load_dotenv # Importar dotenv
+
+# Cargar variables de entorno desde .env (antes de importar los servicios que las leen)
+load_dotenv()
+
 from routes.campaign_routes import campaign_bp
 from routes.vault_routes import vault_bp
 from routes.session_routes import session_bp
 from routes.ai_routes import ai_bp
-from routes.audio_routes import audio_bp
-
-# Cargar variables de entorno desde .env
-load_dotenv()
+from routes.search_routes import search_bp
+from routes.event_routes import event_bp
+from routes.audio_routes import audio_bp, enqueue_transcode, get_catalog, start_prune_scheduler
+from services.file_service import FileService
+from services import change_service, event_service, journal_service, session_log_service, summary_service, text_index_service, write_buffer_service
+from services.job_service import jobs
+import data_manager
 
 app = Flask(__name__)
 CORS(app)
@@ -17,20 +27,130 @@ CORS(app)
 DATA_STORAGE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data_storage'))
 app.config['DATA_STORAGE_PATH'] = DATA_STORAGE_PATH
 
+# Reaplicar escrituras pendientes del journal y limpiar temporales de un corte previo
+if os.path.isdir(DATA_STORAGE_PATH):
+    journal_service.recover(DATA_STORAGE_PATH)
+journal_service.recover(data_manager.DATA_DIR)
+
 app.register_blueprint(campaign_bp, url_prefix='/api/campaigns')
 app.register_blueprint(vault_bp, url_prefix='/api/campaigns')
 app.register_blueprint(session_bp, url_prefix='/api/campaigns')
 app.register_blueprint(ai_bp, url_prefix='/api/campaigns')
+app.register_blueprint(search_bp, url_prefix='/api/campaigns')
 app.register_blueprint(audio_bp, url_prefix='/api')
+app.register_blueprint(event_bp, url_prefix='/api')
+
+# Los índices de texto completo, los resúmenes, el contador de cambios y los avisos
+# en tiempo real se mantienen con cada guardado/borrado
+FileService.add_listener(text_index_service.on_file_event)
+FileService.add_listener(summary_service.on_file_event)
+FileService.add_listener(change_service.on_file_event)
+FileService.add_listener(event_service.on_file_event)
+
+# Autoguardado diferencial: lo que quedase en los logs de sesión (corte o reinicio
+# antes de compactar) se vuelca ya, para los lectores que no pasan por flush()
+if os.path.isdir(DATA_STORAGE_PATH):
+    _startup_service = FileService(DATA_STORAGE_PATH)
+    for _name in os.listdir(DATA_STORAGE_PATH):
+        if _name.startswith("campaign_"):
+            session_log_service.flush_campaign(_startup_service, _name[len("campaign_"):])
+
+# Al salir o al recibir SIGTERM/SIGINT: se vuelca la escritura diferida y después se
+# cierran los journals (atexit ejecuta en orden inverso al de registro)
+atexit.register(journal_service.close_all)
+if write_buffer_service.WRITE_BEHIND_INTERVAL > 0 or journal_service.WRITE_JOURNAL:
+    write_buffer_service.install_shutdown_handlers()
+
+# Tareas periódicas: se arrancan con la primera petición para que el proceso
+# vigilante del reloader de Flask (que no sirve peticiones) no las duplique
+_background_started = False
+
+@app.before_request
+def start_background_tasks():
+    global _background_started
+    if not _background_started:
+        _background_started = True
+        start_prune_scheduler()
 
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy", "storage_path": DATA_STORAGE_PATH})
 
+@app.route('/api/system/cache', methods=['GET'])
+def cache_stats():
+    return jsonify({"documents": FileService.cache_stats(), "journal": journal_service.journal_stats(),
+                    "write_behind": write_buffer_service.buffer_stats(), "events": event_service.channel_stats()})
+
+@app.cli.command('rebuild-vault-snapshots')
+@click.argument('campaign_id', required=False)
+def rebuild_vault_snapshots(campaign_id):
+    """Regenera vault_snapshot.jsonl desde los ficheros individuales del vault."""
+    service = FileService(app.config['DATA_STORAGE_PATH'])
+    campaign_ids = [campaign_id] if campaign_id else [c['id'] for c in summary_service.list_summaries(service)]
+    for cid in campaign_ids:
+        count = service.rebuild_vault_snapshot(cid)
+        click.echo(f"campaign_{cid}: {count} items")
+
+@app.cli.command('transcode-tracks')
+def transcode_tracks():
+    """Genera las versiones ligeras de las pistas que todavía no las tienen."""
+    metadata = data_manager.get_all_metadata()
+    pending = [tid for tid in get_catalog().track_ids() if not metadata.get(tid, {}).get('renditions')]
+    queued = [enqueue_transcode(tid) for tid in pending]
+    for job in queued:
+        while not job.finished:
+            time.sleep(0.2)
+        click.echo(f"{job.params['trackId']}: {job.status}" + (f" ({job.error})" if job.error else ""))
+
+@app.cli.command('rebuild-track-catalog')
+def rebuild_track_catalog():
+    """Reescanea assets/ y analiza (duración y forma de onda) las pistas pendientes."""
+    count = get_catalog().rebuild()
+    click.echo(f"{count} pistas en el catálogo")
+    for job in jobs.list('analyze'):
+        while not job.finished:
+            time.sleep(0.2)
+        click.echo(f"Análisis: {job.status} {job.result or job.error}")
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify([job.to_dict() for job in jobs.list(request.args.get('kind'))])
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if not job: return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+# Audio: Range/206 para poder saltar en ficheros largos, ETag fuerte y Cache-Control.
+# Los originales (/assets) se pueden resubir con el mismo nombre: no-cache, el
+# navegador revalida con el ETag. Las versiones (/renditions) se nombran por la
+# huella del original, así que su contenido no cambia y se cachean ASSET_MAX_AGE.
+# Con ASSET_SENDFILE=1 se delega la entrega al proxy (X-Sendfile); si no, werkzeug usa
+# wsgi.file_wrapper, que los servidores WSGI de producción sirven con sendfile.
+ASSET_MAX_AGE = int(os.getenv('ASSET_MAX_AGE', '3600'))
+app.config['USE_X_SENDFILE'] = os.getenv('ASSET_SENDFILE', '0') == '1'
+
+def send_audio(directory, path, immutable=False):
+    response = send_from_directory(directory, path, conditional=True, etag=True,
+                                   max_age=ASSET_MAX_AGE if immutable else None)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if immutable:
+        response.cache_control.public = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
 @app.route('/assets/<path:path>')
 def serve_asset(path):
     assets_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
-    return send_from_directory(assets_dir, path)
+    return send_audio(assets_dir, path)
+
+@app.route('/renditions/<path:path>')
+def serve_rendition(path):
+    # Versiones ligeras generadas en segundo plano (nombradas por la huella del original)
+    return send_audio(os.path.join(data_manager.DATA_DIR, 'renditions'), path, immutable=True)
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # threaded: cada reproductor/capa de ambiente abre su propio stream
+    app.run(debug=True, port=5000, threaded=True)
\ No newline at end of file
@@ -1,5 +1,8 @@
 import json
 import os
+import time
+from services import event_service, journal_service, kv_service
+from services.lock_service import path_lock, path_locks
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 SETTINGS_FILE = os.path.join(DATA_DIR, 'settings.json')
@@ -14,116 +17,126 @@ def load_json(filepath, default):
     if not os.path.exists(filepath): return default
     try:
         with open(filepath, 'r', encoding='utf-8') as f: return json.load(f)
-    except: return default
+    except ValueError:
+        # JSON corrupto: apartarlo en vez de devolver el default y machacarlo al guardar
+        corrupt_path = f"{filepath}.corrupt-{int(time.time())}"
+        os.replace(filepath, corrupt_path)
+        print(f"Aviso: '{filepath}' estaba corrupto, movido a '{corrupt_path}'.")
+        return default
 
 def save_json(filepath, data):
-    with open(filepath, 'w', encoding='utf-8') as f: json.dump(data, f, indent=4)
+    journal_service.write_many(DATA_DIR, [(filepath, json.dumps(data, indent=4).encode('utf-8'))])
 
 # --- API Settings ---
 def get_settings(): return load_json(SETTINGS_FILE, {"masterVolume": 50, "lastFrame": "Fantasy"})
 def save_settings(s): 
-    curr = get_settings()
-    curr.update(s)
-    save_json(SETTINGS_FILE, curr)
+    with path_lock(SETTINGS_FILE):
+        curr = get_settings()
+        curr.update(s)
+        save_json(SETTINGS_FILE, curr)
+    event_service.publish_audio("settings-saved", {"settings": curr})
+
+# Presets, órdenes y metadatos van en almacenes clave -> valor (services/kv_service):
+# cada cambio escribe solo su registro en vez de reescribir la colección entera.
+# Cada cambio se avisa en el canal de audio (event_service) para los clientes conectados.
+def _presets_store(): return kv_service.open_store(PRESETS_FILE, list_key='id')
+def _orders_store(): return kv_service.open_store(ORDERS_FILE)
+def _metadata_store(): return kv_service.open_store(METADATA_FILE)
 
 # --- API Presets ---
-def get_presets(): return load_json(PRESETS_FILE, [])
+def get_presets(): return list(_presets_store().all().values())
 def save_preset(p):
-    presets = get_presets()
-    found = False
-    for idx, existing in enumerate(presets):
-        if existing['id'] == p['id']:
-            presets[idx] = p
-            found = True
-            break
-    if not found: presets.append(p)
-    save_json(PRESETS_FILE, presets)
+    _presets_store().put(p['id'], p)
+    event_service.publish_audio("preset-saved", {"preset": p})
 def delete_preset(pid):
-    presets = [p for p in get_presets() if p['id'] != pid]
-    save_json(PRESETS_FILE, presets)
+    _presets_store().delete(pid)
+    event_service.publish_audio("preset-deleted", {"id": pid})
 
 # --- API Playlist Orders ---
-def get_orders(): return load_json(ORDERS_FILE, {})
+def get_orders(): return _orders_store().all()
 def save_order(key, track_ids):
-    orders = get_orders()
-    orders[key] = track_ids
-    save_json(ORDERS_FILE, orders)
+    _orders_store().put(key, track_ids)
+    event_service.publish_audio("order-saved", {"key": key, "trackIds": track_ids})
 
 # --- Track Metadata ---
-def get_all_metadata(): return load_json(METADATA_FILE, {})
+def get_all_metadata(): return _metadata_store().all()
+def get_track_metadata(track_id): return _metadata_store().get(track_id, {})
+def metadata_signature():
+    """Cambia cada vez que se modifican los metadatos (para ETags de /api/tracks)."""
+    return _metadata_store().signature()
 def save_track_metadata(track_id, metadata):
-    data = get_all_metadata()
-    if track_id not in data: data[track_id] = {}
-    data[track_id].update(metadata)
-    save_json(METADATA_FILE, data)
-def update_metadata_id(old_id, new_id):
-    data = get_all_metadata()
-    if old_id in data:
-        data[new_id] = data.pop(old_id)
-        save_json(METADATA_FILE, data)
-
-# --- MANTENIMIENTO (CORREGIDO) ---
-def prune_orphaned_data(assets_dir):
-    """Elimina referencias en JSONs de archivos que ya no existen en disco."""
-    
-    # 1. Escanear todos los archivos reales existentes
-    actual_files = set()
-    for root, dirs, files in os.walk(assets_dir):
-        for file in files:
-            if file.lower().endswith(('.mp3', '.wav', '.ogg')):
-                rel_path = os.path.relpath(os.path.join(root, file), assets_dir).replace('\\', '/')
-                actual_files.add(rel_path)
-    
-    print(f"Mantenimiento: {len(actual_files)} archivos de audio detectados.")
-
-    # 2. Limpiar Metadata (Iconos)
-    meta = get_all_metadata()
-    meta_keys = list(meta.keys())
-    meta_deleted = 0
-    for k in meta_keys:
-        if k not in actual_files:
-            del meta[k]
-            meta_deleted += 1
-    if meta_deleted > 0:
-        save_json(METADATA_FILE, meta)
-        print(f" - Eliminados {meta_deleted} metadatos huérfanos.")
-
-    # 3. Limpiar Presets (CORREGIDO)
-    presets = get_presets()
-    valid_presets = []
-    presets_changed = False
-    
-    for p in presets:
-        original_tracks = p['tracks']
-        # Filtramos: solo nos quedamos con las pistas que existen en 'actual_files'
-        valid_tracks = [t for t in original_tracks if t['trackId'] in actual_files]
-        
-        # Detectamos si ha habido cambios en las pistas de este preset
-        if len(valid_tracks) != len(original_tracks):
-            presets_changed = True
-            
-        # LÓGICA NUEVA: Solo guardamos el preset si todavía le queda alguna pista
-        if len(valid_tracks) > 0:
-            p['tracks'] = valid_tracks
-            valid_presets.append(p)
-        else:
-            # Si el preset se queda vacío (0 pistas), NO lo añadimos a valid_presets
-            # Esto efectivamente elimina el preset
-            presets_changed = True
-            print(f" - Preset '{p.get('name', 'unnamed')}' eliminado por quedarse vacío.")
-
-    if presets_changed:
-        save_json(PRESETS_FILE, valid_presets)
-        print(f" - Presets actualizados y limpiados.")
-
-    # 4. Limpiar Orden de Listas
-    orders = get_orders()
-    orders_changed = False
-    for key in orders:
-        original_len = len(orders[key])
-        orders[key] = [tid for tid in orders[key] if tid in actual_files]
-        if len(orders[key]) != original_len:
-            orders_changed = True
-    if orders_changed:
-        save_json(ORDERS_FILE, orders)
-        print(f" - Listas de reproducción limpiadas.")
\ No newline at end of file
+    _metadata_store().update(track_id, metadata)
+    event_service.publish_audio("track-metadata", {"id": track_id, "changes": metadata})
+def update_metadata_id(old_id, new_id): _metadata_store().rename(old_id, new_id)
+def rename_metadata_prefix(old_prefix, new_prefix):
+    """Mueve los metadatos de una carpeta renombrada en una sola operación."""
+    return _metadata_store().rename_prefix(old_prefix, new_prefix)
+
+# --- MANTENIMIENTO ---
+PRUNE_STATE_FILE = os.path.join(DATA_DIR, 'prune_state.json')
+
+def get_prune_state(): return load_json(PRUNE_STATE_FILE, {})
+def save_prune_state(state):
+    with path_lock(PRUNE_STATE_FILE):
+        save_json(PRUNE_STATE_FILE, state)
+
+def reconcile_orphans(exists, candidates=None, dry_run=False):
+    """Quita de metadatos, presets y órdenes las referencias a pistas que ya no existen.
+
+    exists(track_id) dice si la pista sigue en disco. Con 'candidates' solo se revisan
+    esas rutas (las tocadas desde la última pasada); con None se revisa todo.
+    Devuelve el diff de lo eliminado (o de lo que se eliminaría con dry_run).
+    """
+    stores = [_metadata_store(), _presets_store(), _orders_store()]
+    with path_locks([store.lock_path for store in stores]):
+        checked = {}
+        def is_orphan(track_id):
+            if candidates is not None and track_id not in candidates:
+                return False
+            if track_id not in checked:
+                checked[track_id] = not exists(track_id)
+            return checked[track_id]
+
+        # 1. Metadatos: con candidatos basta con mirar esas claves
+        meta_store = _metadata_store()
+        meta_keys = [c for c in candidates if meta_store.get(c) is not None] if candidates is not None else meta_store.keys()
+        orphan_meta = [k for k in meta_keys if is_orphan(k)]
+
+        # 2. Presets: se quitan las pistas huérfanas y los que se quedan vacíos
+        preset_updates, preset_deletes, removed_from_presets = {}, [], {}
+        for preset in get_presets():
+            removed = [t['trackId'] for t in preset['tracks'] if is_orphan(t['trackId'])]
+            if not removed:
+                continue
+            removed_from_presets[preset['id']] = removed
+            valid_tracks = [t for t in preset['tracks'] if t['trackId'] not in removed]
+            if valid_tracks:
+                preset_updates[preset['id']] = {**preset, 'tracks': valid_tracks}
+            else:
+                preset_deletes.append(preset['id'])
+
+        # 3. Orden de listas
+        order_updates, removed_from_orders = {}, {}
+        for key, track_ids in get_orders().items():
+            removed = [tid for tid in track_ids if is_orphan(tid)]
+            if removed:
+                removed_from_orders[key] = removed
+                order_updates[key] = [tid for tid in track_ids if tid not in removed]
+
+        if not dry_run:
+            meta_store.delete_many(orphan_meta)
+            for preset in preset_updates.values():
+                _presets_store().put(preset['id'], preset)
+            _presets_store().delete_many(preset_deletes)
+            for key, track_ids in order_updates.items():
+                _orders_store().put(key, track_ids)
+            if orphan_meta or preset_updates or preset_deletes or order_updates:
+                event_service.publish_audio("orphans-pruned", {"tracks": sorted(k for k, v in checked.items() if v)})
+
+    return {
+        "checked": len(checked),
+        "metadata": orphan_meta,
+        "presets": {"updated": {pid: ids for pid, ids in removed_from_presets.items() if pid not in preset_deletes},
+                    "deleted": preset_deletes},
+        "orders": removed_from_orders,
+    }
@@ -1,154 +1,95 @@
-from flask import Blueprint, request, jsonify, current_app
+import json
+from contextlib import closing
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from services.file_service import FileService
-import os
-import google.generativeai as genai
+from services.context_service import build_prompt, build_query_context
+from services.ai_provider import get_provider
+from services.conversation_service import conversations
 
 ai_bp = Blueprint('ai', __name__)
 
-def configure_genai():
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY not found in environment variables")
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel(
-        model_name="gemini-2.0-flash",
-        generation_config={
-            "temperature": 0.9,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 8192,
-            "response_mime_type": "text/plain",
-        }
-    )
-
 def get_file_service():
     storage_path = current_app.config['DATA_STORAGE_PATH']
     return FileService(storage_path)
 
-def load_campaign_context(service, campaign_id):
-    path = service._get_campaign_path(campaign_id)
-    metadata = service.load_json(os.path.join(path, "metadata.json"))
-    vault_path = os.path.join(path, "vault")
-    vault_items = []
-    if os.path.exists(vault_path):
-        for f in os.listdir(vault_path):
-            if f.endswith(".json"):
-                item = service.load_json(os.path.join(vault_path, f))
-                if item: vault_items.append(item)
-    return metadata, vault_items
+def prepare_chat(campaign_id, data):
+    """(clave de conversación, prompt, mensaje, informe) de una petición de chat, o None si la campaña no existe."""
+    context_mode = data.get('mode', 'vault')
+    session_id = data.get('sessionId')
+    conversation_id = data.get('conversationId') or 'default'
+    query = data.get('query', '')
+
+    service = get_file_service()
+    system_prompt, context_report = build_prompt(service, campaign_id, context_mode, session_id)
+    if system_prompt is None:
+        return None
+    # Lo relacionado con la consulta va en el mensaje: el prompt de sistema no cambia entre turnos
+    query_context, query_report = build_query_context(service, campaign_id, query, context_mode, session_id)
+    message = f"{query_context}\n\nCONSULTA:\n{query}" if query_context else query
+    context_report["query"] = query_report
+    # Conversación persistente: el chat (y su historial) se reutiliza entre mensajes
+    key = (campaign_id, context_mode, session_id or '', conversation_id)
+    return key, system_prompt, message, context_report
 
-def get_rolling_memory(service, campaign_id, limit=3):
-    """Recupera los resúmenes de las últimas 'limit' sesiones completadas."""
-    campaign_path = service._get_campaign_path(campaign_id)
-    sessions_path = os.path.join(campaign_path, "sessions")
-    sessions = []
-    
-    if os.path.exists(sessions_path):
-        for f in os.listdir(sessions_path):
-            if f.endswith(".json"):
-                sess = service.load_json(os.path.join(sessions_path, f))
-                if sess and sess.get('status') == 'completed' and sess.get('summary'):
-                    sessions.append(sess)
-    
-    # Ordenar por número (descendente) y tomar los últimos
-    sessions.sort(key=lambda x: x.get('number', 0), reverse=True)
-    recent = sessions[:limit]
-    
-    # Formatear texto (orden cronológico para la lectura de la IA)
-    memory_text = ""
-    for s in reversed(recent):
-        memory_text += f"- Sesión {s['number']} ({s.get('title', 'Sin título')}): {s.get('summary')}\n"
-    
-    return memory_text
+def sse(data, event=None):
+    payload = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{payload}" if event else payload
 
 @ai_bp.route('/<campaign_id>/chat', methods=['POST'])
 def chat_with_ai(campaign_id):
     try:
-        model = configure_genai() # Configurar con la key del env cada vez
         data = request.get_json()
-        user_query = data.get('query', '')
-        context_mode = data.get('mode', 'vault') 
-        session_id = data.get('sessionId')
-        
-        service = get_file_service()
-        metadata, vault_items = load_campaign_context(service, campaign_id)
-        
-        if not metadata:
+        prepared = prepare_chat(campaign_id, data)
+        if prepared is None:
             return jsonify({"error": "Campaign not found"}), 404
+        key, system_prompt, message, context_report = prepared
 
-        # Lógica de Framework
-        use_full = metadata.get('use_full_framework', False)
-        framework_full = metadata.get('framework', '')
-        framework_summary = metadata.get('framework_summary', '')
-        framework_context = framework_full if use_full else (framework_summary or framework_full)
-        if not framework_context: framework_context = "Mundo de fantasía genérico."
+        reply, conversation = conversations.get(key).send(get_provider(), system_prompt, message)
+        return jsonify({"response": reply, "context": context_report,
+                        "conversation": {"id": key[3], **conversation}})
 
-        # Memoria Rodante (Contexto Histórico Reciente)
-        rolling_memory = get_rolling_memory(service, campaign_id)
+    except Exception as e:
+        print(f"Error IA: {str(e)}") 
+        return jsonify({"error": str(e)}), 500
 
-        characters = [i['content'] for i in vault_items if i['type'] == 'character']
-        secrets = [i['content'] for i in vault_items if i['type'] == 'secret' and i['status'] == 'reserve']
-        truths = metadata.get('truths', [])
-        fronts = metadata.get('fronts', [])
+@ai_bp.route('/<campaign_id>/chat/stream', methods=['POST'])
+def stream_chat(campaign_id):
+    """Como /chat, pero la respuesta llega por SSE: 'context', trozos de texto y 'done' (o 'error')."""
+    data = request.get_json()
+    try:
+        prepared = prepare_chat(campaign_id, data)
+        if prepared is None:
+            return jsonify({"error": "Campaign not found"}), 404
+        key, system_prompt, message, context_report = prepared
+        provider = get_provider()
+    except Exception as e:
+        print(f"Error IA: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        system_prompt = f"""
-        Eres un Asistente de Dungeon Master experto.
-        
-        CONTEXTO MUNDIAL (Framework):
-        {framework_context}
-        
-        VERDADES DEL MUNDO:
-        {', '.join(filter(None, truths))}
-        
-        FRENTES (Amenazas Activas):
-        {str(fronts)}
-        
-        PERSONAJES (PJs):
-        {str(characters)}
-        
-        MEMORIA RECIENTE (Lo que ha pasado últimamente):
-        {rolling_memory if rolling_memory else "No hay sesiones previas registradas."}
-        """
+    def generate():
+        yield sse(context_report, "context")
+        info = {}
+        try:
+            with closing(conversations.get(key).stream(provider, system_prompt, message, info)) as chunks:
+                for chunk in chunks:
+                    yield sse({"text": chunk})
+            yield sse({"conversation": {"id": key[3], **info}}, "done")
+        except GeneratorExit:
+            # El cliente se ha desconectado: se corta la generación y el turno no se guarda
+            print(f"Chat IA cancelado por el cliente ({campaign_id})")
+            raise
+        except Exception as e:
+            print(f"Error IA: {str(e)}")
+            yield sse({"error": str(e)}, "error")
 
-        if context_mode == 'session' and session_id:
-            session_path = os.path.join(service._get_campaign_path(campaign_id), "sessions")
-            # Buscar archivo de sesión
-            target_file = None
-            for f in os.listdir(session_path):
-                if f.endswith(f"_{session_id}.json"):
-                    target_file = f
-                    break
-            
-            if target_file:
-                session_data = service.load_json(os.path.join(session_path, target_file))
-                linked_ids = session_data.get('linked_items', [])
-                active_items = [i['content'] for i in vault_items if i['id'] in linked_ids]
-                
-                system_prompt += f"""
-                ESTADO: SESIÓN EN CURSO.
-                Elementos en escena: {str(active_items)}
-                Secretos disponibles: {str(secrets)}
-                
-                Instrucciones: Prioriza conectar la situación actual con la 'Memoria Reciente' y los 'Frentes'.
-                """
-        else:
-            item_names = [i['content'].get('name', i['content'].get('title')) for i in vault_items]
-            system_prompt += f"""
-            ESTADO: PREPARACIÓN (VAULT).
-            Items existentes: {str(item_names)}
-            Instrucciones: Crea contenido nuevo que sea coherente con el Framework y la historia reciente.
-            """
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-        chat = model.start_chat(
-            history=[
-                {"role": "user", "parts": [system_prompt]},
-                {"role": "model", "parts": ["Entendido DM. Tengo el contexto completo. ¿Qué hacemos hoy?"]}
-            ]
-        )
-        
-        response = chat.send_message(user_query)
-        return jsonify({"response": response.text})
-        
-    except Exception as e:
-        print(f"Error IA: {str(e)}") 
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+@ai_bp.route('/<campaign_id>/chat', methods=['DELETE'])
+def reset_chat(campaign_id):
+    """Olvida una conversación (o todas las de la campaña si no se indica modo)."""
+    mode = request.args.get('mode')
+    if not mode:
+        return jsonify({"dropped": conversations.drop_campaign(campaign_id)})
+    key = (campaign_id, mode, request.args.get('sessionId') or '', request.args.get('conversationId') or 'default')
+    return jsonify({"dropped": int(conversations.drop(key))})
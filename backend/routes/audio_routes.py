@@ -1,8 +1,12 @@
 import os
 import shutil
+import threading
+import time
 import uuid
 from flask import Blueprint, jsonify, request, current_app
 import data_manager
+from services import catalog_service, event_service, peaks_service, transcode_service, upload_service
+from services.job_service import jobs
 
 audio_bp = Blueprint('audio_bp', __name__)
 
@@ -10,125 +14,303 @@ def get_assets_dir():
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     return os.path.join(base_dir, 'assets')
 
+def get_catalog():
+    store_path = os.path.join(data_manager.DATA_DIR, 'track_catalog.json')
+    catalog = catalog_service.get_catalog(get_assets_dir(), store_path)
+    catalog.on_discovered = analyze_discovered
+    return catalog
+
+def get_renditions_dir():
+    return os.path.join(data_manager.DATA_DIR, 'renditions')
+
+def get_peaks_dir():
+    return os.path.join(data_manager.DATA_DIR, 'peaks')
+
+def enqueue_analysis(rel_paths):
+    """Encola el cálculo de duración/forma de onda de varias pistas en un único trabajo."""
+    assets_dir = get_assets_dir()
+    tracks = [(rel, os.path.join(assets_dir, rel.replace('/', os.sep))) for rel in rel_paths]
+
+    def record(rel_path, fp, info):
+        src_path = os.path.join(assets_dir, rel_path.replace('/', os.sep))
+        if os.path.exists(src_path) and transcode_service.fingerprint(src_path) == fp:
+            data_manager.save_track_metadata(rel_path, {'fingerprint': fp, 'analyzed': fp, **(info or {})})
+
+    return jobs.submit('analyze', peaks_service.analyze_job, tracks, get_peaks_dir(), record,
+                       params={'tracks': len(tracks)})
+
+def analyze_discovered(rel_paths):
+    # Pistas nuevas del catálogo (subida, sondeo o reescaneo) sin análisis previo
+    metadata = data_manager.get_all_metadata()
+    pending = [rel for rel in rel_paths if not metadata.get(rel, {}).get('analyzed')]
+    if pending:
+        enqueue_analysis(pending)
+
+def enqueue_transcode(rel_path):
+    """Encola la generación de versiones ligeras de una pista y devuelve el trabajo."""
+    src_path = os.path.join(get_assets_dir(), rel_path.replace('/', os.sep))
+
+    def record(fp, renditions):
+        # Si la pista se movió o reemplazó mientras tanto, este resultado ya no vale
+        if os.path.exists(src_path) and transcode_service.fingerprint(src_path) == fp:
+            data_manager.save_track_metadata(rel_path, {'fingerprint': fp, 'renditions': renditions})
+
+    return jobs.submit('transcode', transcode_service.transcode_job, src_path, get_renditions_dir(), record,
+                       params={'trackId': rel_path})
+
+# --- Reconciliación de huérfanos (en segundo plano) ---
+PRUNE_INTERVAL = float(os.getenv('PRUNE_INTERVAL', '0'))
+
+def prune_job(job, dry_run=False, full=False):
+    """Reconciliación: con el journal del catálogo solo se revisan las rutas tocadas desde la última pasada."""
+    catalog = get_catalog()
+    job.progress(0.05, "refreshing catalog")
+    catalog.refresh(force=True)
+    state = data_manager.get_prune_state()
+    candidates, epoch, seq = catalog.changes_since(state.get('epoch'), state.get('seq'))
+    if full:
+        candidates = None
+    assets_dir = get_assets_dir()
+
+    def exists(track_id):
+        # El disco manda sobre el catálogo: una subida puede no estar registrada todavía
+        return catalog.has_track(track_id) or os.path.exists(os.path.join(assets_dir, track_id.replace('/', os.sep)))
+
+    job.progress(0.2, "reconciling references")
+    diff = data_manager.reconcile_orphans(exists, candidates, dry_run)
+    diff["mode"] = "full" if candidates is None else "incremental"
+    diff["dryRun"] = dry_run
+
+    job.progress(0.7, "removing orphaned files")
+    orphans = set(diff["metadata"])
+    fingerprints = {m.get('fingerprint') for tid, m in data_manager.get_all_metadata().items() if tid not in orphans}
+    diff["renditions"] = transcode_service.remove_orphans(get_renditions_dir(), fingerprints, dry_run)
+    diff["peaks"] = transcode_service.remove_orphans(get_peaks_dir(), fingerprints, dry_run)
+
+    if not dry_run:
+        data_manager.save_prune_state({"epoch": epoch, "seq": seq, "last_run": time.time()})
+    return diff
+
+def enqueue_prune(dry_run=False, full=False):
+    # Una sola reconciliación a la vez: si hay una en marcha se devuelve esa
+    for job in jobs.list('prune'):
+        if not job.finished and job.params == {"dryRun": dry_run, "full": full}:
+            return job
+    return jobs.submit('prune', prune_job, dry_run=dry_run, full=full, params={"dryRun": dry_run, "full": full})
+
+def start_prune_scheduler(interval=PRUNE_INTERVAL):
+    """Reconciliación incremental periódica (PRUNE_INTERVAL segundos; 0 la desactiva)."""
+    if interval <= 0:
+        return None
+    def loop():
+        while True:
+            time.sleep(interval)
+            enqueue_prune()
+    thread = threading.Thread(target=loop, name="prune-scheduler", daemon=True)
+    thread.start()
+    return thread
+
 @audio_bp.route('/system/prune', methods=['POST'])
 def prune_system():
-    try:
-        data_manager.prune_orphaned_data(get_assets_dir())
-        return jsonify({"status": "success", "message": "System cleaned"})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    data = request.get_json(silent=True) or {}
+    def flag(name):
+        value = data.get(name, request.args.get(name))
+        return str(value).lower() in ('1', 'true', 'yes')
+    job = enqueue_prune(dry_run=flag('dry_run'), full=flag('full'))
+    return jsonify({"job_id": job.id, "status": job.status}), 202
+
+@audio_bp.route('/system/prune/<job_id>', methods=['GET'])
+def get_prune_job(job_id):
+    job = jobs.get(job_id)
+    if not job or job.kind != 'prune': return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
 
 @audio_bp.route('/structure', methods=['GET'])
 def get_structure():
-    assets_dir = get_assets_dir()
-    structure = {}
-    
-    if not os.path.exists(assets_dir):
-        return jsonify(structure)
-
-    for frame in os.listdir(assets_dir):
-        frame_path = os.path.join(assets_dir, frame)
-        if not os.path.isdir(frame_path) or frame == 'mocks': continue
-        
-        structure[frame] = {}
-        for t_type in os.listdir(frame_path):
-            type_path = os.path.join(frame_path, t_type)
-            if not os.path.isdir(type_path): continue
-            
-            structure[frame][t_type] = {}
-            for cat in os.listdir(type_path):
-                cat_path = os.path.join(type_path, cat)
-                if not os.path.isdir(cat_path): continue
-                
-                subcats = [
-                    sub for sub in os.listdir(cat_path) 
-                    if os.path.isdir(os.path.join(cat_path, sub))
-                ]
-                structure[frame][t_type][cat] = subcats
-                
-    return jsonify(structure)
+    # Derivado del catálogo de audio; se recalcula solo cuando cambia su versión
+    etag, body = get_catalog().structure()
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def build_track(desc, track_meta, host_url):
+    """Pista tal y como la ve el cliente (descripción + metadatos + URLs)."""
+    default_icon = 'CloudRain' if desc['type'] == 'ambience' else 'Music'
+    original_url = f"{host_url}assets/{desc['id']}"
+    # Se anuncia la versión comprimida más ligera; el original queda como alternativa.
+    # Las 'compressed' en WAV (alternativa sin ffmpeg de versiones anteriores) perdían
+    # calidad: se sirve el original
+    compressed = transcode_service.lightest(
+        [r for r in track_meta.get('renditions') or [] if r.get('format') != 'wav'], 'compressed')
+    normalized = transcode_service.lightest(track_meta.get('renditions'), 'normalized')
+    track = {
+        **desc,
+        "url": f"{host_url}renditions/{compressed['file']}" if compressed else original_url,
+        "originalUrl": original_url,
+        "icon": track_meta.get('icon', default_icon)
+    }
+    if normalized:
+        track["normalizedUrl"] = f"{host_url}renditions/{normalized['file']}"
+    if 'duration' in track_meta:
+        track.update(duration=track_meta['duration'], sampleRate=track_meta.get('sampleRate'),
+                     channels=track_meta.get('channels'), hasPeaks=bool(track_meta.get('peaks')))
+    return track
+
+def track_for_event(rel_path):
+    return build_track(catalog_service.describe_track(rel_path), data_manager.get_track_metadata(rel_path),
+                       request.host_url)
 
 @audio_bp.route('/tracks', methods=['GET'])
 def get_tracks():
-    tracks = []
-    assets_dir = get_assets_dir()
-    metadata = data_manager.get_all_metadata()
-    
-    if not os.path.exists(assets_dir):
-        os.makedirs(assets_dir)
-
-    for root, dirs, files in os.walk(assets_dir):
-        for file in files:
-            if file.lower().endswith(('.mp3', '.wav', '.ogg')):
-                full_path = os.path.join(root, file)
-                rel_path = os.path.relpath(full_path, assets_dir).replace('\\', '/')
-                parts = rel_path.split('/')
-                
-                frame = "Global"
-                t_type = "sfx"
-                category = "General"
-                subcategory = ""
-                
-                if len(parts) > 0:
-                    frame = parts[0] if parts[0] != 'mocks' else 'Global'
-                if len(parts) > 1: t_type = parts[1]
-                if len(parts) > 2: category = parts[2]
-                if len(parts) > 3 and parts[3] != file: subcategory = parts[3]
-
-                if t_type not in ['music', 'ambience', 'sfx']: t_type = 'sfx'
-
-                track_meta = metadata.get(rel_path, {})
-                default_icon = 'CloudRain' if t_type == 'ambience' else 'Music'
-                icon = track_meta.get('icon', default_icon)
-                
-                tracks.append({
-                    "id": rel_path,
-                    "name": os.path.splitext(file)[0].replace('_', ' ').replace('-', ' ').title(),
-                    "url": f"{request.host_url}assets/{rel_path}",
-                    "filename": rel_path,
-                    "type": t_type,
-                    "frame": frame if frame != "Global" else None,
-                    "category": category,
-                    "subcategory": subcategory,
-                    "icon": icon
-                })
-    return jsonify(tracks)
+    host_url = request.host_url
+
+    def build_tracks(descriptions):
+        metadata = data_manager.get_all_metadata()
+        return [build_track(desc, metadata.get(desc['id'], {}), host_url) for desc in descriptions]
+
+    # Catálogo en memoria: la respuesta se serializa una vez por versión
+    etag, body = get_catalog().tracks_response(host_url, data_manager.metadata_signature(), build_tracks)
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@audio_bp.route('/tracks/<path:track_id>/peaks', methods=['GET'])
+def get_track_peaks(track_id):
+    meta = data_manager.get_track_metadata(track_id)
+    if not os.path.exists(os.path.join(get_assets_dir(), track_id.replace('/', os.sep))):
+        return jsonify({"error": "Track not found"}), 404
+    if not meta or not meta.get('analyzed'):
+        job = enqueue_analysis([track_id])
+        return jsonify({"status": "pending", "job": job.id}), 202
+    if not meta.get('peaks'):
+        return jsonify({"error": "Peaks not available for this format"}), 404
+    try:
+        with open(os.path.join(get_peaks_dir(), meta['peaks']), 'rb') as f:
+            payload = f.read()
+    except FileNotFoundError:
+        return jsonify({"error": "Peaks not found"}), 404
+
+    # ?format=binary devuelve el sidecar tal cual (cabecera + un byte por tramo)
+    if request.args.get('format') == 'binary':
+        response = current_app.response_class(payload, mimetype='application/octet-stream')
+    else:
+        response = jsonify({"trackId": track_id, **peaks_service.decode(payload)})
+    response.set_etag(meta['analyzed'])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
-@audio_bp.route('/tracks', methods=['POST'])
-def upload_track():
-    if 'file' not in request.files: return jsonify({'error': 'No file'}), 400
-    file = request.files['file']
-    
+def upload_destination(fields, original_filename):
+    """Ruta absoluta de destino de una subida según sus campos (frame/type/category/...)."""
     def safe_name(txt): return os.path.basename(txt).strip() if txt else ""
 
-    custom_name = safe_name(request.form.get('name', 'track'))
-    t_type = safe_name(request.form.get('type', 'sfx'))
-    icon = request.form.get('icon', 'CloudRain')
-    
-    frame = request.form.get('frame', 'Global')
+    custom_name = safe_name(fields.get('name', 'track'))
+    t_type = safe_name(fields.get('type', 'sfx'))
+
+    frame = fields.get('frame', 'Global')
     if t_type == 'music':
         if frame == 'Global': frame = 'Fantasy' 
     else:
-        if request.form.get('is_global') == 'true': frame = 'Global'
+        if str(fields.get('is_global')).lower() == 'true': frame = 'Global'
     
     frame = safe_name(frame)
-    category = safe_name(request.form.get('category', 'General'))
-    subcategory = safe_name(request.form.get('subcategory', ''))
+    category = safe_name(fields.get('category', 'General'))
+    subcategory = safe_name(fields.get('subcategory', ''))
 
     if t_type == 'music' and not subcategory:
         subcategory = 'General'
 
-    assets_dir = get_assets_dir()
-    save_path = os.path.join(assets_dir, frame, t_type, category, subcategory)
-    os.makedirs(save_path, exist_ok=True)
-    
-    filename = f"{custom_name}{os.path.splitext(file.filename)[1]}"
-    file.save(os.path.join(save_path, filename))
-    
-    rel_path = os.path.relpath(os.path.join(save_path, filename), assets_dir).replace('\\', '/')
-    data_manager.save_track_metadata(rel_path, {'icon': icon})
-    
-    return jsonify({"status": "success"}), 201
+    save_path = os.path.join(get_assets_dir(), frame, t_type, category, subcategory)
+    filename = f"{custom_name}{os.path.splitext(original_filename)[1]}"
+    return os.path.join(save_path, filename)
+
+def register_uploaded_track(dest_path, icon):
+    """Metadatos, catálogo y transcodificación de una pista recién subida."""
+    rel_path = os.path.relpath(dest_path, get_assets_dir()).replace('\\', '/')
+    # Si se sobrescribe una pista, sus versiones anteriores ya no corresponden
+    data_manager.save_track_metadata(rel_path, {'icon': icon, 'fingerprint': None, 'renditions': [], 'analyzed': None})
+    # El catálogo detecta la pista nueva y encola su análisis (duración y forma de onda)
+    get_catalog().add_file(rel_path)
+    event_service.publish_audio("track-added", {"track": track_for_event(rel_path)})
+
+    response = {"status": "success", "id": rel_path}
+    if transcode_service.TRANSCODE_ON_UPLOAD:
+        response["job"] = enqueue_transcode(rel_path).id
+    return response
+
+@audio_bp.route('/tracks', methods=['POST'])
+def upload_track():
+    if 'file' not in request.files: return jsonify({'error': 'No file'}), 400
+    file = request.files['file']
+
+    dest_path = upload_destination(request.form, file.filename)
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    file.save(dest_path)
+    return jsonify(register_uploaded_track(dest_path, request.form.get('icon', 'CloudRain'))), 201
+
+# --- Subidas por trozos (reanudables) ---
+def get_upload_store():
+    return upload_service.UploadStore(os.path.join(data_manager.DATA_DIR, 'uploads'))
+
+def upload_error(e):
+    return jsonify(e.to_dict()), e.status
+
+@audio_bp.route('/uploads', methods=['POST'])
+def init_upload():
+    data = request.json or {}
+    filename = data.get('filename', '')
+    if not catalog_service.is_audio(filename): return jsonify({'error': 'Unsupported file type'}), 400
+    try:
+        size = int(data.get('size', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid size'}), 400
+    try:
+        state = get_upload_store().create(upload_destination(data, filename), size,
+                                          {"icon": data.get('icon', 'CloudRain')})
+    except upload_service.UploadError as e:
+        return upload_error(e)
+    return jsonify({"id": state["id"], "offset": 0, "size": size,
+                    "chunkSize": upload_service.UPLOAD_CHUNK_BYTES}), 201
+
+@audio_bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    state = get_upload_store().get(upload_id)
+    if not state: return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({"id": state["id"], "offset": state["offset"], "size": state["size"]})
+
+@audio_bp.route('/uploads/<upload_id>', methods=['PUT'])
+def append_upload(upload_id):
+    try:
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid offset'}), 400
+    try:
+        # request.stream se lee por bloques: el trozo nunca se carga entero en memoria
+        state = get_upload_store().append(upload_id, offset, request.stream, request.content_length,
+                                          request.headers.get('X-Chunk-SHA256'))
+    except upload_service.UploadError as e:
+        return upload_error(e)
+    return jsonify({"id": upload_id, "offset": state["offset"], "size": state["size"]})
+
+@audio_bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    data = request.get_json(silent=True) or {}
+    try:
+        state = get_upload_store().finalize(upload_id, data.get('sha256'))
+    except upload_service.UploadError as e:
+        return upload_error(e)
+    response = register_uploaded_track(state["dest_path"], state.get("icon", 'CloudRain'))
+    response["sha256"] = state["sha256"]
+    return jsonify(response), 201
+
+@audio_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    try:
+        get_upload_store().abort(upload_id)
+    except upload_service.UploadError as e:
+        return upload_error(e)
+    return jsonify({"status": "deleted"})
 
 @audio_bp.route('/tracks', methods=['DELETE'])
 def delete_track():
@@ -140,6 +322,8 @@ def delete_track():
     
     if os.path.exists(full_path):
         os.remove(full_path)
+        get_catalog().remove_file(track_id)
+        event_service.publish_audio("track-deleted", {"id": track_id})
         return jsonify({"status": "deleted"})
     return jsonify({"error": "File not found"}), 404
 
@@ -170,6 +354,8 @@ def move_track():
         shutil.move(src_path, dest_path)
         new_rel_path = os.path.relpath(dest_path, assets_dir).replace('\\', '/')
         data_manager.update_metadata_id(track_id, new_rel_path)
+        get_catalog().move_file(track_id, new_rel_path)
+        event_service.publish_audio("track-moved", {"from": track_id, "track": track_for_event(new_rel_path)})
         return jsonify({'status': 'moved'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -194,6 +380,8 @@ def rename_track():
         os.rename(src_path, dest_path)
         new_rel_path = os.path.relpath(dest_path, assets_dir).replace('\\', '/')
         data_manager.update_metadata_id(track_id, new_rel_path)
+        get_catalog().move_file(track_id, new_rel_path)
+        event_service.publish_audio("track-moved", {"from": track_id, "track": track_for_event(new_rel_path)})
         return jsonify({'status': 'renamed'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -241,12 +429,10 @@ def rename_category():
             old_rel_prefix = f"{rel_base}/{old_name}/".replace('\\', '/')
             new_rel_prefix = f"{rel_base}/{new_name}/".replace('\\', '/')
             
-            meta = data_manager.get_all_metadata()
-            keys_to_update = [k for k in meta.keys() if k.startswith(old_rel_prefix)]
-            
-            for old_key in keys_to_update:
-                new_key = old_key.replace(old_rel_prefix, new_rel_prefix, 1)
-                data_manager.update_metadata_id(old_key, new_key)
+            data_manager.rename_metadata_prefix(old_rel_prefix, new_rel_prefix)
+            get_catalog().rename_dir(old_rel_prefix.rstrip('/'), new_rel_prefix.rstrip('/'))
+            event_service.publish_audio("category-renamed", {"from": old_rel_prefix.rstrip('/'),
+                                                             "to": new_rel_prefix.rstrip('/')})
 
             return jsonify({'status': 'renamed'})
         except Exception as e:
@@ -271,6 +457,9 @@ def delete_category():
     if os.path.exists(path):
         try:
             shutil.rmtree(path)
+            rel_dir = os.path.relpath(path, assets_dir).replace('\\', '/')
+            get_catalog().remove_dir(rel_dir)
+            event_service.publish_audio("category-deleted", {"path": rel_dir})
             return jsonify({'status': 'deleted'})
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -294,6 +483,9 @@ def create_category():
     os.makedirs(path, exist_ok=True)
     if t_type == 'music' and not parent:
         os.makedirs(os.path.join(path, "General"), exist_ok=True)
+    rel_dir = os.path.relpath(path, assets_dir).replace('\\', '/')
+    get_catalog().add_dir(rel_dir)
+    event_service.publish_audio("category-created", {"path": rel_dir})
 
     return jsonify({'status': 'created'})
 
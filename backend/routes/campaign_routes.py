@@ -1,6 +1,10 @@
 from flask import Blueprint, request, jsonify, current_app
 from services.file_service import FileService
 from services.id_service import generate_id
+from services.cache_service import clone_json
+from services.lock_service import precondition_failed, with_etag
+from services import change_service, session_log_service, summary_service
+from routes.vault_routes import with_defaults
 import os
 from datetime import datetime
 
@@ -16,6 +20,12 @@ def list_campaigns():
     campaigns = service.list_campaigns()
     return jsonify(campaigns)
 
+@campaign_bp.route('/summaries', methods=['GET'])
+def list_campaign_summaries():
+    """Listado ligero: resumen mantenido de cada campaña, sin el 'framework'."""
+    service = get_file_service()
+    return jsonify(summary_service.list_summaries(service))
+
 @campaign_bp.route('/', methods=['POST'])
 def create_campaign():
     data = request.get_json()
@@ -57,9 +67,7 @@ def create_campaign():
         "linked_items": [],
         "status": "planned"
     }
-    sessions_path = os.path.join(base_path, "sessions")
-    session_filename = f"session_01_{session_id}.json"
-    service.save_json(os.path.join(sessions_path, session_filename), session_01)
+    service.save_session(campaign_id, session_01)
     
     # 3. Asignar Sesión Activa
     metadata['active_session'] = session_id
@@ -71,12 +79,45 @@ def create_campaign():
 def get_campaign(campaign_id):
     service = get_file_service()
     path = service._get_campaign_path(campaign_id)
-    metadata = service.load_json(os.path.join(path, "metadata.json"))
+    metadata_path = os.path.join(path, "metadata.json")
+    metadata = service.peek_json(metadata_path)
     
     if not metadata:
         return jsonify({"error": "Campaign not found"}), 404
         
-    return jsonify(metadata)
+    return with_etag(request, jsonify(metadata), service.etag(metadata_path))
+
+@campaign_bp.route('/<campaign_id>/summary', methods=['GET'])
+def get_campaign_summary(campaign_id):
+    service = get_file_service()
+    summary = summary_service.get_summary(service, campaign_id)
+    if not summary:
+        return jsonify({"error": "Campaign not found"}), 404
+    return jsonify(summary)
+
+@campaign_bp.route('/<campaign_id>/changes', methods=['GET'])
+def list_changes(campaign_id):
+    """Cambios del vault y las sesiones posteriores a 'since' (0 = todo).
+
+    Parámetros: since, log (el de la última respuesta) y kind=vault|session (repetible).
+    Cada cambio lleva su versión y el documento, o deleted: true. Con reset: true el
+    cliente debe sustituir lo que tenga por la respuesta.
+    """
+    service = get_file_service()
+    if not os.path.exists(os.path.join(service._get_campaign_path(campaign_id), "metadata.json")):
+        return jsonify({"error": "Campaign not found"}), 404
+    try:
+        since = max(0, int(request.args.get('since', 0)))
+    except ValueError:
+        return jsonify({"error": "Invalid since"}), 400
+    # Cambios diferenciales pendientes de compactar: al compactar reciben versión
+    session_log_service.flush_campaign(service, campaign_id)
+    result = change_service.changes(service, campaign_id, since, request.args.get('log'),
+                                    request.args.getlist('kind') or None)
+    for change in result["changes"]:
+        if "item" in change:
+            change["item"] = with_defaults(change["item"])
+    return jsonify(result)
 
 @campaign_bp.route('/<campaign_id>', methods=['PUT'])
 def update_campaign(campaign_id):
@@ -85,22 +126,28 @@ def update_campaign(campaign_id):
     path = service._get_campaign_path(campaign_id)
     metadata_path = os.path.join(path, "metadata.json")
     
-    current_metadata = service.load_json(metadata_path)
-    if not current_metadata:
-        return jsonify({"error": "Campaign not found"}), 404
+    with service.lock(metadata_path):
+        current_metadata = service.load_json(metadata_path)
+        if not current_metadata:
+            return jsonify({"error": "Campaign not found"}), 404
+        failed = precondition_failed(request, service.etag(metadata_path))
+        if failed:
+            return failed
+        original = clone_json(current_metadata)
         
-    # Lista ampliada de campos permitidos
-    fields = [
-        'title', 'elevator_pitch', 'moods', 'truths', 'fronts', 'safety_tools', 
-        'active_session', 'framework', 'framework_summary', 'use_full_framework'
-    ]
+        # Lista ampliada de campos permitidos
+        fields = [
+            'title', 'elevator_pitch', 'moods', 'truths', 'fronts', 'safety_tools', 
+            'active_session', 'framework', 'framework_summary', 'use_full_framework'
+        ]
     
-    for field in fields:
-        if field in data:
-            current_metadata[field] = data[field]
+        for field in fields:
+            if field in data:
+                current_metadata[field] = data[field]
             
-    service.save_json(metadata_path, current_metadata)
-    return jsonify(current_metadata)
+        if current_metadata != original:
+            service.save_json(metadata_path, current_metadata)
+    return with_etag(request, jsonify(current_metadata), service.etag(metadata_path))
 
 @campaign_bp.route('/<campaign_id>', methods=['DELETE'])
 def delete_campaign(campaign_id):
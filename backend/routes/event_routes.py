@@ -0,0 +1,31 @@
+from flask import Blueprint, Response, request, jsonify, current_app
+from services.file_service import FileService
+from services import event_service
+import os
+
+event_bp = Blueprint('events', __name__)
+
+def get_file_service():
+    storage_path = current_app.config['DATA_STORAGE_PATH']
+    return FileService(storage_path)
+
+def event_stream(topic):
+    # EventSource reenvía Last-Event-ID al reconectar; ?lastEventId= para reconexiones manuales
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    channel = event_service.get_channel(topic)
+    return Response(event_service.stream(channel, last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@event_bp.route('/campaigns/<campaign_id>/events', methods=['GET'])
+def campaign_events(campaign_id):
+    """Cambios de la campaña: item-changed/-deleted, session-changed/-patched/-deleted,
+    campaign-changed (id y claves cambiadas de metadata.json) y campaign-deleted."""
+    service = get_file_service()
+    if not os.path.exists(os.path.join(service._get_campaign_path(campaign_id), "metadata.json")):
+        return jsonify({"error": "Campaign not found"}), 404
+    return event_stream(event_service.campaign_topic(campaign_id))
+
+@event_bp.route('/audio/events', methods=['GET'])
+def audio_events():
+    """Cambios de la biblioteca de audio: pistas, categorías, metadatos, presets, órdenes y ajustes."""
+    return event_stream(event_service.AUDIO_TOPIC)
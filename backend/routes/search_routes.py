@@ -0,0 +1,92 @@
+from flask import Blueprint, request, jsonify, current_app
+from services.file_service import FileService
+from services import summary_service, text_index_service, vector_service
+import os
+import time
+
+search_bp = Blueprint('search', __name__)
+
+MAX_SEARCH_RESULTS = 50
+DEFAULT_TEXT_LIMIT = 20
+
+def get_file_service():
+    storage_path = current_app.config['DATA_STORAGE_PATH']
+    return FileService(storage_path)
+
+def search_result(score, doc):
+    return {"id": doc["id"], "kind": doc["kind"], "type": doc["type"], "status": doc["status"],
+            "title": doc["title"], "score": round(score, 4)}
+
+def text_result(score, doc):
+    return {**search_result(score, doc), "tags": doc["tags"]}
+
+def parse_int(name, default, minimum, maximum):
+    return max(minimum, min(int(request.args.get(name, default)), maximum))
+
+def text_search_args():
+    args = request.args
+    return {"kinds": args.getlist('kind') or None, "item_type": args.get('type'), "status": args.get('status'),
+            "tags": args.getlist('tag'), "limit": parse_int('limit', DEFAULT_TEXT_LIMIT, 1, MAX_SEARCH_RESULTS),
+            "offset": parse_int('offset', 0, 0, 1_000_000)}
+
+@search_bp.route('/<campaign_id>/search', methods=['GET'])
+def search_campaign(campaign_id):
+    """Búsqueda en el vault y las sesiones de una campaña.
+
+    mode=semantic (por defecto): q, k (resultados, por defecto 10) y kind=vault|session.
+    mode=text: texto completo con prefijos (drag*) y frases ("la torre negra"); filtros
+    kind, type, status y tag (repetible, deben estar todos), limit/offset, y facetas
+    de etiquetas y tipos en la respuesta.
+    """
+    service = get_file_service()
+    campaign_path = service._get_campaign_path(campaign_id)
+    if not os.path.exists(os.path.join(campaign_path, "metadata.json")):
+        return jsonify({"error": "Campaign not found"}), 404
+    query = request.args.get('q', '')
+
+    if request.args.get('mode', 'semantic') == 'text':
+        try:
+            options = text_search_args()
+        except ValueError:
+            return jsonify({"error": "Invalid limit or offset"}), 400
+        started = time.perf_counter()
+        found = text_index_service.get_index(campaign_path, service).search(query, **options)
+        return jsonify({"query": query, "mode": "text", "total": found["total"], "facets": found["facets"],
+                        "results": [text_result(score, doc) for score, doc in found["results"]],
+                        "took_ms": round((time.perf_counter() - started) * 1000, 2)})
+
+    try:
+        k = max(1, min(int(request.args.get('k', vector_service.SEARCH_TOP_K)), MAX_SEARCH_RESULTS))
+    except ValueError:
+        return jsonify({"error": "Invalid k"}), 400
+    kinds = request.args.getlist('kind') or None
+
+    results = vector_service.search(service, campaign_id, query, k, kinds)
+    return jsonify({"query": query, "results": [search_result(score, doc) for score, doc in results]})
+
+@search_bp.route('/search', methods=['GET'])
+def search_all_campaigns():
+    """Texto completo en todas las campañas (mismos parámetros que mode=text)."""
+    service = get_file_service()
+    query = request.args.get('q', '')
+    try:
+        options = text_search_args()
+    except ValueError:
+        return jsonify({"error": "Invalid limit or offset"}), 400
+    limit, offset = options.pop('limit'), options.pop('offset')
+
+    started = time.perf_counter()
+    total, merged, facets = 0, [], {"tags": {}, "types": {}}
+    for campaign in summary_service.list_summaries(service):
+        campaign_path = service._get_campaign_path(campaign['id'])
+        found = text_index_service.get_index(campaign_path, service).search(query, limit=offset + limit, **options)
+        total += found["total"]
+        for facet, counts in found["facets"].items():
+            for value, count in counts.items():
+                facets[facet][value] = facets[facet].get(value, 0) + count
+        merged.extend((score, doc, campaign) for score, doc in found["results"])
+    merged.sort(key=lambda r: r[0], reverse=True)
+    results = [{**text_result(score, doc), "campaignId": campaign['id'], "campaignTitle": campaign.get('title')}
+               for score, doc, campaign in merged[offset:offset + limit]]
+    return jsonify({"query": query, "mode": "text", "total": total, "facets": facets, "results": results,
+                    "took_ms": round((time.perf_counter() - started) * 1000, 2)})
@@ -1,6 +1,10 @@
 from flask import Blueprint, request, jsonify, current_app
 from services.file_service import FileService
 from services.id_service import generate_id
+from services.cache_service import clone_json
+from services.lock_service import precondition_failed, with_etag
+from services import session_log_service
+from services.session_log_service import PatchError
 import os
 from datetime import datetime
 
@@ -15,12 +19,14 @@ def list_sessions(campaign_id):
     service = get_file_service()
     campaign_path = service._get_campaign_path(campaign_id)
     sessions_path = os.path.join(campaign_path, "sessions")
-    
+    # Cambios diferenciales pendientes de compactar
+    session_log_service.flush_campaign(service, campaign_id)
+
     sessions = []
     if os.path.exists(sessions_path):
         for filename in os.listdir(sessions_path):
             if filename.endswith(".json"):
-                session = service.load_json(os.path.join(sessions_path, filename))
+                session = service.peek_json(os.path.join(sessions_path, filename))
                 if session:
                     sessions.append(session)
     
@@ -28,35 +34,21 @@ def list_sessions(campaign_id):
     sessions.sort(key=lambda x: x.get('number', 0))
     return jsonify(sessions)
 
-@session_bp.route('/<campaign_id>/sessions', methods=['POST'])
-def create_session(campaign_id):
-    service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    sessions_path = os.path.join(campaign_path, "sessions")
-    
-    # Data opcional
-    req_data = request.get_json() or {}
-    
-    # Calculate next number
-    existing_sessions = []
-    if os.path.exists(sessions_path):
-        for filename in os.listdir(sessions_path):
-            if filename.endswith(".json"):
-                s = service.load_json(os.path.join(sessions_path, filename))
-                if s: existing_sessions.append(s)
-    
-    next_number = 1
-    if existing_sessions:
-        next_number = max([s.get('number', 0) for s in existing_sessions]) + 1
+# Tipos que vuelven a la reserva tras usarse (el resto se archiva)
+REUSABLE_TYPES = ["npc", "location", "item", "monster"]
+
+def build_session(service, campaign_id, recap=""):
+    # Calculate next number (desde el índice, sin leer cada sesión)
+    next_number = service.next_session_number(campaign_id)
         
     session_id = generate_id()
-    session = {
+    return {
         "id": session_id,
         "number": next_number,
         "title": "", 
         "date": datetime.now().isoformat(),
         "strong_start": "",
-        "recap": req_data.get('recap', ""),
+        "recap": recap,
         "summary": "", 
         "notes": "",
         "linked_items": [],
@@ -64,104 +56,182 @@ def create_session(campaign_id):
         "fronts_snapshot": [],
         "used_items": [] # CAMPO NUEVO
     }
+
+def snapshot_fronts(service, campaign_path, session):
+    # Lógica de Snapshot: al completar una sesión, guardar estado de frentes
+    try:
+        metadata_path = os.path.join(campaign_path, "metadata.json")
+        metadata = service.peek_json(metadata_path)
+        if metadata and 'fronts' in metadata:
+            session['fronts_snapshot'] = metadata['fronts']
+    except Exception as e:
+        print(f"Error saving fronts snapshot: {e}")
+
+@session_bp.route('/<campaign_id>/sessions', methods=['POST'])
+def create_session(campaign_id):
+    service = get_file_service()
     
-    file_path = os.path.join(sessions_path, f"session_{next_number:02d}_{session_id}.json")
-    service.save_json(file_path, session)
+    # Data opcional
+    req_data = request.get_json() or {}
+    
+    # El número siguiente se calcula y reserva bajo el mismo bloqueo
+    with service.lock(service._get_sessions_path(campaign_id)):
+        session = build_session(service, campaign_id, recap=req_data.get('recap', ""))
+        service.save_session(campaign_id, session)
     
     return jsonify(session), 201
 
 @session_bp.route('/<campaign_id>/sessions/<session_id>', methods=['GET'])
 def get_session(campaign_id, session_id):
     service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    sessions_path = os.path.join(campaign_path, "sessions")
-    
-    target_file = None
-    for filename in os.listdir(sessions_path):
-        if filename.endswith(f"_{session_id}.json"):
-            target_file = filename
-            break
-            
-    if not target_file:
+    file_path = service.find_session(campaign_id, session_id)
+    if not file_path:
         return jsonify({"error": "Session not found"}), 404
-        
-    session = service.load_json(os.path.join(sessions_path, target_file))
-    return jsonify(session)
+
+    session_log_service.flush(service, campaign_id, session_id)
+    session = service.peek_json(file_path)
+    return with_etag(request, jsonify(session), service.etag(file_path))
 
 @session_bp.route('/<campaign_id>/sessions/<session_id>', methods=['PUT'])
 def update_session(campaign_id, session_id):
     data = request.get_json()
     service = get_file_service()
     campaign_path = service._get_campaign_path(campaign_id)
-    sessions_path = os.path.join(campaign_path, "sessions")
-    
-    target_file = None
-    for filename in os.listdir(sessions_path):
-        if filename.endswith(f"_{session_id}.json"):
-            target_file = filename
-            break
-            
-    if not target_file:
+    file_path = service.find_session(campaign_id, session_id)
+    if not file_path:
         return jsonify({"error": "Session not found"}), 404
         
-    file_path = os.path.join(sessions_path, target_file)
-    current_session = service.load_json(file_path)
+    with service.lock(file_path):
+        session_log_service.flush(service, campaign_id, session_id)
+        failed = precondition_failed(request, service.etag(file_path))
+        if failed:
+            return failed
+        current_session = service.load_json(file_path)
+        original = clone_json(current_session)
     
-    # Lógica de Snapshot: Si se marca como completada, guardar estado de frentes
-    if data.get('status') == 'completed' and current_session.get('status') != 'completed':
-        try:
-            metadata_path = os.path.join(campaign_path, "metadata.json")
-            metadata = service.load_json(metadata_path)
-            if metadata and 'fronts' in metadata:
-                current_session['fronts_snapshot'] = metadata['fronts']
-        except Exception as e:
-            print(f"Error saving fronts snapshot: {e}")
-
-    # Update fields (INCLUIDO 'used_items')
-    fields = ['title', 'strong_start', 'recap', 'summary', 'notes', 'linked_items', 'status', 'used_items']
-    for field in fields:
-        if field in data:
-            current_session[field] = data[field]
+        # Lógica de Snapshot: Si se marca como completada, guardar estado de frentes
+        if data.get('status') == 'completed' and current_session.get('status') != 'completed':
+            snapshot_fronts(service, campaign_path, current_session)
+
+        # Update fields (INCLUIDO 'used_items')
+        fields = ['title', 'strong_start', 'recap', 'summary', 'notes', 'linked_items', 'status', 'used_items']
+        for field in fields:
+            if field in data:
+                current_session[field] = data[field]
             
-    service.save_json(file_path, current_session)
-    return jsonify(current_session)
+        # Autoguardados sin cambios reales no tocan disco
+        if current_session != original:
+            # Nueva revisión: los PATCH basados en la anterior reciben 409
+            current_session['rev'] = current_session.get('rev', 0) + 1
+            file_path = service.save_session(campaign_id, current_session)
+    return with_etag(request, jsonify(current_session), service.etag(file_path))
+
+@session_bp.route('/<campaign_id>/sessions/<session_id>', methods=['PATCH'])
+def patch_session(campaign_id, session_id):
+    """Autoguardado diferencial: {"ops": [...], "rev": revisión en la que se basan (opcional)}.
+
+    Las operaciones son JSON-Patch (add/replace/remove/test) o 'splice' de texto
+    ({"op": "splice", "path": "/notes/general", "at": 10, "delete": 2, "insert": "..."}).
+    Se aplican todas o ninguna. Responde solo con la nueva revisión.
+    """
+    data = request.get_json() or {}
+    service = get_file_service()
+    try:
+        _, rev = session_log_service.patch(service, campaign_id, session_id, data.get('ops'), data.get('rev'))
+    except PatchError as e:
+        return jsonify(e.to_dict()), e.status
+    return jsonify({"id": session_id, "rev": rev})
+
+@session_bp.route('/<campaign_id>/sessions/<session_id>/close', methods=['POST'])
+def close_session(campaign_id, session_id):
+    """Conclusión de sesión (Lazy Cleanup) en una sola petición.
+
+    Body opcional: used_items (por defecto los de la sesión), summary,
+    reusable_types, create_next (True) y los campos editables de la sesión. Los items usados pasan a 'archived'
+    (o vuelven a 'reserve' si son reutilizables) sumando un uso; los no usados
+    vuelven a 'reserve'. Crea la siguiente sesión y la marca como activa.
+    """
+    data = request.get_json() or {}
+    service = get_file_service()
+    file_path = service.find_session(campaign_id, session_id)
+    if not file_path:
+        return jsonify({"error": "Session not found"}), 404
+
+    with service.lock(file_path):
+        session_log_service.flush(service, campaign_id, session_id)
+        failed = precondition_failed(request, service.etag(file_path))
+        if failed:
+            return failed
+        session, next_session, results = close_session_locked(service, campaign_id, file_path, data)
+
+    return jsonify({
+        "session": session,
+        "next_session": next_session,
+        "items": [{"id": item_id, "status": item['status'] if item else None} for item_id, item in results]
+    })
+
+def close_session_locked(service, campaign_id, file_path, data):
+    campaign_path = service._get_campaign_path(campaign_id)
+    session = service.load_json(file_path)
+    # Cambios pendientes del editor que llegan junto al cierre
+    for field in ['title', 'strong_start', 'recap', 'notes']:
+        if field in data:
+            session[field] = data[field]
+    linked_ids = session.get('linked_items', [])
+    used = set(data.get('used_items', session.get('used_items', [])))
+    reusable_types = data.get('reusable_types', REUSABLE_TYPES)
+
+    def close_item(item, change):
+        if change['used']:
+            item['status'] = 'reserve' if item.get('type') in reusable_types else 'archived'
+            item['usage_count'] = item.get('usage_count', 0) + 1
+        else:
+            item['status'] = 'reserve'
+
+    updates = [{"id": item_id, "used": item_id in used} for item_id in linked_ids]
+    results = service.update_vault_items(campaign_id, updates, close_item)
+
+    if session.get('status') != 'completed':
+        snapshot_fronts(service, campaign_path, session)
+    session['status'] = 'completed'
+    session['date'] = datetime.now().isoformat()
+    session['linked_items'] = [item_id for item_id, item in results if item is not None and item_id in used]
+    if 'summary' in data:
+        session['summary'] = data['summary']
+    session['rev'] = session.get('rev', 0) + 1
+    service.save_session(campaign_id, session)
+
+    next_session = None
+    if data.get('create_next', True):
+        with service.lock(service._get_sessions_path(campaign_id)):
+            next_session = build_session(service, campaign_id, recap=session.get('summary', ""))
+            service.save_session(campaign_id, next_session)
+        metadata_path = os.path.join(campaign_path, "metadata.json")
+        with service.lock(metadata_path):
+            metadata = service.load_json(metadata_path)
+            if metadata:
+                metadata['active_session'] = next_session['id']
+                service.save_json(metadata_path, metadata)
+
+    return session, next_session, results
 
 @session_bp.route('/<campaign_id>/sessions/<session_id>', methods=['DELETE'])
 def delete_session(campaign_id, session_id):
     service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    sessions_path = os.path.join(campaign_path, "sessions")
-    vault_path = os.path.join(campaign_path, "vault")
-    
-    target_file = None
-    for filename in os.listdir(sessions_path):
-        if filename.endswith(f"_{session_id}.json"):
-            target_file = filename
-            break
-            
-    if not target_file:
+    session_path = service.find_session(campaign_id, session_id)
+    if not session_path:
         return jsonify({"error": "Session not found"}), 404
 
-    session_path = os.path.join(sessions_path, target_file)
-    session_data = service.load_json(session_path)
+    with service.lock(session_path):
+        session_log_service.flush(service, campaign_id, session_id)
+        session_data = service.load_json(session_path)
     
-    # Restaurar items al Vault si la sesión se borra
-    if session_data and 'linked_items' in session_data:
-        for item_id in session_data['linked_items']:
-            item_file_name = None
-            if os.path.exists(vault_path):
-                for v_file in os.listdir(vault_path):
-                    if v_file.endswith(f"_{item_id}.json"):
-                        item_file_name = v_file
-                        break
-            
-            if item_file_name:
-                item_path = os.path.join(vault_path, item_file_name)
-                item_data = service.load_json(item_path)
-                if item_data:
-                    item_data['status'] = 'reserve'
-                    service.save_json(item_path, item_data)
-
-    os.remove(session_path)
+        # Restaurar items al Vault si la sesión se borra
+        if session_data and 'linked_items' in session_data:
+            updates = [{"id": item_id, "status": "reserve"} for item_id in session_data['linked_items']]
+            service.update_vault_items(campaign_id, updates, lambda item, change: item.update(status=change['status']))
+
+        service.delete_session(campaign_id, session_id)
+        session_log_service.discard(service, campaign_id, session_id)
     
     return jsonify({"message": "Session deleted and items returned to vault"}), 200
\ No newline at end of file
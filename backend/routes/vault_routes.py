@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify, current_app
 from services.file_service import FileService
 from services.id_service import generate_id
-import os
+from services import query_service
+from services.cache_service import clone_json
+from services.lock_service import precondition_failed, with_etag
 
 vault_bp = Blueprint('vault', __name__)
 
@@ -9,24 +11,40 @@ def get_file_service():
     storage_path = current_app.config['DATA_STORAGE_PATH']
     return FileService(storage_path)
 
+def with_defaults(item):
+    # Asegurar que usage_count existe para items antiguos (sin mutar la caché)
+    if 'usage_count' not in item:
+        item = {**item, 'usage_count': 0}
+    return item
+
 @vault_bp.route('/<campaign_id>/vault', methods=['GET'])
 def list_vault_items(campaign_id):
+    """Listado del vault.
+
+    Filtros opcionales: type, status, tag (repetible, deben estar todos) y
+    fields=id,type,status,name,content.description para proyectar. Con limit y/o
+    cursor responde paginado: {"items": [...], "next_cursor": id | null}.
+    """
     service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    vault_path = os.path.join(campaign_path, "vault")
-    
-    items = []
-    if os.path.exists(vault_path):
-        for filename in os.listdir(vault_path):
-            if filename.endswith(".json"):
-                item = service.load_json(os.path.join(vault_path, filename))
-                if item:
-                    # Asegurar que usage_count existe para items antiguos
-                    if 'usage_count' not in item:
-                        item['usage_count'] = 0
-                    items.append(item)
-    
-    return jsonify(items)
+    args = request.args
+    filters = {"item_type": args.get('type'), "status": args.get('status'), "tags": args.getlist('tag')}
+    fields = [f.strip() for f in args.get('fields', '').split(',') if f.strip()]
+
+    if 'limit' in args or 'cursor' in args:
+        try:
+            limit = int(args.get('limit', query_service.DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return jsonify({"error": "Invalid limit"}), 400
+        limit = max(1, min(limit, query_service.MAX_PAGE_SIZE))
+        ids, items = service.list_vault_items_sorted(campaign_id, **filters)
+        page, next_cursor = query_service.paginate(ids, items, cursor=args.get('cursor'), limit=limit)
+        return jsonify({
+            "items": [query_service.project(with_defaults(i), fields) for i in page],
+            "next_cursor": next_cursor
+        })
+
+    _, items = service.list_vault_items_sorted(campaign_id, **filters)
+    return jsonify([query_service.project(with_defaults(item), fields) for item in items])
 
 @vault_bp.route('/<campaign_id>/vault', methods=['POST'])
 def create_vault_item(campaign_id):
@@ -47,32 +65,27 @@ def create_vault_item(campaign_id):
         "content": data.get('content', {})
     }
     
-    campaign_path = service._get_campaign_path(campaign_id)
-    file_path = os.path.join(campaign_path, "vault", f"{item_type}_{item_id}.json")
-    
-    service.save_json(file_path, item)
+    service.save_vault_item(campaign_id, item)
     
     return jsonify(item), 201
 
-@vault_bp.route('/<campaign_id>/vault/<item_id>', methods=['PUT'])
-def update_vault_item(campaign_id, item_id):
-    data = request.get_json()
-    service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    vault_path = os.path.join(campaign_path, "vault")
-    
-    target_file = None
-    for filename in os.listdir(vault_path):
-        if filename.endswith(f"_{item_id}.json"):
-            target_file = filename
-            break
-            
-    if not target_file:
-        return jsonify({"error": "Item not found"}), 404
-        
-    file_path = os.path.join(vault_path, target_file)
-    current_item = service.load_json(file_path)
-    
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def invalid_update(data):
+    """Motivo por el que un cambio no se puede aplicar, o None si es válido."""
+    if not isinstance(data, dict):
+        return "must be an object"
+    for field in ('usage_count', 'usage_increment'):
+        if field in data and not _is_int(data[field]):
+            return f"{field} must be an integer"
+    if 'status' in data and not isinstance(data['status'], str):
+        return "status must be a string"
+    if 'tags' in data and not (isinstance(data['tags'], list) and all(isinstance(t, str) for t in data['tags'])):
+        return "tags must be a list of strings"
+    return None
+
+def apply_item_update(current_item, data):
     # Update fields
     if 'status' in data:
         current_item['status'] = data['status']
@@ -82,24 +95,71 @@ def update_vault_item(campaign_id, item_id):
         current_item['content'] = data['content']
     if 'usage_count' in data:
         current_item['usage_count'] = data['usage_count']
+    if 'usage_increment' in data:
+        current_item['usage_count'] = current_item.get('usage_count', 0) + data['usage_increment']
+
+@vault_bp.route('/<campaign_id>/vault/<item_id>', methods=['PUT'])
+def update_vault_item(campaign_id, item_id):
+    data = request.get_json(silent=True)
+    error = invalid_update(data)
+    if error:
+        return jsonify({"error": f"Update {error}"}), 400
+    service = get_file_service()
+    file_path = service.find_vault_item(campaign_id, item_id)
+    if not file_path:
+        return jsonify({"error": "Item not found"}), 404
+        
+    with service.lock(file_path):
+        failed = precondition_failed(request, service.etag(file_path))
+        if failed:
+            return failed
+        current_item = service.load_json(file_path)
+        original = clone_json(current_item)
+        apply_item_update(current_item, data)
         
-    service.save_json(file_path, current_item)
-    return jsonify(current_item)
+        # Sin cambios reales no se reescribe el fichero
+        if current_item != original:
+            file_path = service.save_vault_item(campaign_id, current_item)
+    return with_etag(request, jsonify(current_item), service.etag(file_path))
+
+@vault_bp.route('/<campaign_id>/vault/batch', methods=['PATCH'])
+def batch_update_vault_items(campaign_id):
+    """Varios cambios de una vez: {"updates": [{"id": ..., "status": ..., "usage_count": ...}, ...]}.
+
+    Además de los campos de PUT acepta 'usage_increment'. Responde con un
+    resultado por item, en el mismo orden.
+    """
+    data = request.get_json(silent=True)
+    updates = data.get('updates') if isinstance(data, dict) else None
+    if not isinstance(updates, list):
+        return jsonify({"error": "updates list is required"}), 400
+    # Se valida todo antes de aplicar nada: un lote con un cambio mal formado no toca ningún item
+    for position, change in enumerate(updates):
+        error = invalid_update(change)
+        if error is None and not isinstance(change.get('id'), str):
+            error = "must have an id"
+        if error:
+            return jsonify({"error": f"Update {position} {error}", "index": position}), 400
+
+    service = get_file_service()
+    results = []
+    for item_id, item in service.update_vault_items(campaign_id, updates, apply_item_update):
+        if item is None:
+            results.append({"id": item_id, "status": 404, "error": "Item not found"})
+        else:
+            results.append({"id": item_id, "status": 200, "item": item})
+    return jsonify({"results": results})
 
 @vault_bp.route('/<campaign_id>/vault/<item_id>', methods=['DELETE'])
 def delete_vault_item(campaign_id, item_id):
     service = get_file_service()
-    campaign_path = service._get_campaign_path(campaign_id)
-    vault_path = os.path.join(campaign_path, "vault")
-    
-    target_file = None
-    for filename in os.listdir(vault_path):
-        if filename.endswith(f"_{item_id}.json"):
-            target_file = filename
-            break
-            
-    if target_file:
-        os.remove(os.path.join(vault_path, target_file))
+    file_path = service.find_vault_item(campaign_id, item_id)
+    if file_path:
+        with service.lock(file_path):
+            failed = precondition_failed(request, service.etag(file_path))
+            if failed:
+                return failed
+            service.delete_vault_item(campaign_id, item_id)
         return jsonify({"message": "Item deleted"})
         
     return jsonify({"error": "Item not found"}), 404
\ No newline at end of file
@@ -0,0 +1,147 @@
+import os
+import re
+import threading
+import time
+
+# Proveedores de modelo para el asistente de IA. Todos exponen la misma interfaz:
+# provider.start_chat(system_prompt, turns) -> chat con send(texto) -> texto.
+#  - GeminiProvider: Google Gemini. El cliente se configura una sola vez y se
+#    reutiliza entre peticiones (solo se rehace si cambia la API key).
+#  - StubProvider: modelo local determinista, sin red, para pruebas y medidas.
+# AI_PROVIDER=stub activa el segundo. chat.stream(texto) devuelve la respuesta a
+# trozos según llega del modelo.
+
+AI_PROVIDER = os.getenv('AI_PROVIDER', 'gemini')
+AI_MODEL = os.getenv('AI_MODEL', 'gemini-2.0-flash')
+GENERATION_CONFIG = {
+    "temperature": 0.9,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+    "response_mime_type": "text/plain",
+}
+# Pausa por trozo del modelo de pruebas, para simular la latencia de uno real
+AI_STUB_DELAY = float(os.getenv('AI_STUB_DELAY', '0'))
+# Respuesta fija del modelo tras el contexto, como turno inicial de cada chat
+CONTEXT_ACK = "Entendido DM. Tengo el contexto completo. ¿Qué hacemos hoy?"
+
+
+class ProviderChat:
+    """Chat con historial propio en (rol, texto), independiente del proveedor."""
+
+    def __init__(self, system_prompt, turns=None):
+        self.system_prompt = system_prompt
+        self.turns = list(turns or [])
+
+    def _complete(self, text):
+        raise NotImplementedError
+
+    def _stream(self, text):
+        yield self._complete(text)
+
+    def _abandoned(self):
+        """Tras un stream cortado a medias; por defecto no hay nada que deshacer."""
+
+    def send(self, text):
+        reply = self._complete(text)
+        self.turns.append(("user", text))
+        self.turns.append(("model", reply))
+        return reply
+
+    def stream(self, text):
+        """Como send, pero a trozos. Si se corta antes de acabar, el turno no se guarda."""
+        parts = []
+        completed = False
+        try:
+            for chunk in self._stream(text):
+                parts.append(chunk)
+                yield chunk
+            completed = True
+        finally:
+            if completed:
+                self.turns.append(("user", text))
+                self.turns.append(("model", "".join(parts)))
+            else:
+                self._abandoned()
+
+
+class GeminiChat(ProviderChat):
+    def __init__(self, model, system_prompt, turns=None):
+        super().__init__(system_prompt, turns)
+        self._model = model
+        self._start()
+
+    def _start(self):
+        history = [{"role": "user", "parts": [self.system_prompt]}, {"role": "model", "parts": [CONTEXT_ACK]}]
+        history.extend({"role": role, "parts": [text]} for role, text in self.turns)
+        self._chat = self._model.start_chat(history=history)
+
+    def _complete(self, text):
+        return self._chat.send_message(text).text
+
+    def _stream(self, text):
+        for chunk in self._chat.send_message(text, stream=True):
+            if chunk.parts:
+                yield chunk.text
+
+    def _abandoned(self):
+        # El ChatSession de Gemini queda con una respuesta sin resolver: se rehace con los turnos buenos
+        self._start()
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model = None
+        self._api_key = None
+
+    def _get_model(self):
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        with self._lock:
+            if self._model is None or api_key != self._api_key:
+                import google.generativeai as genai  # dependencia opcional, solo con Gemini
+                genai.configure(api_key=api_key)
+                self._model = genai.GenerativeModel(model_name=AI_MODEL, generation_config=GENERATION_CONFIG)
+                self._api_key = api_key
+            return self._model
+
+    def start_chat(self, system_prompt, turns=None):
+        return GeminiChat(self._get_model(), system_prompt, turns)
+
+
+class StubChat(ProviderChat):
+    def _complete(self, text):
+        exchanges = len(self.turns) // 2 + 1
+        return (f"[stub] Turno {exchanges}. Contexto de {len(self.system_prompt)} caracteres. "
+                f"Consulta: {text}")
+
+    def _stream(self, text):
+        for word in re.findall(r'\S+\s*', self._complete(text)):
+            if AI_STUB_DELAY:
+                time.sleep(AI_STUB_DELAY)
+            yield word
+
+
+class StubProvider:
+    name = "stub"
+
+    def start_chat(self, system_prompt, turns=None):
+        return StubChat(system_prompt, turns)
+
+
+PROVIDERS = {"gemini": GeminiProvider, "stub": StubProvider}
+_providers = {}
+_registry_lock = threading.Lock()
+
+def get_provider(name=None):
+    name = name or AI_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown AI provider '{name}'")
+    with _registry_lock:
+        if name not in _providers:
+            _providers[name] = PROVIDERS[name]()
+        return _providers[name]
@@ -0,0 +1,390 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from services.journal_service import atomic_write_bytes
+
+# Catálogo persistente de pistas de audio. Se construye una vez recorriendo assets/,
+# lo actualizan de forma incremental las rutas de subida/mover/renombrar/borrar y
+# un sondeo por mtime de directorios detecta ficheros añadidos desde fuera.
+# on_discovered(rutas) recibe las pistas nuevas (escaneo, sondeo o alta) para
+# precalcular lo que haga falta en segundo plano. Cada alta/baja de pista queda
+# en un journal de cambios (seq, op, ruta) para reconciliaciones incrementales.
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg')
+CATALOG_POLL_INTERVAL = float(os.getenv('CATALOG_POLL_INTERVAL', '2'))
+CATALOG_WATCH_INTERVAL = float(os.getenv('CATALOG_WATCH_INTERVAL', '0'))
+CATALOG_SAVE_INTERVAL = 5
+CHANGE_LOG_SIZE = 10000
+
+def is_audio(filename):
+    return filename.lower().endswith(AUDIO_EXTENSIONS)
+
+def describe_track(rel_path):
+    """Campos de una pista derivados de su ruta frame/type/category/subcategory/fichero."""
+    parts = rel_path.split('/')
+    file = parts[-1]
+
+    frame = "Global"
+    t_type = "sfx"
+    category = "General"
+    subcategory = ""
+
+    if len(parts) > 0:
+        frame = parts[0] if parts[0] != 'mocks' else 'Global'
+    if len(parts) > 1: t_type = parts[1]
+    if len(parts) > 2: category = parts[2]
+    if len(parts) > 3 and parts[3] != file: subcategory = parts[3]
+
+    if t_type not in ['music', 'ambience', 'sfx']: t_type = 'sfx'
+
+    return {
+        "id": rel_path,
+        "name": os.path.splitext(file)[0].replace('_', ' ').replace('-', ' ').title(),
+        "filename": rel_path,
+        "type": t_type,
+        "frame": frame if frame != "Global" else None,
+        "category": category,
+        "subcategory": subcategory,
+    }
+
+
+class TrackCatalog:
+    def __init__(self, assets_dir, store_path):
+        self.assets_dir = assets_dir
+        self.store_path = store_path
+        self.lock = threading.RLock()
+        self.tracks = {}     # ruta relativa -> descripción
+        self.dirs = {}       # directorio relativo ('' = raíz) -> st_mtime_ns
+        self.files = {}      # directorio -> rutas de pistas directamente dentro
+        self.children = {}   # directorio -> subdirectorios directos
+        self.version = 0
+        self.loaded = False
+        self._dirty = False
+        self._last_poll = 0
+        self._last_save = 0
+        self._responses = {}
+        self._structure = None
+        self._discovered = []
+        self.on_discovered = None
+        self.epoch = None    # identifica la historia del journal; cambia con cada escaneo completo
+        self.seq = 0
+        self.changes = deque(maxlen=CHANGE_LOG_SIZE)
+
+    # --- utilidades de rutas ---
+    def _abs(self, rel):
+        return os.path.join(self.assets_dir, rel.replace('/', os.sep)) if rel else self.assets_dir
+
+    @staticmethod
+    def _parent(rel):
+        return rel.rpartition('/')[0]
+
+    def _mtime(self, rel_dir):
+        try:
+            return os.stat(self._abs(rel_dir)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _changed(self):
+        self.version += 1
+        self._dirty = True
+        self._responses.clear()
+        discovered, self._discovered = self._discovered, []
+        if discovered and self.on_discovered:
+            try:
+                self.on_discovered(discovered)
+            except Exception as e:
+                print(f"Error procesando pistas nuevas del catálogo: {e}")
+
+    # --- estructura en memoria ---
+    def _register_dir(self, rel_dir, mtime):
+        self.dirs[rel_dir] = mtime
+        self.files.setdefault(rel_dir, set())
+        self.children.setdefault(rel_dir, set())
+        if rel_dir:
+            parent = self._parent(rel_dir)
+            self.children.setdefault(parent, set()).add(rel_dir)
+
+    def _log_change(self, op, rel_path):
+        self.seq += 1
+        self.changes.append((self.seq, op, rel_path))
+
+    def _register_track(self, rel_path, discovered=True):
+        if discovered and rel_path not in self.tracks:
+            self._discovered.append(rel_path)
+            self._log_change('add', rel_path)
+        self.tracks[rel_path] = describe_track(rel_path)
+        self.files.setdefault(self._parent(rel_path), set()).add(rel_path)
+
+    def _unregister_track(self, rel_path):
+        if self.tracks.pop(rel_path, None) is not None:
+            self._log_change('del', rel_path)
+        self.files.get(self._parent(rel_path), set()).discard(rel_path)
+
+    def _forget_dir(self, rel_dir):
+        for sub in list(self.children.get(rel_dir, ())):
+            self._forget_dir(sub)
+        for rel in self.files.pop(rel_dir, set()):
+            self._unregister_track(rel)
+        self.children.pop(rel_dir, None)
+        self.dirs.pop(rel_dir, None)
+        if rel_dir:
+            self.children.get(self._parent(rel_dir), set()).discard(rel_dir)
+
+    # --- carga / escaneo ---
+    def _ensure_loaded(self):
+        if self.loaded:
+            return
+        os.makedirs(self.assets_dir, exist_ok=True)
+        stored = None
+        if os.path.exists(self.store_path):
+            try:
+                with open(self.store_path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+            except ValueError:
+                stored = None
+        self.loaded = True
+        if stored and stored.get('assets_dir') == self.assets_dir:
+            for rel_dir in sorted(stored.get('dirs', {}), key=len):
+                self._register_dir(rel_dir, stored['dirs'][rel_dir])
+            for rel in stored.get('tracks', []):
+                self._register_track(rel, discovered=False)
+            self.epoch = stored.get('epoch') or uuid.uuid4().hex
+            self.seq = stored.get('seq', 0)
+            self.changes.extend(tuple(change) for change in stored.get('changes', []))
+            # Lo persistido puede estar desfasado: el sondeo corrige lo que cambió
+            self._poll()
+        else:
+            self._full_scan()
+        self._changed()
+
+    def _scan_dir(self, rel_dir):
+        """(Re)escanea un directorio y, recursivamente, los subdirectorios nuevos."""
+        path = self._abs(rel_dir)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            entries = list(os.scandir(path))
+        except FileNotFoundError:
+            self._forget_dir(rel_dir)
+            return
+        self._register_dir(rel_dir, mtime)
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        seen_files = set()
+        seen_dirs = set()
+        for entry in entries:
+            rel = prefix + entry.name
+            if entry.is_dir():
+                seen_dirs.add(rel)
+                if rel not in self.dirs:
+                    self._scan_dir(rel)
+            elif is_audio(entry.name):
+                seen_files.add(rel)
+                if rel not in self.tracks:
+                    self._register_track(rel)
+        # Ficheros y subdirectorios que ya no están
+        for rel in self.files[rel_dir] - seen_files:
+            self._unregister_track(rel)
+        for sub in self.children[rel_dir] - seen_dirs:
+            self._forget_dir(sub)
+
+    def _full_scan(self):
+        # Historia nueva: las bajas de lo anterior no quedan en el journal
+        self.tracks, self.dirs, self.files, self.children = {}, {}, {}, {}
+        self._scan_dir('')
+        self.epoch, self.seq = uuid.uuid4().hex, 0
+        self.changes.clear()
+
+    def _poll(self):
+        """Compara el mtime de cada directorio conocido y reescanea solo los que cambiaron."""
+        changed = False
+        for rel_dir, mtime in list(self.dirs.items()):
+            if rel_dir not in self.dirs:
+                continue  # olvidado al reescanear su padre
+            if self._mtime(rel_dir) != mtime:
+                self._scan_dir(rel_dir)
+                changed = True
+        if '' not in self.dirs:
+            os.makedirs(self.assets_dir, exist_ok=True)
+            self._full_scan()
+            changed = True
+        return changed
+
+    def refresh(self, force=False):
+        with self.lock:
+            self._ensure_loaded()
+            now = time.monotonic()
+            if force or now - self._last_poll >= CATALOG_POLL_INTERVAL:
+                self._last_poll = now
+                if self._poll():
+                    self._changed()
+            self._save_if_due()
+
+    def _save_if_due(self, force=False):
+        now = time.monotonic()
+        if self._dirty and (force or now - self._last_save >= CATALOG_SAVE_INTERVAL):
+            payload = json.dumps({
+                "assets_dir": self.assets_dir,
+                "tracks": sorted(self.tracks),
+                "dirs": self.dirs,
+                "epoch": self.epoch,
+                "seq": self.seq,
+                "changes": list(self.changes),
+            }).encode('utf-8')
+            atomic_write_bytes(self.store_path, payload, fsync=False)
+            self._dirty = False
+            self._last_save = now
+
+    def save(self):
+        with self.lock:
+            self._save_if_due(force=True)
+
+    def rebuild(self):
+        """Reescaneo completo; todas las pistas cuentan como descubiertas."""
+        with self.lock:
+            self.loaded = True
+            self._full_scan()
+            self._changed()
+            self._save_if_due(force=True)
+            return len(self.tracks)
+
+    # --- actualizaciones incrementales desde las rutas ---
+    def _sync_dir(self, rel_dir):
+        """Registra un directorio (y sus padres) tocado por la propia ruta."""
+        parts = rel_dir.split('/') if rel_dir else []
+        for i in range(len(parts) + 1):
+            d = '/'.join(parts[:i])
+            mtime = self._mtime(d)
+            if mtime is None:
+                self._forget_dir(d)
+                return
+            if d not in self.dirs:
+                self._scan_dir(d)
+            else:
+                self.dirs[d] = mtime
+
+    def add_file(self, rel_path):
+        with self.lock:
+            self._ensure_loaded()
+            self._sync_dir(self._parent(rel_path))
+            if is_audio(rel_path) and os.path.exists(self._abs(rel_path)):
+                self._register_track(rel_path)
+                # Un alta explícita (p. ej. sobrescribir una pista) también cuenta como nueva
+                if rel_path not in self._discovered:
+                    self._discovered.append(rel_path)
+            self._changed()
+
+    def remove_file(self, rel_path):
+        with self.lock:
+            self._ensure_loaded()
+            self._unregister_track(rel_path)
+            self._sync_dir(self._parent(rel_path))
+            self._changed()
+
+    def move_file(self, old_rel, new_rel):
+        with self.lock:
+            self.remove_file(old_rel)
+            self.add_file(new_rel)
+
+    def add_dir(self, rel_dir):
+        with self.lock:
+            self._ensure_loaded()
+            self._sync_dir(rel_dir)
+            self._changed()
+
+    def remove_dir(self, rel_dir):
+        with self.lock:
+            self._ensure_loaded()
+            self._forget_dir(rel_dir)
+            self._sync_dir(self._parent(rel_dir))
+            self._changed()
+
+    def rename_dir(self, old_dir, new_dir):
+        with self.lock:
+            self._ensure_loaded()
+            self._forget_dir(old_dir)
+            self._sync_dir(self._parent(old_dir))
+            self._sync_dir(new_dir)
+            self._changed()
+
+    # --- lectura ---
+    def has_track(self, rel_path):
+        with self.lock:
+            self._ensure_loaded()
+            return rel_path in self.tracks
+
+    def changes_since(self, epoch, seq):
+        """(rutas tocadas desde 'seq', epoch, seq actual); rutas None si el journal no alcanza."""
+        with self.lock:
+            self.refresh()
+            complete = (epoch == self.epoch and seq is not None and seq <= self.seq and
+                        (seq >= self.changes[0][0] - 1 if self.changes else seq == self.seq))
+            paths = {path for s, _, path in self.changes if s > seq} if complete else None
+            return paths, self.epoch, self.seq
+
+    def track_ids(self):
+        with self.lock:
+            self.refresh()
+            return sorted(self.tracks)
+
+    def tracks_response(self, host_url, metadata_signature, build_fn):
+        """(etag, cuerpo JSON) del listado, cacheado por versión del catálogo y metadatos."""
+        with self.lock:
+            self.refresh()
+            key = (host_url, metadata_signature)
+            cached = self._responses.get(key)
+            if cached is None:
+                if len(self._responses) >= 8:
+                    self._responses.clear()
+                ordered = [self.tracks[rel] for rel in sorted(self.tracks)]
+                body = json.dumps(build_fn(ordered), ensure_ascii=False).encode('utf-8')
+                cached = (hashlib.sha1(body).hexdigest(), body)
+                self._responses[key] = cached
+            return cached
+
+    def structure(self):
+        """(etag, árbol frame -> type -> category -> [subcategorías]) cacheado por versión."""
+        with self.lock:
+            self.refresh()
+            if self._structure is None or self._structure[0] != self.version:
+                def names(rel_dir):
+                    return sorted(child.rpartition('/')[2] for child in self.children.get(rel_dir, ()))
+                tree = {}
+                for frame in names(''):
+                    if frame == 'mocks': continue
+                    tree[frame] = {}
+                    for t_type in names(frame):
+                        type_dir = f"{frame}/{t_type}"
+                        tree[frame][t_type] = {cat: names(f"{type_dir}/{cat}") for cat in names(type_dir)}
+                body = json.dumps(tree, ensure_ascii=False).encode('utf-8')
+                self._structure = (self.version, hashlib.sha1(body).hexdigest(), body)
+            return self._structure[1], self._structure[2]
+
+    def stats(self):
+        with self.lock:
+            return {"tracks": len(self.tracks), "dirs": len(self.dirs), "version": self.version, "seq": self.seq}
+
+
+_catalogs = {}
+_registry_lock = threading.Lock()
+
+def _watch(catalog):
+    while True:
+        time.sleep(CATALOG_WATCH_INTERVAL)
+        try:
+            catalog.refresh(force=True)
+        except Exception as e:
+            print(f"Error sondeando el catálogo de audio: {e}")
+
+def get_catalog(assets_dir, store_path):
+    key = os.path.abspath(assets_dir)
+    with _registry_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = TrackCatalog(key, store_path)
+            _catalogs[key] = catalog
+            if CATALOG_WATCH_INTERVAL > 0:
+                threading.Thread(target=_watch, args=(catalog,), name="catalog-watch", daemon=True).start()
+        return catalog
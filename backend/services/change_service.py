@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import uuid
+from services import index_service
+from services.cache_service import file_signature
+from services.journal_service import atomic_write_bytes
+
+# Sincronización incremental de una campaña. Cada alta, cambio o borrado de un
+# item del vault o de una sesión sube un contador de la campaña, y el documento
+# queda marcado con esa versión (los borrados, como lápida). Un cliente que ya
+# tiene la campaña pide GET /<campaign_id>/changes?since=N y recibe solo lo que
+# cambió después de N, en vez del vault y las sesiones enteros.
+#
+# En disco: changes.json (estado compactado) y changes.jsonl (un cambio por
+# línea, se añade en cada guardado y se vuelca al .json cada CHANGES_COMPACT_LINES
+# líneas). Al cargar se comparan las firmas de los ficheros con las apuntadas, de
+# modo que las ediciones externas o lo guardado justo antes de un corte reciben
+# una versión nueva. Con escritura diferida, un documento guardado mientras
+# estaba pendiente puede aparecer una vez de más tras reiniciar. Por eso el
+# .jsonl no se sincroniza (fsync) en cada guardado: lo que se pierda en un corte
+# lo vuelve a detectar esa comparación de firmas.
+#
+# Si el cliente viene de otro log (campo 'log'), de una versión que aún no existe
+# o de antes de la lápida más antigua conservada (CHANGES_MAX_TOMBSTONES), la
+# respuesta lleva reset: true y todos los documentos actuales.
+
+CHANGES_FILENAME = "changes.json"
+CHANGES_LOG_FILENAME = "changes.jsonl"
+CHANGES_COMPACT_LINES = int(os.getenv('CHANGES_COMPACT_LINES', '500'))
+CHANGES_MAX_TOMBSTONES = int(os.getenv('CHANGES_MAX_TOMBSTONES', '1000'))
+# Carpeta -> (tipo de documento en las claves y respuestas, parser de nombres)
+KINDS = {"vault": ("vault", index_service.parse_vault_filename),
+         "sessions": ("session", index_service.parse_session_filename)}
+
+
+class ChangeLog:
+    def __init__(self, campaign_path):
+        self.campaign_path = campaign_path
+        self.path = os.path.join(campaign_path, CHANGES_FILENAME)
+        self.log_path = os.path.join(campaign_path, CHANGES_LOG_FILENAME)
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.log_id = None
+        self.version = 0
+        self.floor = 0      # versión de la lápida más reciente descartada
+        self.docs = {}      # "vault/<id>" -> {"v": n, "sig": [...]} o {"v": n, "deleted": True}
+        self.lines = 0
+
+    def _read_lines(self):
+        try:
+            with open(self.log_path, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return []
+        entries = []
+        # Una última línea sin '\n' es de una escritura cortada: se ignora
+        for line in raw[:raw.rfind(b'\n') + 1].splitlines():
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                print(f"Aviso: registro ilegible en '{self.log_path}', se ignora.")
+        return entries
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+            except (FileNotFoundError, ValueError):
+                stored = None
+            if stored:
+                self.log_id, self.version = stored["log"], stored["version"]
+                self.floor, self.docs = stored.get("floor", 0), stored.get("docs", {})
+                pending = self._read_lines()
+                for entry in pending:
+                    key = entry.pop("key")
+                    if entry["v"] > self.docs.get(key, {}).get("v", 0):
+                        self.docs[key] = entry
+                    self.version = max(self.version, entry["v"])
+                self.lines = len(pending)
+            else:
+                # Log nuevo: las versiones de uno anterior no sirven
+                self.log_id = uuid.uuid4().hex[:12]
+                if os.path.exists(self.log_path):
+                    os.remove(self.log_path)
+            self.loaded = True
+            self._reconcile()
+            if self.lines or not stored:
+                self.compact()
+
+    def _reconcile(self):
+        """Da versión nueva a lo que cambió en disco sin pasar por FileService."""
+        seen = set()
+        for folder, (kind, parser) in KINDS.items():
+            index = index_service.get_index(os.path.join(self.campaign_path, folder), parser)
+            for doc_id, entry in index.entries_snapshot().items():
+                key = f"{kind}/{doc_id}"
+                seen.add(key)
+                signature = list(file_signature(os.path.join(index.path, entry["filename"])) or ())
+                current = self.docs.get(key)
+                if current is None or current.get("deleted") or current.get("sig") != signature:
+                    self._record(key, {"sig": signature})
+        for key, current in list(self.docs.items()):
+            if key not in seen and not current.get("deleted"):
+                self._record(key, {"deleted": True})
+
+    def _record(self, key, entry):
+        self.version += 1
+        entry = {"v": self.version, **entry}
+        self.docs[key] = entry
+        with open(self.log_path, 'ab') as f:
+            f.write(json.dumps({"key": key, **entry}).encode('utf-8') + b"\n")
+        self.lines += 1
+
+    def compact(self):
+        """Vuelca el estado a changes.json, vacía el .jsonl y descarta las lápidas más antiguas."""
+        with self.lock:
+            tombstones = sorted((entry["v"], key) for key, entry in self.docs.items() if entry.get("deleted"))
+            for version, key in tombstones[:max(0, len(tombstones) - CHANGES_MAX_TOMBSTONES)]:
+                del self.docs[key]
+                self.floor = max(self.floor, version)
+            if not os.path.isdir(self.campaign_path):
+                return
+            payload = {"log": self.log_id, "version": self.version, "floor": self.floor, "docs": self.docs}
+            atomic_write_bytes(self.path, json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+            self.lines = 0
+
+    def apply(self, event, path, data):
+        """Aviso de FileService sobre un fichero de esta campaña."""
+        folder, filename = os.path.split(path)
+        kind, parser = KINDS.get(os.path.basename(folder), (None, None))
+        parsed = parser(filename) if parser and os.path.dirname(folder) == self.campaign_path else None
+        if not parsed:
+            return
+        key = f"{kind}/{parsed[0]}"
+        with self.lock:
+            if event == 'saved':
+                self._record(key, {"sig": list(file_signature(path) or ())})
+            elif event == 'deleted' and not (data and data.get("moved_to")) and key in self.docs:
+                # Un renombrado avisa del fichero viejo como borrado: el documento sigue existiendo
+                self._record(key, {"deleted": True})
+            if self.lines >= CHANGES_COMPACT_LINES:
+                self.compact()
+
+    def since(self, version, log_id=None, kinds=None):
+        """(reset, versión actual, [(clave, entrada)] posteriores a 'version' por orden)."""
+        with self.lock:
+            reset = bool(log_id and log_id != self.log_id) or version > self.version or 0 < version < self.floor
+            if reset:
+                version = 0
+            changed = sorted(((key, entry) for key, entry in self.docs.items()
+                              if entry["v"] > version and not (reset and entry.get("deleted"))
+                              and (not kinds or key.split("/", 1)[0] in kinds)),
+                             key=lambda change: change[1]["v"])
+            return reset, self.version, changed
+
+
+_logs = {}
+_registry_lock = threading.Lock()
+
+def _get_log(campaign_path):
+    key = os.path.abspath(campaign_path)
+    with _registry_lock:
+        log = _logs.get(key)
+        if log is None:
+            log = ChangeLog(key)
+            _logs[key] = log
+    log.load()
+    return log
+
+def changes(service, campaign_id, since=0, log_id=None, kinds=None):
+    """Respuesta de GET /changes: ids y documentos creados/cambiados y lápidas de los borrados."""
+    log = _get_log(service._get_campaign_path(campaign_id))
+    reset, version, changed = log.since(since, log_id, kinds)
+    results = []
+    for key, entry in changed:
+        kind, doc_id = key.split("/", 1)
+        if entry.get("deleted"):
+            results.append({"kind": kind, "id": doc_id, "version": entry["v"], "deleted": True})
+            continue
+        path = service.find_vault_item(campaign_id, doc_id) if kind == "vault" else service.find_session(campaign_id, doc_id)
+        doc = service.peek_json(path) if path else None
+        if doc is not None:
+            results.append({"kind": kind, "id": doc_id, "version": entry["v"],
+                            ("item" if kind == "vault" else "session"): doc})
+    return {"log": log.log_id, "version": version, "since": 0 if reset else since, "reset": reset,
+            "changes": results}
+
+def on_file_event(event, path, data=None):
+    """Listener de FileService: sube el contador con cada guardado/borrado."""
+    path = os.path.abspath(path)
+    if event == 'campaign_deleted':
+        with _registry_lock:
+            _logs.pop(path, None)
+        return
+    campaign_path = os.path.dirname(os.path.dirname(path))
+    if not os.path.basename(campaign_path).startswith("campaign_") or \
+            os.path.basename(os.path.dirname(path)) not in KINDS:
+        return
+    _get_log(campaign_path).apply(event, path, data)
@@ -0,0 +1,275 @@
+import os
+import threading
+from collections import OrderedDict
+from services.cache_service import file_signature
+from services import session_log_service, vector_service
+
+# Contexto del prompt del asistente de IA. Las secciones (framework, verdades,
+# frentes, personajes, memoria reciente...) se cachean por campaña y se
+# recalculan solo cuando cambia la versión de su origen (metadata.json, el
+# directorio del vault o el de sesiones). El prompt final respeta un presupuesto
+# de tokens: las secciones se asignan por prioridad y las menos importantes se
+# recortan o se quedan fuera. Con una consulta, el índice vectorial aporta los
+# RAG_TOP_K elementos y sesiones más relacionados, y en sesión los secretos
+# pasan a ser solo los relevantes en vez de todos los de reserva. Eso cambia en
+# cada pregunta, así que va en el mensaje del usuario (build_query_context) y no
+# en el prompt de sistema, que se mantiene estable para reutilizar el chat.
+
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '8000'))
+CHARS_PER_TOKEN = 4
+MEMORY_SESSIONS = 3
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', '8'))
+# Parte del presupuesto reservada al contexto de la consulta (con RAG activo)
+QUERY_BUDGET_SHARE = 0.25
+CONTEXT_CACHE_CAMPAIGNS = 32
+TRUNCATION_MARK = "[...]"
+
+# (clave, título, prioridad): menor número = se asigna antes
+SECTIONS = [
+    ("framework", "CONTEXTO MUNDIAL (Framework)", 0),
+    ("scene", "ELEMENTOS EN ESCENA", 1),
+    ("truths", "VERDADES DEL MUNDO", 2),
+    ("fronts", "FRENTES (Amenazas Activas)", 2),
+    ("characters", "PERSONAJES (PJs)", 3),
+    ("memory", "MEMORIA RECIENTE (Lo que ha pasado últimamente)", 3),
+    ("secrets", "SECRETOS DISPONIBLES", 5),
+    ("vault_names", "ITEMS EXISTENTES", 6),
+]
+# Secciones del contexto de cada consulta, que acompañan al mensaje del usuario
+QUERY_SECTIONS = [
+    ("related", "ELEMENTOS RELACIONADOS CON LA CONSULTA", 0),
+    ("secrets", "SECRETOS RELACIONADOS CON LA CONSULTA", 1),
+]
+QUERY_HEADER = "CONTEXTO PARA ESTA CONSULTA"
+
+HEADER = "Eres un Asistente de Dungeon Master experto."
+SESSION_INSTRUCTIONS = ("ESTADO: SESIÓN EN CURSO.\nInstrucciones: Prioriza conectar la situación actual "
+                        "con la 'Memoria Reciente' y los 'Frentes'.")
+VAULT_INSTRUCTIONS = ("ESTADO: PREPARACIÓN (VAULT).\nInstrucciones: Crea contenido nuevo que sea coherente "
+                      "con el Framework y la historia reciente.")
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def format_value(value):
+    if isinstance(value, dict):
+        return "; ".join(f"{k}: {format_value(v)}" for k, v in value.items() if v not in (None, "", [], {}))
+    if isinstance(value, list):
+        return ", ".join(format_value(v) for v in value if v not in (None, "", [], {}))
+    return str(value)
+
+def format_item(content):
+    """Una línea legible por elemento: nombre primero y luego el resto de campos."""
+    if not isinstance(content, dict):
+        return f"- {format_value(content)}"
+    name = content.get('name') or content.get('title') or ""
+    rest = {k: v for k, v in content.items() if k not in ('name', 'title')}
+    details = format_value(rest)
+    return f"- {name}: {details}" if name and details else f"- {name or details}"
+
+def format_list(items):
+    return "\n".join(format_item(i) for i in items)
+
+def truncate(text, max_tokens):
+    """Recorta por líneas (o por caracteres si hace falta) hasta caber en max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARK) - 1)
+    if max_chars <= 0:
+        return "", True
+    cut = text[:max_chars]
+    newline = cut.rfind("\n")
+    if newline > max_chars // 2:
+        cut = cut[:newline]
+    return f"{cut}\n{TRUNCATION_MARK}", True
+
+
+class CampaignContext:
+    """Secciones cacheadas de una campaña, cada grupo validado por la versión de su origen."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.groups = {}  # grupo -> (versión, valor)
+
+    def cached(self, group, version, build):
+        with self.lock:
+            entry = self.groups.get(group)
+            if entry is not None and entry[0] == version:
+                return entry[1], True
+        value = build()
+        with self.lock:
+            self.groups[group] = (version, value)
+        return value, False
+
+
+_contexts = OrderedDict()
+_registry_lock = threading.Lock()
+
+def _get_context(campaign_path):
+    with _registry_lock:
+        context = _contexts.get(campaign_path)
+        if context is None:
+            context = CampaignContext()
+            _contexts[campaign_path] = context
+            while len(_contexts) > CONTEXT_CACHE_CAMPAIGNS:
+                _contexts.popitem(last=False)
+        else:
+            _contexts.move_to_end(campaign_path)
+        return context
+
+# --- Construcción de secciones ---
+def _metadata_sections(metadata):
+    use_full = metadata.get('use_full_framework', False)
+    framework_full = metadata.get('framework', '')
+    framework_summary = metadata.get('framework_summary', '')
+    framework = framework_full if use_full else (framework_summary or framework_full)
+    return {
+        "framework": framework or "Mundo de fantasía genérico.",
+        "truths": "\n".join(f"- {t}" for t in metadata.get('truths', []) if t),
+        "fronts": format_list(metadata.get('fronts', [])),
+    }
+
+def _vault_sections(vault_items):
+    characters = [i['content'] for i in vault_items if i['type'] == 'character']
+    secrets = [i['content'] for i in vault_items if i['type'] == 'secret' and i['status'] == 'reserve']
+    names = [i['content'].get('name', i['content'].get('title')) for i in vault_items]
+    return {
+        "characters": format_list(characters),
+        "secrets": format_list(secrets),
+        "vault_names": ", ".join(n for n in names if n),
+        # Para la escena de una sesión: contenido por id sin volver a leer el vault
+        "_by_id": {i['id']: i['content'] for i in vault_items},
+    }
+
+def rolling_memory(service, campaign_id, limit=MEMORY_SESSIONS):
+    """Resúmenes de las últimas 'limit' sesiones completadas, en orden cronológico."""
+    sessions_path = service._get_sessions_path(campaign_id)
+    sessions = []
+    if os.path.exists(sessions_path):
+        for f in os.listdir(sessions_path):
+            if f.endswith(".json"):
+                sess = service.peek_json(os.path.join(sessions_path, f))
+                if sess and sess.get('status') == 'completed' and sess.get('summary'):
+                    sessions.append(sess)
+    sessions.sort(key=lambda x: x.get('number', 0), reverse=True)
+    return "\n".join(f"- Sesión {s['number']} ({s.get('title', 'Sin título')}): {s.get('summary')}"
+                     for s in reversed(sessions[:limit]))
+
+def _related_sections(service, campaign_id, query, by_id, exclude):
+    """Items y sesiones más parecidos a la consulta, separando los secretos en reserva."""
+    related, secrets = [], []
+    for _, doc in vector_service.search(service, campaign_id, query, 4 * RAG_TOP_K, exclude=exclude):
+        if doc["kind"] == "session":
+            session = service.peek_json(os.path.join(service._get_sessions_path(campaign_id), doc["file"]))
+            if session and (session.get('summary') or session.get('recap')) and len(related) < RAG_TOP_K:
+                related.append(f"{doc['title']}: {session.get('summary') or session.get('recap')}")
+        elif doc["id"] in by_id and doc["type"] != 'character':  # los PJs ya van enteros
+            if doc["type"] == 'secret' and doc["status"] == 'reserve':
+                if len(secrets) < RAG_TOP_K:
+                    secrets.append(by_id[doc["id"]])
+            elif len(related) < RAG_TOP_K:
+                related.append(by_id[doc["id"]])
+    return format_list(related), format_list(secrets)
+
+def _assemble(sections, instructions, budget, layout=SECTIONS, header=HEADER):
+    """Asigna el presupuesto por prioridad y monta el prompt en el orden de lectura."""
+    remaining = budget - estimate_tokens(header) - estimate_tokens(instructions)
+    final, report, truncated = {}, {}, []
+    for key, title, _ in sorted(layout, key=lambda s: s[2]):
+        text = sections.get(key)
+        if not text:
+            continue
+        cost = estimate_tokens(title) + 2
+        body, was_cut = truncate(text, max(0, remaining - cost))
+        if was_cut:
+            truncated.append(key)
+        if not body:
+            continue
+        final[key] = f"{title}:\n{body}"
+        report[key] = estimate_tokens(final[key])
+        remaining -= report[key]
+    parts = [header] + [final[key] for key, _, _ in layout if key in final] + [instructions]
+    prompt = "\n\n".join(p for p in parts if p)
+    return prompt, {"tokens": estimate_tokens(prompt), "budget": budget, "chars": len(prompt),
+                    "sections": report, "truncated": truncated}
+
+def _vault_context(service, campaign_id, context):
+    return context.cached("vault", service.dir_signature(service._get_vault_path(campaign_id)),
+                          lambda: _vault_sections(service.list_vault_items(campaign_id)))
+
+def _session_data(service, campaign_id, session_id):
+    target_file = service.find_session(campaign_id, session_id)
+    if target_file:
+        # Notas del autoguardado diferencial aún sin compactar
+        session_log_service.flush(service, campaign_id, session_id)
+    return service.peek_json(target_file) if target_file else None
+
+def _rag_enabled():
+    return RAG_TOP_K > 0
+
+def _system_budget(budget):
+    return budget - int(budget * QUERY_BUDGET_SHARE) if _rag_enabled() else budget
+
+def build_prompt(service, campaign_id, mode='vault', session_id=None, extra_sections=None, budget=None):
+    """(prompt de sistema, informe) para el chat, o (None, None) si la campaña no existe.
+
+    No depende de la consulta: lo relacionado con ella lo da build_query_context.
+    """
+    budget = _system_budget(budget or PROMPT_TOKEN_BUDGET)
+    campaign_path = os.path.abspath(service._get_campaign_path(campaign_id))
+    metadata_path = os.path.join(campaign_path, "metadata.json")
+    metadata_version = file_signature(metadata_path)
+    if metadata_version is None:
+        return None, None
+    context = _get_context(campaign_path)
+    # La memoria reciente lee los resúmenes: antes se compactan los cambios pendientes
+    session_log_service.flush_campaign(service, campaign_id)
+
+    meta_sections, meta_hit = context.cached(
+        "metadata", metadata_version, lambda: _metadata_sections(service.peek_json(metadata_path) or {}))
+    vault_sections, vault_hit = _vault_context(service, campaign_id, context)
+    memory, memory_hit = context.cached(
+        "memory", service.dir_signature(service._get_sessions_path(campaign_id)),
+        lambda: rolling_memory(service, campaign_id))
+
+    sections = {**meta_sections, "characters": vault_sections["characters"],
+                "memory": memory or "No hay sesiones previas registradas."}
+    by_id = vault_sections["_by_id"]
+    if mode == 'session' and session_id:
+        instructions = ""
+        session_data = _session_data(service, campaign_id, session_id)
+        if session_data:
+            sections["scene"] = format_list(by_id[i] for i in session_data.get('linked_items', []) if i in by_id)
+            # Con RAG los secretos relevantes llegan con cada consulta
+            if not _rag_enabled():
+                sections["secrets"] = vault_sections["secrets"]
+            instructions = SESSION_INSTRUCTIONS
+    else:
+        instructions = VAULT_INSTRUCTIONS
+        sections["vault_names"] = vault_sections["vault_names"]
+    sections.update(extra_sections or {})
+
+    prompt, report = _assemble(sections, instructions, budget)
+    report["cached"] = {"metadata": meta_hit, "vault": vault_hit, "memory": memory_hit}
+    return prompt, report
+
+def build_query_context(service, campaign_id, query, mode='vault', session_id=None, budget=None):
+    """(texto, informe) con los elementos relacionados con la consulta para el mensaje
+    del usuario; ("", None) si no hay consulta o el RAG está desactivado."""
+    if not query or not query.strip() or not _rag_enabled():
+        return "", None
+    budget = budget or PROMPT_TOKEN_BUDGET
+    campaign_path = os.path.abspath(service._get_campaign_path(campaign_id))
+    if not os.path.exists(os.path.join(campaign_path, "metadata.json")):
+        return "", None
+    vault_sections, _ = _vault_context(service, campaign_id, _get_context(campaign_path))
+    scene_ids = []
+    session_data = _session_data(service, campaign_id, session_id) if mode == 'session' and session_id else None
+    if session_data:
+        scene_ids = session_data.get('linked_items', [])
+    related, secrets = _related_sections(service, campaign_id, query, vault_sections["_by_id"],
+                                         set(scene_ids) | {session_id})
+    sections = {"related": related, "secrets": secrets if session_data else ""}
+    if not any(sections.values()):
+        return "", None
+    return _assemble(sections, "", budget - _system_budget(budget), QUERY_SECTIONS, f"{QUERY_HEADER}:")
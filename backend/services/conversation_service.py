@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Conversaciones del asistente guardadas en el servidor, por campaña/modo/sesión.
+# Cada una conserva su chat del proveedor, así que los turnos siguientes no
+# vuelven a montar el contexto: solo se rehace el chat (manteniendo los turnos)
+# si el prompt de contexto ha cambiado o el historial supera CHAT_MAX_TURNS.
+# Se expulsan por inactividad (CHAT_TTL) y por número (las menos usadas).
+
+CHAT_TTL = int(os.getenv('CHAT_TTL', '3600'))
+CHAT_MAX_CONVERSATIONS = int(os.getenv('CHAT_MAX_CONVERSATIONS', '64'))
+CHAT_MAX_TURNS = int(os.getenv('CHAT_MAX_TURNS', '20'))
+
+
+class Conversation:
+    def __init__(self, key):
+        self.key = key
+        self.lock = threading.Lock()
+        self.chat = None
+        self.provider = None
+        self.last_used = time.time()
+
+    def _prepare(self, provider, system_prompt):
+        """Devuelve 'new', 'reused' o 'refreshed' según lo que haya que hacer con el chat."""
+        if self.chat is None or self.provider is not provider:
+            self.chat = provider.start_chat(system_prompt)
+            self.provider = provider
+            return "new"
+        too_long = len(self.chat.turns) > 2 * CHAT_MAX_TURNS
+        if self.chat.system_prompt == system_prompt and not too_long:
+            return "reused"
+        turns = self.chat.turns[-2 * CHAT_MAX_TURNS:] if too_long else self.chat.turns
+        self.chat = provider.start_chat(system_prompt, turns)
+        return "refreshed"
+
+    def send(self, provider, system_prompt, text):
+        with self.lock:
+            status = self._prepare(provider, system_prompt)
+            reply = self.chat.send(text)
+            self.last_used = time.time()
+            return reply, {"status": status, "turns": len(self.chat.turns) // 2}
+
+    def stream(self, provider, system_prompt, text, info):
+        """Respuesta a trozos; al acabar deja en 'info' el estado de la conversación."""
+        with self.lock:
+            status = self._prepare(provider, system_prompt)
+            yield from self.chat.stream(text)
+            self.last_used = time.time()
+            info.update(status=status, turns=len(self.chat.turns) // 2)
+
+
+class ConversationStore:
+    def __init__(self, ttl=CHAT_TTL, max_conversations=CHAT_MAX_CONVERSATIONS):
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self._lock = threading.Lock()
+        self._conversations = OrderedDict()
+
+    def _sweep(self):
+        cutoff = time.time() - self.ttl
+        for key in [k for k, c in self._conversations.items() if c.last_used < cutoff]:
+            del self._conversations[key]
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+
+    def get(self, key):
+        """Conversación de 'key' (creándola si no existe o ha caducado)."""
+        with self._lock:
+            self._sweep()
+            conversation = self._conversations.get(key)
+            if conversation is None:
+                conversation = Conversation(key)
+                self._conversations[key] = conversation
+                self._sweep()
+            else:
+                self._conversations.move_to_end(key)
+            return conversation
+
+    def drop(self, key):
+        with self._lock:
+            return self._conversations.pop(key, None) is not None
+
+    def drop_campaign(self, campaign_id):
+        with self._lock:
+            keys = [k for k in self._conversations if k[0] == campaign_id]
+            for key in keys:
+                del self._conversations[key]
+            return len(keys)
+
+
+conversations = ConversationStore()
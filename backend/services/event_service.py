@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import deque
+from itertools import islice
+from services import index_service
+from services.cache_service import clone_json
+
+# Avisos de cambios en tiempo real, por canal: uno por campaña ('campaign:<id>')
+# y otro para la biblioteca de audio ('audio'). Cada evento lleva una versión que
+# crece dentro de su canal; los clientes se suscriben por SSE (routes/event_routes.py)
+# y aplican el cambio en vez de volver a pedir la colección entera. Al reconectar
+# con Last-Event-ID reciben lo que se perdieron mientras siga en el historial
+# (EVENT_BACKLOG); si no, un evento 'reset' para que recarguen. Los canales viven
+# en la memoria de este proceso.
+
+EVENT_BACKLOG = int(os.getenv('EVENT_BACKLOG', '500'))
+EVENT_HEARTBEAT = float(os.getenv('EVENT_HEARTBEAT', '15'))
+# Identifica este arranque: tras reiniciar las versiones vuelven a empezar
+EPOCH = uuid.uuid4().hex[:8]
+AUDIO_TOPIC = "audio"
+
+
+class EventChannel:
+    def __init__(self, topic):
+        self.topic = topic
+        self.version = 0
+        self.closed = False
+        self._backlog = deque(maxlen=EVENT_BACKLOG)
+        self._condition = threading.Condition()
+
+    def publish(self, event_type, data):
+        with self._condition:
+            self.version += 1
+            event = {"version": self.version, "type": event_type, "data": data}
+            self._backlog.append(event)
+            self._condition.notify_all()
+            return event
+
+    def _since(self, version):
+        """(eventos posteriores a 'version', False si el historial ya no llega tan atrás)."""
+        if version == self.version:
+            return [], True
+        if version > self.version or not self._backlog or self._backlog[0]["version"] > version + 1:
+            return [], False
+        return list(islice(self._backlog, version + 1 - self._backlog[0]["version"], None)), True
+
+    def since(self, version):
+        with self._condition:
+            return self._since(version)
+
+    def wait(self, version, timeout):
+        """Espera hasta 'timeout' segundos a que haya eventos posteriores a 'version'."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version or self.closed, timeout)
+            return self._since(version)
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+_channels = {}
+_registry_lock = threading.Lock()
+
+def campaign_topic(campaign_id):
+    return f"campaign:{campaign_id}"
+
+def get_channel(topic):
+    with _registry_lock:
+        channel = _channels.get(topic)
+        if channel is None:
+            channel = EventChannel(topic)
+            _channels[topic] = channel
+        return channel
+
+def publish(topic, event_type, data):
+    return get_channel(topic).publish(event_type, data)
+
+def close_channel(topic):
+    """Cierra el canal (p.ej. campaña borrada): los suscriptores terminan tras el último evento."""
+    with _registry_lock:
+        channel = _channels.pop(topic, None)
+    if channel is not None:
+        channel.close()
+
+def publish_campaign(campaign_id, event_type, data):
+    return publish(campaign_topic(campaign_id), event_type, data)
+
+def publish_audio(event_type, data):
+    return publish(AUDIO_TOPIC, event_type, data)
+
+def channel_stats():
+    with _registry_lock:
+        return {topic: channel.version for topic, channel in _channels.items()}
+
+
+# --- Cambios de FileService ---
+# campaign-changed lleva solo las claves de metadata.json que cambiaron (el
+# 'framework' puede ser enorme): el cliente vuelve a pedir lo que necesite.
+# Se comparan huellas por clave con el último guardado visto por este proceso.
+_metadata_digests = {}  # campaign_id -> {clave: huella}
+_digests_lock = threading.Lock()
+
+def _changed_keys(campaign_id, metadata):
+    digests = {key: hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+               for key, value in metadata.items()}
+    with _digests_lock:
+        previous = _metadata_digests.get(campaign_id)
+        _metadata_digests[campaign_id] = digests
+    if previous is None:
+        return sorted(digests)
+    return sorted(key for key in digests.keys() | previous.keys() if digests.get(key) != previous.get(key))
+
+FILE_EVENTS = {
+    ("vault", "saved"): "item-changed", ("vault", "deleted"): "item-deleted",
+    ("sessions", "saved"): "session-changed", ("sessions", "deleted"): "session-deleted",
+}
+
+def on_file_event(event, path, data=None):
+    """Listener de FileService: traduce guardados/borrados a eventos de la campaña."""
+    if event == 'campaign_deleted':
+        campaign_id = os.path.basename(path)[len("campaign_"):]
+        with _digests_lock:
+            _metadata_digests.pop(campaign_id, None)
+        publish_campaign(campaign_id, "campaign-deleted", {"id": campaign_id})
+        close_channel(campaign_topic(campaign_id))
+        return
+    folder, filename = os.path.split(path)
+    if filename == "metadata.json":
+        campaign_dir = folder
+        kind = "metadata"
+    else:
+        campaign_dir, kind = os.path.split(folder)
+    if not os.path.basename(campaign_dir).startswith("campaign_"):
+        return
+    campaign_id = os.path.basename(campaign_dir)[len("campaign_"):]
+    if kind == "metadata":
+        if event == 'saved' and isinstance(data, dict):
+            keys = _changed_keys(campaign_id, data)
+            if keys:
+                publish_campaign(campaign_id, "campaign-changed", {"id": campaign_id, "keys": keys})
+        return
+    parser = index_service.parse_vault_filename if kind == "vault" else index_service.parse_session_filename
+    parsed = parser(filename)
+    event_type = FILE_EVENTS.get((kind, event))
+    # Un renombrado avisa del fichero viejo como borrado: el documento sigue existiendo
+    if not parsed or not event_type or (event == 'deleted' and data and data.get("moved_to")):
+        return
+    doc_id = parsed[0]
+    if event == 'saved':
+        # Copia: quien guarda puede seguir modificando su diccionario
+        key = "item" if kind == "vault" else "session"
+        publish_campaign(campaign_id, event_type, {"id": doc_id, key: clone_json(data)})
+    else:
+        publish_campaign(campaign_id, event_type, {"id": doc_id})
+
+
+# --- SSE ---
+def event_id(version):
+    return f"{EPOCH}-{version}"
+
+def parse_event_id(value):
+    """Versión de un Last-Event-ID de este arranque, o None."""
+    epoch, _, version = (value or "").partition("-")
+    if epoch != EPOCH or not version.isdigit():
+        return None
+    return int(version)
+
+def format_sse(data, event=None, event_id=None):
+    lines = [f"id: {event_id}"] if event_id else []
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+def stream(channel, last_event_id=None, heartbeat=EVENT_HEARTBEAT):
+    """Generador SSE del canal: 'hello' con la versión actual, los eventos y un comentario
+    cada 'heartbeat' segundos para detectar clientes desconectados."""
+    yield "retry: 3000\n\n"
+    version = parse_event_id(last_event_id)
+    if version is None:
+        # Conexión nueva, o de otro arranque (reset): se parte de la versión actual
+        version = channel.version
+        yield format_sse({"version": version, "epoch": EPOCH}, "reset" if last_event_id else "hello",
+                         event_id(version))
+    while True:
+        events, complete = channel.wait(version, heartbeat)
+        if not complete:
+            # Demasiado atrás (o de otro arranque): el cliente tiene que recargar
+            version = channel.version
+            yield format_sse({"version": version, "epoch": EPOCH}, "reset", event_id(version))
+            continue
+        for event in events:
+            yield format_sse(event, event["type"], event_id(event["version"]))
+        if events:
+            version = events[-1]["version"]
+        elif channel.closed:
+            return
+        else:
+            yield ": ping\n\n"
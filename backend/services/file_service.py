@@ -1,14 +1,39 @@
 import json
 import os
 import shutil
+from contextlib import ExitStack, contextmanager
+from services import index_service, snapshot_service, journal_service, lock_service, query_service, vector_service, write_buffer_service
+from services.cache_service import DocumentCache, clone_json, file_signature
+
+# Documentos parseados compartidos entre las instancias por petición
+DOC_CACHE_SIZE = int(os.getenv('DOC_CACHE_SIZE', '4096'))
 
 class FileService:
+    _doc_cache = DocumentCache(DOC_CACHE_SIZE)
+    # listener(evento, ruta absoluta, datos) tras cada escritura ('saved'), borrado
+    # ('deleted'; en un renombrado, datos = {"moved_to": ruta nueva}) o borrado de
+    # campaña ('campaign_deleted'); p.ej. índices de búsqueda y avisos en tiempo real.
+    # Con escritura diferida, tras volcar un directorio: ('flushed', directorio,
+    # {"before": firma del directorio antes del volcado}).
+    _listeners = []
+
     def __init__(self, storage_path):
         self.storage_path = storage_path
+        # Escritura diferida de vault/sesiones (WRITE_BEHIND_INTERVAL > 0)
+        self._buffer = None
+        if write_buffer_service.WRITE_BEHIND_INTERVAL > 0:
+            self._buffer = write_buffer_service.get_buffer(storage_path, FileService._cache_flushed,
+                                                           FileService._flushing)
 
     def _get_campaign_path(self, campaign_id):
         return os.path.join(self.storage_path, f"campaign_{campaign_id}")
 
+    def _get_vault_path(self, campaign_id):
+        return os.path.join(self._get_campaign_path(campaign_id), "vault")
+
+    def _get_sessions_path(self, campaign_id):
+        return os.path.join(self._get_campaign_path(campaign_id), "sessions")
+
     def create_campaign_structure(self, campaign_id):
         base_path = self._get_campaign_path(campaign_id)
         os.makedirs(base_path, exist_ok=True)
@@ -17,25 +42,288 @@ class FileService:
         return base_path
 
     def save_json(self, path, data):
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        self.save_json_many([(path, data)])
 
-    def load_json(self, path):
-        if not os.path.exists(path):
+    def save_json_many(self, docs):
+        """Guarda [(ruta, datos)] de forma atómica, en un solo grupo de commit si hay journal."""
+        if self._buffer:
+            direct = []
+            for path, data in docs:
+                path = os.path.abspath(path)
+                if self._buffer.accepts(path):
+                    self._buffer.put(path, clone_json(data))
+                    self._notify('saved', path, data)
+                else:
+                    direct.append((path, data))
+            if not direct:
+                return
+            docs = direct
+        writes = [(path, json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')) for path, data in docs]
+        journal_service.write_many(self.storage_path, writes)
+        for path, data in docs:
+            # Write-through: el llamante puede seguir mutando 'data', guardamos copia
+            path = os.path.abspath(path)
+            self._doc_cache.put(path, file_signature(path), clone_json(data))
+            self._notify('saved', path, data)
+
+    def peek_json(self, path):
+        """Documento compartido desde la caché. Solo lectura: no mutar el resultado."""
+        path = os.path.abspath(path)
+        if self._buffer:
+            data = self._buffer.get(path)
+            if data is not None:
+                return data
+        signature = file_signature(path)
+        if signature is None:
+            self._doc_cache.invalidate(path)
             return None
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        data = self._doc_cache.get(path, signature)
+        if data is None:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._doc_cache.put(path, signature, data)
+        return data
+
+    def load_json(self, path):
+        data = self.peek_json(path)
+        return clone_json(data) if data is not None else None
+
+    def lock(self, path):
+        """Bloqueo del fichero para ciclos leer -> modificar -> guardar."""
+        return lock_service.path_lock(path)
+
+    def etag(self, path):
+        path = os.path.abspath(path)
+        buffered = self._buffer.etag(path) if self._buffer else None
+        if buffered:
+            return buffered
+        signature = file_signature(path)
+        return f"{signature[0]:x}-{signature[1]:x}" if signature else None
+
+    def signature(self, path):
+        """Versión de un documento (firma en disco y, si la hay, su escritura pendiente)."""
+        path = os.path.abspath(path)
+        pending = self._buffer.generation(path) if self._buffer else None
+        signature = file_signature(path)
+        # Puede no estar aún en disco (recién renombrado) y tener ya una escritura pendiente
+        return (signature or ()) + (pending,) if pending else signature
+
+    def dir_signature(self, directory):
+        """Versión de un directorio: cambia con cada alta/baja y con cada escritura pendiente."""
+        directory = os.path.abspath(directory)
+        return file_signature(directory), self._buffer.dir_generation(directory) if self._buffer else 0
+
+    def flush_writes(self, paths=None):
+        """Vuelca a disco las escrituras diferidas (todas o las de 'paths')."""
+        if self._buffer:
+            self._buffer.flush({os.path.abspath(p) for p in paths} if paths is not None else None)
+
+    def _discard_pending(self, path):
+        if self._buffer:
+            self._buffer.discard(os.path.abspath(path))
+
+    @classmethod
+    def _cache_flushed(cls, path, signature, data):
+        cls._doc_cache.put(path, signature, data)
+
+    @classmethod
+    @contextmanager
+    def _flushing(cls, directories):
+        """Alrededor de un volcado diferido. Los documentos ya se aplicaron al snapshot y a
+        los listeners al guardarlos: solo cambia el mtime de los directorios, que se anota."""
+        snapshots = [snapshot_service.get_snapshot(os.path.dirname(d)) for d in sorted(directories)
+                     if os.path.basename(d) == "vault"] if snapshot_service.VAULT_SNAPSHOT_ENABLED else []
+        with ExitStack() as stack:
+            fresh = []
+            for snapshot in snapshots:
+                stack.enter_context(snapshot.lock)
+                fresh.append(snapshot.is_fresh())
+            before = {directory: file_signature(directory) for directory in directories}
+            yield
+            for snapshot, was_fresh in zip(snapshots, fresh):
+                snapshot.append_sync(was_fresh)
+        for directory, signature in before.items():
+            cls._notify('flushed', directory, {"before": signature})
+
+    @classmethod
+    def cache_stats(cls):
+        return cls._doc_cache.stats()
+
+    @classmethod
+    def add_listener(cls, listener):
+        if listener not in cls._listeners:
+            cls._listeners.append(listener)
+
+    @classmethod
+    def _notify(cls, event, path, data=None):
+        for listener in cls._listeners:
+            try:
+                listener(event, os.path.abspath(path), data)
+            except Exception as e:
+                print(f"Aviso: fallo al notificar '{event}' de '{path}': {e}")
+
+    # --- Índices id -> fichero ---
+    def vault_index(self, campaign_id):
+        return index_service.get_index(self._get_vault_path(campaign_id), index_service.parse_vault_filename)
+
+    def sessions_index(self, campaign_id):
+        return index_service.get_index(self._get_sessions_path(campaign_id), index_service.parse_session_filename)
+
+    def find_vault_item(self, campaign_id, item_id):
+        """Ruta del fichero del item o None."""
+        return self.vault_index(campaign_id).path_for(item_id)
+
+    def find_session(self, campaign_id, session_id):
+        """Ruta del fichero de la sesión o None."""
+        return self.sessions_index(campaign_id).path_for(session_id)
+
+    def _save_indexed(self, index, doc_id, filename, data):
+        """Guarda un documento indexado; si su nombre de fichero cambia, renombra."""
+        previous = index.get(doc_id)
+        path = os.path.join(index.path, filename)
+        self.save_json(path, data)
+        if previous and previous["filename"] != filename:
+            old_path = os.path.join(index.path, previous["filename"])
+            self._discard_pending(old_path)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+            self._doc_cache.invalidate(os.path.abspath(old_path))
+            self._notify('deleted', old_path, {"moved_to": os.path.abspath(path)})
+        if previous and previous["filename"] == filename:
+            index.sync_mtime()
+        else:
+            index.add(filename)
+        return path
+
+    def _delete_indexed(self, index, doc_id):
+        path = index.path_for(doc_id)
+        if not path:
+            return False
+        self._discard_pending(path)
+        if os.path.exists(path):
+            os.remove(path)
+        self._doc_cache.invalidate(os.path.abspath(path))
+        index.remove(doc_id)
+        self._notify('deleted', path)
+        return True
+
+    # --- Vault ---
+    def vault_snapshot(self, campaign_id):
+        return snapshot_service.get_snapshot(self._get_campaign_path(campaign_id))
+
+    def list_vault_items(self, campaign_id):
+        """Todos los items del vault (instancias compartidas, solo lectura)."""
+        if snapshot_service.VAULT_SNAPSHOT_ENABLED:
+            return self.vault_snapshot(campaign_id).list_items(self.peek_json)
+        vault_path = self._get_vault_path(campaign_id)
+        items = []
+        if os.path.exists(vault_path):
+            for filename in os.listdir(vault_path):
+                if filename.endswith(".json"):
+                    item = self.peek_json(os.path.join(vault_path, filename))
+                    if item:
+                        items.append(item)
+        return items
+
+    def list_vault_items_sorted(self, campaign_id, item_type=None, status=None, tags=None):
+        """(ids ordenados, items) que cumplen los filtros, para paginar por cursor sin
+        reordenar ni recorrer el vault en cada petición."""
+        if snapshot_service.VAULT_SNAPSHOT_ENABLED:
+            return self.vault_snapshot(campaign_id).filtered_items(self.peek_json, item_type, status, tags)
+        items = sorted((i for i in self.list_vault_items(campaign_id)
+                        if query_service.matches(i, item_type, status, tags)), key=lambda i: i['id'])
+        return [i['id'] for i in items], items
+
+    def rebuild_vault_snapshot(self, campaign_id):
+        return self.vault_snapshot(campaign_id).rebuild(self.peek_json)
+
+    def save_vault_item(self, campaign_id, item):
+        snapshot = self.vault_snapshot(campaign_id)
+        with snapshot.lock:
+            was_fresh = snapshot_service.VAULT_SNAPSHOT_ENABLED and snapshot.is_fresh()
+            path = self._save_indexed(self.vault_index(campaign_id), item['id'],
+                                      f"{item['type']}_{item['id']}.json", item)
+            snapshot.append_put(item, was_fresh)
+        return path
+
+    def update_vault_items(self, campaign_id, updates, apply_fn):
+        """Aplica apply_fn(item, cambios) a varios items con una sola pasada por el índice
+        y un único append al snapshot. updates: lista de dicts con 'id'.
+
+        Devuelve una lista de (id, item actualizado o None si no existe).
+        """
+        index = self.vault_index(campaign_id)
+        snapshot = self.vault_snapshot(campaign_id)
+        results = []
+        saved = {}  # id -> (ruta final, item): un id repetido sigue sobre su copia ya modificada
+        entries = index.entries_snapshot()
+        paths = [os.path.join(index.path, entries[c.get('id')]["filename"]) for c in updates if c.get('id') in entries]
+        # Orden de bloqueo: ficheros y luego snapshot (igual que en save_vault_item)
+        with lock_service.path_locks(paths), snapshot.lock:
+            was_fresh = snapshot_service.VAULT_SNAPSHOT_ENABLED and snapshot.is_fresh()
+            for change in updates:
+                item_id = change.get('id')
+                entry = entries.get(item_id)
+                if item_id in saved:
+                    item = saved[item_id][1]
+                else:
+                    item = self.load_json(os.path.join(index.path, entry["filename"])) if entry else None
+                if item is None:
+                    results.append((item_id, None))
+                    continue
+                apply_fn(item, change)
+                # Copia: cada resultado refleja el item tras su propio cambio
+                results.append((item_id, clone_json(item)))
+                saved[item_id] = (os.path.join(index.path, f"{item['type']}_{item['id']}.json"), item)
+            renamed = [(entries[item_id]["filename"], os.path.basename(path))
+                       for item_id, (path, _) in saved.items()
+                       if os.path.basename(path) != entries[item_id]["filename"]]
+            # Un único grupo de escritura para todos los items
+            self.save_json_many(list(saved.values()))
+            for old_filename, filename in renamed:
+                old_path = os.path.join(index.path, old_filename)
+                self._discard_pending(old_path)
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+                self._doc_cache.invalidate(os.path.abspath(old_path))
+                self._notify('deleted', old_path, {"moved_to": os.path.abspath(os.path.join(index.path, filename))})
+                index.add(filename)
+            index.sync_mtime()
+            snapshot.append_puts([item for _, item in saved.values()], was_fresh)
+        return results
+
+    def delete_vault_item(self, campaign_id, item_id):
+        snapshot = self.vault_snapshot(campaign_id)
+        with snapshot.lock:
+            was_fresh = snapshot_service.VAULT_SNAPSHOT_ENABLED and snapshot.is_fresh()
+            deleted = self._delete_indexed(self.vault_index(campaign_id), item_id)
+            if deleted:
+                snapshot.append_delete(item_id, was_fresh)
+        return deleted
+
+    # --- Sesiones ---
+
+    def save_session(self, campaign_id, session):
+        return self._save_indexed(self.sessions_index(campaign_id), session['id'],
+                                  f"session_{session.get('number', 0):02d}_{session['id']}.json", session)
+
+    def delete_session(self, campaign_id, session_id):
+        return self._delete_indexed(self.sessions_index(campaign_id), session_id)
+
+    def next_session_number(self, campaign_id):
+        numbers = [e["number"] or 0 for e in self.sessions_index(campaign_id).entries_snapshot().values()]
+        return max(numbers) + 1 if numbers else 1
 
     def list_campaigns(self):
         campaigns = []
         if not os.path.exists(self.storage_path):
             return campaigns
-            
+
         for item in os.listdir(self.storage_path):
             if item.startswith("campaign_") and os.path.isdir(os.path.join(self.storage_path, item)):
                 campaign_id = item.replace("campaign_", "")
                 metadata_path = os.path.join(self.storage_path, item, "metadata.json")
-                metadata = self.load_json(metadata_path)
+                metadata = self.peek_json(metadata_path)
                 if metadata:
                     campaigns.append(metadata)
         return campaigns
@@ -43,6 +331,13 @@ class FileService:
     def delete_campaign(self, campaign_id):
         path = self._get_campaign_path(campaign_id)
         if os.path.exists(path):
+            if self._buffer:
+                self._buffer.discard_prefix(os.path.abspath(path) + os.sep)
             shutil.rmtree(path)
+            index_service.drop_indexes(path)
+            snapshot_service.drop_snapshot(path)
+            vector_service.drop_index(path)
+            self._notify('campaign_deleted', path)
+            self._doc_cache.invalidate_prefix(os.path.abspath(path) + os.sep)
             return True
         return False
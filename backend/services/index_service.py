@@ -0,0 +1,115 @@
+import os
+import threading
+
+# Índice en memoria id -> fichero para los directorios vault/ y sessions/ de cada campaña.
+# Se construye una vez, lo mantiene FileService en sus altas/bajas/renombrados y se
+# reconstruye si cambia el mtime del directorio (ediciones externas).
+
+def parse_vault_filename(filename):
+    """{type}_{uuid}.json -> (id, entrada)"""
+    if not filename.endswith(".json"):
+        return None
+    item_type, sep, item_id = filename[:-5].rpartition("_")
+    if not sep or not item_type:
+        return None
+    return item_id, {"filename": filename, "type": item_type, "number": None}
+
+def parse_session_filename(filename):
+    """session_{nn}_{uuid}.json -> (id, entrada)"""
+    if not filename.endswith(".json"):
+        return None
+    parts = filename[:-5].split("_", 2)
+    if len(parts) != 3 or parts[0] != "session":
+        return None
+    try:
+        number = int(parts[1])
+    except ValueError:
+        number = None
+    return parts[2], {"filename": filename, "type": "session", "number": number}
+
+
+class DirectoryIndex:
+    def __init__(self, path, parser):
+        self.path = path
+        self.parser = parser
+        self.entries = {}
+        self.mtime_ns = None
+        self.built = False
+        self.lock = threading.RLock()
+
+    def _dir_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self):
+        mtime_ns = self._dir_mtime()
+        if self.built and mtime_ns == self.mtime_ns:
+            return
+        entries = {}
+        if mtime_ns is not None:
+            for filename in os.listdir(self.path):
+                parsed = self.parser(filename)
+                if parsed:
+                    entries[parsed[0]] = parsed[1]
+        self.entries = entries
+        self.mtime_ns = mtime_ns
+        self.built = True
+
+    def get(self, doc_id):
+        with self.lock:
+            self._refresh()
+            entry = self.entries.get(doc_id)
+            return dict(entry) if entry else None
+
+    def path_for(self, doc_id):
+        entry = self.get(doc_id)
+        return os.path.join(self.path, entry["filename"]) if entry else None
+
+    def entries_snapshot(self):
+        with self.lock:
+            self._refresh()
+            return {k: dict(v) for k, v in self.entries.items()}
+
+    def add(self, filename):
+        """Registra un fichero escrito por nosotros (alta o renombrado)."""
+        parsed = self.parser(filename)
+        if not parsed:
+            return
+        with self.lock:
+            self._refresh()
+            self.entries[parsed[0]] = parsed[1]
+            self.mtime_ns = self._dir_mtime()
+
+    def remove(self, doc_id):
+        with self.lock:
+            self._refresh()
+            self.entries.pop(doc_id, None)
+            self.mtime_ns = self._dir_mtime()
+
+    def sync_mtime(self):
+        """Tras reescribir un fichero ya indexado (sin cambiar el listado)."""
+        with self.lock:
+            if self.built:
+                self.mtime_ns = self._dir_mtime()
+
+
+_indexes = {}
+_registry_lock = threading.Lock()
+
+def get_index(path, parser):
+    key = os.path.abspath(path)
+    with _registry_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = DirectoryIndex(key, parser)
+            _indexes[key] = index
+        return index
+
+def drop_indexes(prefix):
+    """Olvida los índices bajo un directorio (p.ej. al borrar una campaña)."""
+    prefix = os.path.abspath(prefix) + os.sep
+    with _registry_lock:
+        for key in [k for k in _indexes if k.startswith(prefix)]:
+            del _indexes[key]
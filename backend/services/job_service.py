@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Cola de trabajos en segundo plano con estado consultable (GET /api/jobs/<id>).
+# Los trabajos reciben un 'job' con job.progress(fracción, mensaje) para informar.
+# El trabajo pesado de CPU se delega con run_in_process() a un pool de procesos.
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+PROCESS_WORKERS = int(os.getenv('TRANSCODE_WORKERS', '1'))
+MAX_FINISHED_JOBS = 200
+
+
+class Job:
+    def __init__(self, kind, params=None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.params = params or {}
+        self.status = "queued"
+        self.progress_value = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    def progress(self, value, message=None):
+        self.progress_value = max(0.0, min(1.0, value))
+        if message is not None:
+            self.message = message
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "progress": round(self.progress_value, 4),
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, params=None, **kwargs):
+        job = Job(kind, params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "done"
+            job.progress(1.0)
+        except Exception as e:
+            job.status = "error"
+            job.error = str(e)
+            print(f"Error en trabajo {job.kind} ({job.id}): {e}")
+            traceback.print_exc()
+        finally:
+            job.finished = time.time()
+
+    def _trim(self):
+        finished = [j for j in self._jobs.values() if j.finished]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, kind=None):
+        with self._lock:
+            return [j for j in self._jobs.values() if kind is None or j.kind == kind]
+
+
+jobs = JobQueue(JOB_WORKERS)
+
+_process_pool = None
+_pool_lock = threading.Lock()
+
+def run_in_process(fn, *args):
+    """Ejecuta fn(*args) en el pool de procesos compartido y espera el resultado."""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS)
+    return _process_pool.submit(fn, *args).result()
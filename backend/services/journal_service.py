@@ -0,0 +1,270 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import zlib
+from services.cache_service import file_signature
+
+# Escrituras atómicas (fichero temporal + os.replace) y journal opcional con
+# group commit: las ráfagas de autoguardado se agrupan en un único fsync del
+# journal, se aplican a los ficheros destino y el journal se trunca en cada
+# checkpoint y al cerrar el proceso (close_all). Al arrancar, recover() reaplica
+# lo que quedase en el journal de un proceso muerto, pero solo los registros cuyo
+# fichero destino sigue como estaba antes de esa escritura: lo ya aplicado o
+# sobrescrito después por otro worker no se toca.
+
+TMP_SUFFIX = ".tmp"
+JOURNAL_DIRNAME = ".journal"
+
+WRITE_FSYNC = os.getenv('WRITE_FSYNC', '1') != '0'
+WRITE_JOURNAL = os.getenv('WRITE_JOURNAL', '0') == '1'
+JOURNAL_GROUP_WINDOW = float(os.getenv('JOURNAL_GROUP_WINDOW_MS', '5')) / 1000
+JOURNAL_CHECKPOINT_BYTES = int(os.getenv('JOURNAL_CHECKPOINT_BYTES', str(4 * 1024 * 1024)))
+JOURNAL_CHECKPOINT_INTERVAL = float(os.getenv('JOURNAL_CHECKPOINT_INTERVAL', '5'))
+
+def _fsync_dir(path):
+    # En Windows no se puede abrir un directorio; el rename ya es atómico allí
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _fsync_path(path):
+    try:
+        with open(path, 'rb') as f:
+            os.fsync(f.fileno())
+    except FileNotFoundError:
+        pass
+
+def atomic_write_bytes(path, payload, fsync=WRITE_FSYNC):
+    """Escribe en un temporal del mismo directorio y lo renombra sobre el destino."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=TMP_SUFFIX, dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if fsync:
+        _fsync_dir(directory)
+
+
+class WriteJournal:
+    """Journal de escritura anticipada con group commit (uno por proceso y raíz)."""
+
+    def __init__(self, root):
+        self.dir = os.path.join(root, JOURNAL_DIRNAME)
+        os.makedirs(self.dir, exist_ok=True)
+        self.path = os.path.join(self.dir, f"journal-{os.getpid()}.log")
+        self._queue = queue.Queue()
+        self._dirty = set()
+        self._last_checkpoint = time.monotonic()
+        self._lock = threading.Lock()
+        self.commits = 0
+        self.writes = 0
+        self._file = open(self.path, 'ab')
+        self._thread = threading.Thread(target=self._run, name="write-journal", daemon=True)
+        self._thread.start()
+
+    def submit_many(self, writes):
+        """Encola [(ruta, bytes)] y espera a que estén en el journal y aplicados."""
+        done = threading.Event()
+        request = {"writes": list(writes), "done": done, "error": None}
+        self._queue.put(request)
+        done.wait()
+        if request["error"]:
+            raise request["error"]
+
+    def submit(self, path, payload):
+        self.submit_many([(path, payload)])
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + JOURNAL_GROUP_WINDOW
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                with self._lock:
+                    self._commit(batch)
+            except Exception as e:
+                for request in batch:
+                    request["error"] = e
+            for request in batch:
+                request["done"].set()
+
+    def _commit(self, batch):
+        # Coalescer: si la misma ruta llega varias veces en el grupo, gana la última
+        latest = {}
+        for request in batch:
+            for path, payload in request["writes"]:
+                latest[os.path.abspath(path)] = payload
+        if self._file.closed:
+            # Proceso cerrándose (close_all): escritura directa
+            for path, payload in latest.items():
+                atomic_write_bytes(path, payload, fsync=True)
+            return
+        lines = []
+        for path, payload in latest.items():
+            text = payload.decode('utf-8')
+            # Firma previa del destino: recover() solo reaplica si el fichero sigue así
+            prev = file_signature(path)
+            lines.append(json.dumps({"path": path, "data": text, "crc": zlib.crc32(payload),
+                                     "prev": list(prev) if prev else None}, ensure_ascii=False) + "\n")
+        self._file.write("".join(lines).encode('utf-8'))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        for path, payload in latest.items():
+            atomic_write_bytes(path, payload, fsync=False)
+            self._dirty.add(path)
+        self.commits += 1
+        self.writes += len(latest)
+        if (self._file.tell() >= JOURNAL_CHECKPOINT_BYTES or
+                time.monotonic() - self._last_checkpoint >= JOURNAL_CHECKPOINT_INTERVAL):
+            self._checkpoint()
+
+    def _checkpoint(self):
+        # Los ficheros aplicados pasan a disco; a partir de aquí el journal sobra
+        for path in self._dirty:
+            _fsync_path(path)
+        for directory in {os.path.dirname(p) for p in self._dirty}:
+            _fsync_dir(directory)
+        self._dirty.clear()
+        self._file.truncate(0)
+        self._file.seek(0)
+        os.fsync(self._file.fileno())
+        self._last_checkpoint = time.monotonic()
+
+    def close(self):
+        """Checkpoint final y borrado del journal: en un cierre limpio no queda nada que reaplicar."""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._checkpoint()
+            self._file.close()
+            os.remove(self.path)
+
+    def stats(self):
+        return {"commits": self.commits, "writes": self.writes, "pending": self._queue.qsize()}
+
+
+_journals = {}
+_registry_lock = threading.Lock()
+
+def get_journal(root):
+    key = os.path.abspath(root)
+    with _registry_lock:
+        journal = _journals.get(key)
+        if journal is None:
+            journal = WriteJournal(key)
+            _journals[key] = journal
+        return journal
+
+def write_many(root, writes):
+    """Escritura durable de [(ruta, bytes)]: por el journal de 'root' si está activo."""
+    if WRITE_JOURNAL:
+        get_journal(root).submit_many(writes)
+    else:
+        for path, payload in writes:
+            atomic_write_bytes(path, payload)
+
+def close_all():
+    """Cierra los journals de este proceso (al salir, después de volcar la escritura diferida)."""
+    with _registry_lock:
+        journals = list(_journals.values())
+    for journal in journals:
+        try:
+            journal.close()
+        except Exception as e:
+            print(f"Error cerrando el journal '{journal.path}': {e}")
+
+def journal_stats():
+    with _registry_lock:
+        return {root: journal.stats() for root, journal in _journals.items()}
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        return False  # os.kill(pid, 0) terminaría el proceso en Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def recover(root):
+    """Reaplica journals pendientes y elimina temporales huérfanos bajo 'root'."""
+    replayed = 0
+    journal_dir = os.path.join(root, JOURNAL_DIRNAME)
+    if os.path.isdir(journal_dir):
+        logs = [os.path.join(journal_dir, f) for f in os.listdir(journal_dir) if f.endswith(".log")]
+        logs.sort(key=os.path.getmtime)
+        for log_path in logs:
+            # No tocar journals de otros workers que siguen vivos
+            try:
+                pid = int(os.path.basename(log_path)[len("journal-"):-len(".log")])
+            except ValueError:
+                pid = None
+            if log_path in {j.path for j in _journals.values()}:
+                continue
+            if pid is not None and pid != os.getpid() and _pid_alive(pid):
+                continue
+            # Rutas ya reaplicadas desde este journal: sus registros posteriores van detrás
+            rewritten = set()
+            with open(log_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        payload = record["data"].encode('utf-8')
+                    except (ValueError, KeyError):
+                        break  # Registro truncado por el corte: lo anterior ya es consistente
+                    if zlib.crc32(payload) != record.get("crc"):
+                        break
+                    path = record["path"]
+                    current = file_signature(path)
+                    if path not in rewritten and (list(current) if current else None) != record.get("prev"):
+                        continue  # Ya aplicado, o sobrescrito después por otro proceso
+                    atomic_write_bytes(path, payload, fsync=True)
+                    rewritten.add(path)
+                    replayed += 1
+            os.remove(log_path)
+
+    # Temporales de escrituras interrumpidas (con margen por si otro worker está escribiendo)
+    removed = 0
+    cutoff = time.time() - 60
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != JOURNAL_DIRNAME]
+        for filename in filenames:
+            if filename.startswith(".") and filename.endswith(TMP_SUFFIX):
+                tmp_path = os.path.join(dirpath, filename)
+                if os.path.getmtime(tmp_path) < cutoff:
+                    os.remove(tmp_path)
+                    removed += 1
+    if replayed or removed:
+        print(f"Recuperación de '{root}': {replayed} escrituras reaplicadas, {removed} temporales eliminados.")
+    return replayed, removed
@@ -0,0 +1,305 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from services.cache_service import file_signature
+from services.journal_service import WRITE_FSYNC, atomic_write_bytes, write_many
+from services.lock_service import path_lock
+
+# Almacenes clave -> valor para los datos de audio (metadatos, presets, órdenes).
+#  - LogStore (por defecto): log de registros JSONL (put/del/mv) que solo se
+#    añade; cada cambio escribe una línea, sin reescribir el resto. Se compacta
+#    cuando el log crece más del doble que los datos vivos. Otros procesos se
+#    ponen al día leyendo desde su último offset; la primera línea identifica la
+#    generación del fichero y, si cambia (compactado por otro), se relee entero.
+#  - JsonStore: el formato original de un JSON entero por colección.
+# DATA_BACKEND=json vuelve al formato antiguo; con 'log' los JSON existentes se
+# migran solos la primera vez (el original queda como '.migrated').
+
+DATA_BACKEND = os.getenv('DATA_BACKEND', 'log')
+COMPACT_MIN_RECORDS = 64
+MIGRATED_SUFFIX = ".migrated"
+
+
+def _quarantine(path):
+    corrupt_path = f"{path}.corrupt-{int(time.time())}"
+    os.replace(path, corrupt_path)
+    print(f"Aviso: '{path}' estaba corrupto, movido a '{corrupt_path}'.")
+
+def _rename_prefix(data, old_prefix, new_prefix):
+    moved = [k for k in data if k.startswith(old_prefix)]
+    for key in moved:
+        data[new_prefix + key[len(old_prefix):]] = data.pop(key)
+    return len(moved)
+
+
+class LogStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path
+        self._data = {}
+        self._header = None
+        self._offset = 0
+        self._records = 0
+        self._lock = threading.RLock()
+
+    # --- lectura del log ---
+    def _reset(self):
+        self._data = {}
+        self._header = None
+        self._offset = 0
+        self._records = 0
+
+    def _apply(self, record):
+        op = record.get("op")
+        if op == "put":
+            self._data[record["k"]] = record["v"]
+        elif op == "del":
+            self._data.pop(record["k"], None)
+        elif op == "mv":
+            _rename_prefix(self._data, record["from"], record["to"])
+        else:
+            return
+        self._records += 1
+
+    def _catch_up(self):
+        """Aplica lo añadido al log desde el último offset leído (por este u otro proceso)."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            if self._offset:
+                self._reset()
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if self._header is not None and (size < self._offset or f.readline() != self._header):
+                self._reset()  # compactado por otro proceso: se relee entero
+            if size == self._offset:
+                return
+            f.seek(self._offset)
+            chunk = f.read()
+        # Solo líneas completas: una escritura en curso se leerá en la siguiente pasada
+        end = chunk.rfind(b'\n') + 1
+        if self._offset == 0 and end:
+            self._header = chunk[:chunk.find(b'\n') + 1]
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError):
+                print(f"Aviso: registro ilegible en '{self.path}', se ignora.")
+        self._offset += end
+
+    # --- escritura ---
+    @contextmanager
+    def _writing(self):
+        with path_lock(self.path), self._lock:
+            self._catch_up()
+            if not os.path.exists(self.path):
+                self._rewrite({})
+            # Con el bloqueo tomado nadie más escribe: una línea a medias es de un corte
+            elif os.path.getsize(self.path) > self._offset:
+                with open(self.path, 'r+b') as f:
+                    f.truncate(self._offset)
+            yield
+
+    def _append(self, records):
+        if not records:
+            return
+        payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(payload)
+            if WRITE_FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        self._catch_up()
+        if self._records > 2 * len(self._data) + COMPACT_MIN_RECORDS:
+            self._rewrite(self._data)
+
+    def _rewrite(self, data):
+        lines = [json.dumps({"op": "gen", "id": uuid.uuid4().hex}) + "\n"]
+        lines.extend(json.dumps({"op": "put", "k": k, "v": v}, ensure_ascii=False) + "\n" for k, v in data.items())
+        payload = "".join(lines).encode('utf-8')
+        atomic_write_bytes(self.path, payload)
+        self._reset()
+        self._catch_up()
+
+    def put(self, key, value):
+        with self._writing():
+            self._append([{"op": "put", "k": key, "v": value}])
+
+    def update(self, key, fields):
+        """Mezcla 'fields' en el valor (dict) de 'key', creándolo si no existe."""
+        with self._writing():
+            value = dict(self._data.get(key) or {})
+            value.update(fields)
+            self._append([{"op": "put", "k": key, "v": value}])
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        with self._writing():
+            records = [{"op": "del", "k": k} for k in dict.fromkeys(keys) if k in self._data]
+            self._append(records)
+            return len(records)
+
+    def rename(self, old_key, new_key):
+        with self._writing():
+            if old_key in self._data and old_key != new_key:
+                self._append([{"op": "put", "k": new_key, "v": self._data[old_key]},
+                              {"op": "del", "k": old_key}])
+
+    def rename_prefix(self, old_prefix, new_prefix):
+        """Renombra todas las claves que empiezan por old_prefix con un único registro."""
+        with self._writing():
+            count = sum(1 for k in self._data if k.startswith(old_prefix))
+            if count and old_prefix != new_prefix:
+                self._append([{"op": "mv", "from": old_prefix, "to": new_prefix}])
+            return count
+
+    def replace_all(self, data):
+        with self._writing():
+            self._rewrite(dict(data))
+
+    # --- consulta ---
+    def get(self, key, default=None):
+        with self._lock:
+            self._catch_up()
+            return self._data.get(key, default)
+
+    def all(self):
+        """Copia superficial: los valores son compartidos y no deben modificarse."""
+        with self._lock:
+            self._catch_up()
+            return dict(self._data)
+
+    def keys(self, prefix=""):
+        with self._lock:
+            self._catch_up()
+            return [k for k in self._data if k.startswith(prefix)]
+
+    def signature(self):
+        """Cambia con cada escritura (para ETags de respuestas derivadas)."""
+        with self._lock:
+            self._catch_up()
+            return (self._header, self._offset)
+
+    # --- migración ---
+    def migrate_from(self, json_path, list_key=None):
+        """Importa un JSON del formato antiguo si el log todavía no existe."""
+        if os.path.exists(self.path) or not os.path.exists(json_path):
+            return
+        with path_lock(self.path), self._lock:
+            if os.path.exists(self.path) or not os.path.exists(json_path):
+                return
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    data = _to_dict(json.load(f), list_key)
+            except ValueError:
+                _quarantine(json_path)
+                return
+            self._rewrite(data)
+            os.replace(json_path, json_path + MIGRATED_SUFFIX)
+            print(f"Migrados {len(data)} registros de '{json_path}' a '{self.path}'.")
+
+
+def _to_dict(raw, list_key):
+    if list_key and isinstance(raw, list):
+        return {item[list_key]: item for item in raw}
+    return dict(raw or {})
+
+
+class JsonStore:
+    """Formato original: la colección entera en un JSON que se reescribe en cada cambio."""
+
+    def __init__(self, path, list_key=None, indent=4):
+        self.path = path
+        self.lock_path = path
+        self.list_key = list_key
+        self.indent = indent
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return _to_dict(json.load(f), self.list_key)
+        except ValueError:
+            # JSON corrupto: apartarlo en vez de devolver vacío y machacarlo al guardar
+            _quarantine(self.path)
+            return {}
+
+    def _save(self, data):
+        raw = list(data.values()) if self.list_key else data
+        payload = json.dumps(raw, indent=self.indent).encode('utf-8')
+        write_many(os.path.dirname(self.path), [(self.path, payload)])
+
+    @contextmanager
+    def _editing(self):
+        with path_lock(self.path):
+            data = self._load()
+            yield data
+            self._save(data)
+
+    def put(self, key, value):
+        with self._editing() as data:
+            data[key] = value
+
+    def update(self, key, fields):
+        with self._editing() as data:
+            data.setdefault(key, {}).update(fields)
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        with self._editing() as data:
+            removed = [k for k in dict.fromkeys(keys) if data.pop(k, None) is not None]
+            return len(removed)
+
+    def rename(self, old_key, new_key):
+        with self._editing() as data:
+            if old_key in data:
+                data[new_key] = data.pop(old_key)
+
+    def rename_prefix(self, old_prefix, new_prefix):
+        with self._editing() as data:
+            return _rename_prefix(data, old_prefix, new_prefix)
+
+    def replace_all(self, data):
+        with path_lock(self.path):
+            self._save(dict(data))
+
+    def get(self, key, default=None):
+        return self._load().get(key, default)
+
+    def all(self):
+        return self._load()
+
+    def keys(self, prefix=""):
+        return [k for k in self._load() if k.startswith(prefix)]
+
+    def signature(self):
+        return file_signature(self.path)
+
+
+_stores = {}
+_registry_lock = threading.Lock()
+
+def open_store(json_path, list_key=None, indent=4):
+    """Almacén de la colección cuyo fichero JSON original es 'json_path'."""
+    key = (os.path.abspath(json_path), DATA_BACKEND)
+    with _registry_lock:
+        store = _stores.get(key)
+        if store is None:
+            if DATA_BACKEND == 'json':
+                store = JsonStore(json_path, list_key, indent)
+            else:
+                store = LogStore(os.path.splitext(json_path)[0] + '.log')
+                store.migrate_from(json_path, list_key)
+            _stores[key] = store
+        return store
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import ExitStack, contextmanager
+from flask import jsonify
+
+try:
+    import fcntl  # Solo POSIX: bloqueo entre procesos (varios workers)
+except ImportError:
+    fcntl = None
+
+# Bloqueos por ruta para los ciclos leer -> modificar -> guardar. En el proceso
+# se usa un RLock por fichero; si hay fcntl se añade un flock sobre un fichero
+# de bloqueo fuera del árbol de datos, para que varios workers no se pisen.
+
+LOCK_DIR = os.getenv('LOCK_DIR', os.path.join(tempfile.gettempdir(), 'rolap-locks'))
+
+
+class PathLock:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        self._lock.acquire()
+        self._depth += 1
+        if self._depth == 1 and fcntl is not None:
+            try:
+                os.makedirs(LOCK_DIR, exist_ok=True)
+                name = hashlib.sha1(self.path.encode('utf-8')).hexdigest() + ".lock"
+                self._fd = os.open(os.path.join(LOCK_DIR, name), os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self.release()
+                raise
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+
+_locks = {}
+_registry_lock = threading.Lock()
+
+def _get_lock(path):
+    key = os.path.abspath(path)
+    with _registry_lock:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = PathLock(key)
+            _locks[key] = lock
+        return lock
+
+@contextmanager
+def path_lock(path):
+    lock = _get_lock(path)
+    lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+
+@contextmanager
+def path_locks(paths):
+    """Varios bloqueos a la vez, siempre en el mismo orden para no interbloquear."""
+    with ExitStack() as stack:
+        for path in sorted({os.path.abspath(p) for p in paths}):
+            stack.enter_context(path_lock(path))
+        yield
+
+# --- ETag / If-Match para las rutas PUT ---
+def precondition_failed(request, current_etag):
+    """Respuesta 412 si el cliente envió If-Match y no coincide con la versión en disco."""
+    if request.if_match and current_etag not in request.if_match:
+        return jsonify({"error": "Precondition failed", "etag": current_etag}), 412
+    return None
+
+def with_etag(request, response, etag):
+    """Añade el ETag y resuelve If-None-Match (304) en respuestas GET."""
+    if etag:
+        response.set_etag(etag)
+        if request.method == 'GET':
+            response.make_conditional(request)
+    return response
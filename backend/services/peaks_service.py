@@ -0,0 +1,191 @@
+import os
+import struct
+import subprocess
+import wave
+from services.journal_service import atomic_write_bytes
+from services.job_service import run_in_process
+from services.transcode_service import FFMPEG, TRANSCODE_TIMEOUT, audioop, fingerprint
+
+# Duración, frecuencia de muestreo, canales y forma de onda reducida de cada pista,
+# precalculadas para que la interfaz dibuje y busque sin descargar el audio.
+# Las cabeceras de WAV/MP3/OGG se leen en Python puro; los picos necesitan
+# decodificar (módulo wave para WAV, ffmpeg para el resto si está disponible).
+# Se guardan en un sidecar binario por huella: cabecera + un byte (0-255) por tramo.
+
+PEAKS_BUCKETS = int(os.getenv('PEAKS_BUCKETS', '1024'))
+PEAKS_MAGIC = b'RPKS'
+PEAKS_HEADER = struct.Struct('<4sBIHdI')  # magic, versión, sample rate, canales, duración, nº de picos
+PEAKS_VERSION = 1
+DECODE_RATE = 8000  # ffmpeg: mono a 8 kHz basta para la forma de onda
+
+# --- Cabeceras ---
+_MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1 Layer III
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],      # MPEG-2/2.5 Layer III
+}
+_MP3_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def _wav_info(path):
+    with wave.open(path, 'rb') as reader:
+        rate = reader.getframerate()
+        return {"duration": reader.getnframes() / rate if rate else 0,
+                "sampleRate": rate, "channels": reader.getnchannels()}
+
+def _mp3_info(path):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(10)
+        offset = 0
+        if head[:3] == b'ID3':
+            offset = 10 + ((head[6] & 0x7f) << 21 | (head[7] & 0x7f) << 14 | (head[8] & 0x7f) << 7 | (head[9] & 0x7f))
+        f.seek(offset)
+        buf = f.read(64 * 1024)
+    for i in range(len(buf) - 4):
+        if buf[i] != 0xFF or buf[i + 1] & 0xE0 != 0xE0:
+            continue
+        version = (buf[i + 1] >> 3) & 3
+        layer = (buf[i + 1] >> 1) & 3
+        br_idx, sr_idx = buf[i + 2] >> 4, (buf[i + 2] >> 2) & 3
+        if version == 1 or layer != 1 or br_idx in (0, 15) or sr_idx == 3:
+            continue  # no es una cabecera de trama Layer III válida
+        rate = _MP3_RATES[version][sr_idx]
+        bitrate = _MP3_BITRATES[1 if version == 3 else 2][br_idx] * 1000
+        channels = 1 if buf[i + 3] >> 6 == 3 else 2
+        samples_per_frame = 1152 if version == 3 else 576
+        # Cabecera Xing/Info (VBR): número exacto de tramas; si no, estimación CBR
+        side = (32 if channels == 2 else 17) if version == 3 else (17 if channels == 2 else 9)
+        x = i + 4 + side
+        if buf[x:x + 4] in (b'Xing', b'Info') and buf[x + 7] & 1:
+            duration = int.from_bytes(buf[x + 8:x + 12], 'big') * samples_per_frame / rate
+        else:
+            duration = (size - offset - i) * 8 / bitrate
+        return {"duration": duration, "sampleRate": rate, "channels": channels}
+    return None
+
+def _ogg_info(path):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+        f.seek(max(0, size - 65536))
+        tail = f.read()
+    if head[:4] != b'OggS':
+        return None
+    payload = head[27 + head[26]:]
+    if payload[:7] == b'\x01vorbis':
+        channels, rate = payload[11], int.from_bytes(payload[12:16], 'little')
+        pre_skip, granule_rate = 0, rate
+    elif payload[:8] == b'OpusHead':
+        channels, rate = payload[9], int.from_bytes(payload[12:16], 'little') or 48000
+        pre_skip, granule_rate = int.from_bytes(payload[10:12], 'little'), 48000
+    else:
+        return None
+    last = tail.rfind(b'OggS')
+    granule = int.from_bytes(tail[last + 6:last + 14], 'little', signed=True) if last >= 0 else 0
+    return {"duration": max(0, granule - pre_skip) / granule_rate if granule_rate else 0,
+            "sampleRate": rate, "channels": channels}
+
+def read_info(path):
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == '.wav':
+            return _wav_info(path)
+        if ext == '.mp3':
+            return _mp3_info(path)
+        if ext == '.ogg':
+            return _ogg_info(path)
+    except (wave.Error, EOFError, IndexError):
+        return None
+    return None
+
+# --- Picos ---
+def _reduce(values, buckets):
+    """Agrupa una lista de máximos en 'buckets' tramos quedándose con el máximo de cada uno."""
+    if len(values) <= buckets:
+        return values
+    step = len(values) / buckets
+    return [max(values[int(i * step):max(int((i + 1) * step), int(i * step) + 1)]) for i in range(buckets)]
+
+def _wav_peaks(path, buckets):
+    if audioop is None:
+        return None
+    with wave.open(path, 'rb') as reader:
+        width, frames = reader.getsampwidth(), reader.getnframes()
+        buckets = min(buckets, frames)
+        full_scale = float(1 << (8 * width - 1))
+        peaks = []
+        for idx in range(buckets):
+            data = reader.readframes((idx + 1) * frames // buckets - idx * frames // buckets)
+            if not data:
+                break
+            if width == 1:
+                data = audioop.bias(data, 1, -128)
+            peaks.append(min(1.0, audioop.max(data, width) / full_scale))
+    return peaks
+
+def _ffmpeg_peaks(path, buckets):
+    cmd = [FFMPEG, '-nostdin', '-loglevel', 'error', '-i', path, '-vn', '-ac', '1',
+           '-ar', str(DECODE_RATE), '-f', 's16le', '-']
+    block = DECODE_RATE // 100 * 2  # 10 ms de muestras de 16 bits
+    values = []
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+        try:
+            while True:
+                data = proc.stdout.read(block * 64)
+                if not data:
+                    break
+                data = data[:len(data) // 2 * 2]
+                for start in range(0, len(data), block):
+                    values.append(audioop.max(data[start:start + block], 2) / 32768.0)
+        finally:
+            proc.wait(timeout=TRANSCODE_TIMEOUT)
+    return _reduce(values, buckets) if values else None
+
+def encode(info, peaks):
+    header = PEAKS_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, info["sampleRate"], info["channels"],
+                               info["duration"], len(peaks))
+    return header + bytes(min(255, round(p * 255)) for p in peaks)
+
+def decode(payload):
+    magic, version, rate, channels, duration, count = PEAKS_HEADER.unpack_from(payload)
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+        raise ValueError("Unknown peaks format")
+    body = payload[PEAKS_HEADER.size:PEAKS_HEADER.size + count]
+    return {"duration": duration, "sampleRate": rate, "channels": channels,
+            "peaks": [round(b / 255, 3) for b in body]}
+
+def analyze(src_path, out_dir, fp, buckets=PEAKS_BUCKETS):
+    """Lee cabeceras y calcula picos (se ejecuta en el pool de procesos).
+
+    Devuelve el dict de info con 'peaks' = nombre del sidecar o None si no se pudo decodificar.
+    """
+    info = read_info(src_path)
+    if info is None:
+        return None
+    peaks = None
+    if src_path.lower().endswith('.wav'):
+        peaks = _wav_peaks(src_path, buckets)
+    elif FFMPEG and audioop is not None:
+        peaks = _ffmpeg_peaks(src_path, buckets)
+    info["duration"] = round(info["duration"], 3)
+    info["peaks"] = None
+    if peaks:
+        os.makedirs(out_dir, exist_ok=True)
+        filename = f"{fp}.peaks"
+        atomic_write_bytes(os.path.join(out_dir, filename), encode(info, peaks), fsync=False)
+        info["peaks"] = filename
+    return info
+
+def analyze_job(job, tracks, out_dir, on_done):
+    """Trabajo de job_service: analiza [(id, ruta)] uno a uno e informa del progreso."""
+    analyzed, errors = 0, {}
+    for idx, (track_id, src_path) in enumerate(tracks):
+        job.progress(idx / len(tracks), track_id)
+        try:
+            fp = fingerprint(src_path)
+            info = run_in_process(analyze, src_path, out_dir, fp)
+            on_done(track_id, fp, info)
+            analyzed += 1
+        except Exception as e:
+            print(f"Error analizando '{track_id}': {e}")
+            errors[track_id] = str(e)
+    return {"analyzed": analyzed, "errors": errors}
@@ -0,0 +1,48 @@
+from bisect import bisect_right
+
+# Filtros, paginación por cursor y proyección de campos para listados del vault.
+# Los filtros de tipo/estado/etiqueta los resuelven los índices del snapshot
+# (FileService.list_vault_items_sorted); matches() queda para cuando está desactivado.
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def item_name(item):
+    content = item.get('content') or {}
+    return content.get('name') or content.get('title')
+
+def project(item, fields):
+    """Devuelve solo los campos pedidos: claves de primer nivel, 'content.<clave>' o 'name'."""
+    if not fields:
+        return item
+    result = {"id": item.get("id")}
+    for field in fields:
+        if field == 'name':
+            result['name'] = item_name(item)
+        elif field.startswith('content.'):
+            key = field[len('content.'):]
+            result.setdefault('content', {})[key] = (item.get('content') or {}).get(key)
+        elif field == 'usage_count':
+            result[field] = item.get(field, 0)
+        elif field in item:
+            result[field] = item[field]
+    return result
+
+def matches(item, item_type=None, status=None, tags=None):
+    if item_type and item.get('type') != item_type:
+        return False
+    if status and item.get('status') != status:
+        return False
+    if tags:
+        item_tags = item.get('tags') or []
+        if not all(tag in item_tags for tag in tags):
+            return False
+    return True
+
+def paginate(ids, items, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Página desde el cursor (último id devuelto) sobre ids/items ya filtrados y
+    ordenados por id. Devuelve (página, next_cursor)."""
+    start = bisect_right(ids, cursor) if cursor else 0
+    page = items[start:start + limit]
+    more = start + limit < len(items)
+    return page, page[-1]['id'] if more and page else None
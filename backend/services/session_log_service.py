@@ -0,0 +1,276 @@
+import json
+import os
+import threading
+from services import event_service
+from services.cache_service import clone_json, file_signature
+from services.journal_service import WRITE_FSYNC
+
+# Autoguardado diferencial de sesiones. PATCH recibe operaciones (JSON-Patch o
+# 'splice' de texto sobre una pestaña de notas) y solo las añade a un log por
+# sesión (oplog/<session_id>.jsonl); el JSON de la sesión se reescribe al
+# compactar: SESSION_COMPACT_DELAY segundos después del último cambio, al
+# llegar a SESSION_COMPACT_OPS operaciones, o antes de cualquier lectura/escritura
+# completa de la sesión (flush). El log en disco es la fuente de verdad, así que
+# otro proceso o un arranque tras un corte lo aplican igual. La sesión guarda en
+# 'rev' la última revisión compactada; las líneas del log con rev mayor están
+# pendientes.
+#
+# Operaciones: {"op": "add"|"replace"|"remove"|"test", "path": "/notes/general", "value": ...}
+#              {"op": "splice", "path": "/notes/<pestaña>", "at": 10, "delete": 2, "insert": "texto"}
+
+SESSION_COMPACT_DELAY = float(os.getenv('SESSION_COMPACT_DELAY', '2'))
+SESSION_COMPACT_OPS = int(os.getenv('SESSION_COMPACT_OPS', '200'))
+OPLOG_DIR = "oplog"
+# Campos de contenido que se pueden parchear (el estado va por PUT/close)
+PATCHABLE_FIELDS = ['title', 'strong_start', 'recap', 'summary', 'notes', 'linked_items', 'used_items']
+
+
+class PatchError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+    def to_dict(self):
+        return {"error": str(self), **self.extra}
+
+
+# --- Aplicación de operaciones ---
+def _parse_pointer(path):
+    if not isinstance(path, str) or not path.startswith('/'):
+        raise PatchError(f"Invalid path '{path}'")
+    parts = [p.replace('~1', '/').replace('~0', '~') for p in path[1:].split('/')]
+    if parts[0] not in PATCHABLE_FIELDS:
+        raise PatchError(f"Field '{parts[0]}' cannot be patched", 422)
+    return parts
+
+def _list_index(container, key, allow_end=False):
+    if key == '-' and allow_end:
+        return len(container)
+    try:
+        index = int(key)
+    except ValueError:
+        raise PatchError(f"Invalid list index '{key}'")
+    if not 0 <= index < len(container) + (1 if allow_end else 0):
+        raise PatchError(f"List index '{key}' out of range", 409)
+    return index
+
+def _resolve(doc, parts):
+    """(contenedor, clave final) del puntero."""
+    container = doc
+    for key in parts[:-1]:
+        if isinstance(container, dict):
+            if key not in container:
+                raise PatchError(f"Path '/{'/'.join(parts)}' not found", 409)
+            container = container[key]
+        elif isinstance(container, list):
+            container = container[_list_index(container, key)]
+        else:
+            raise PatchError(f"Path '/{'/'.join(parts)}' not found", 409)
+    return container, parts[-1]
+
+def _apply_op(doc, op):
+    kind = op.get('op')
+    parts = _parse_pointer(op.get('path'))
+    # Las notas antiguas son un texto: pasan a pestañas en cuanto se parchea una
+    if parts[0] == 'notes' and len(parts) > 1 and not isinstance(doc.get('notes'), dict):
+        doc['notes'] = {"general": doc.get('notes') or ""}
+    container, key = _resolve(doc, parts)
+
+    if kind == 'splice':
+        if isinstance(container, list):
+            key = _list_index(container, key)
+        elif not isinstance(container, dict):
+            raise PatchError(f"Path '{op['path']}' not found", 409)
+        current = container.get(key, "") if isinstance(container, dict) else container[key]
+        if not isinstance(current, str):
+            raise PatchError("Splice target is not text", 409)
+        at, delete, insert = op.get('at', 0), op.get('delete', 0), op.get('insert', "")
+        if not (isinstance(at, int) and isinstance(delete, int) and isinstance(insert, str)) \
+                or at < 0 or delete < 0 or at + delete > len(current):
+            raise PatchError("Splice out of range", 409, length=len(current))
+        container[key] = current[:at] + insert + current[at + delete:]
+    elif kind in ('add', 'replace'):
+        if 'value' not in op:
+            raise PatchError("Missing value")
+        if isinstance(container, list):
+            index = _list_index(container, key, allow_end=(kind == 'add'))
+            if kind == 'add':
+                container.insert(index, op['value'])
+            else:
+                container[index] = op['value']
+        elif isinstance(container, dict):
+            if kind == 'replace' and key not in container:
+                raise PatchError(f"Path '{op['path']}' not found", 409)
+            container[key] = op['value']
+        else:
+            raise PatchError(f"Path '{op['path']}' not found", 409)
+    elif kind == 'remove':
+        if isinstance(container, list):
+            del container[_list_index(container, key)]
+        elif isinstance(container, dict) and key in container:
+            del container[key]
+        else:
+            raise PatchError(f"Path '{op['path']}' not found", 409)
+    elif kind == 'test':
+        value = container[_list_index(container, key)] if isinstance(container, list) else \
+            (container.get(key) if isinstance(container, dict) else None)
+        if value != op.get('value'):
+            raise PatchError(f"Test failed at '{op['path']}'", 409)
+    else:
+        raise PatchError(f"Unsupported op '{kind}'")
+
+def apply_ops(doc, ops):
+    """Aplica todas las operaciones sobre una copia; si alguna falla no se aplica ninguna."""
+    if not isinstance(ops, list) or not all(isinstance(op, dict) for op in ops):
+        raise PatchError("ops must be a list of operations")
+    result = clone_json(doc)
+    for op in ops:
+        _apply_op(result, op)
+    return result
+
+
+# --- Log por sesión ---
+class SessionLog:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.timer = None
+        # Estado materializado válido mientras no cambien ni la sesión ni el log
+        self._state_key = None
+        self._state = None
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return []
+        entries = []
+        # Una última línea sin '\n' es de una escritura cortada: se ignora
+        for line in raw[:raw.rfind(b'\n') + 1].splitlines():
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                print(f"Aviso: registro ilegible en '{self.path}', se ignora.")
+        return entries
+
+    def materialize(self, service, file_path):
+        """(sesión con los cambios pendientes, revisión, nº de entradas pendientes)."""
+        key = (service.signature(file_path), file_signature(self.path))
+        if self._state is not None and self._state_key == key:
+            return self._state
+        session = service.peek_json(file_path)
+        if session is None:
+            return None, 0, 0
+        rev = session.get('rev', 0)
+        pending = [e for e in self._read() if e.get('rev', 0) > rev]
+        for entry in pending:
+            try:
+                session = apply_ops(session, entry['ops'])
+            except PatchError as e:
+                print(f"Aviso: operación pendiente inválida en '{self.path}' (rev {entry['rev']}): {e}")
+            rev = entry['rev']
+        self._state_key, self._state = key, (session, rev, len(pending))
+        return self._state
+
+    def append(self, service, file_path, ops, expected_rev=None):
+        session, rev, pending = self.materialize(service, file_path)
+        if session is None:
+            raise PatchError("Session not found", 404)
+        if expected_rev is not None and expected_rev != rev:
+            raise PatchError("Revision mismatch", 409, rev=rev)
+        updated = apply_ops(session, ops)
+        rev += 1
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.write(json.dumps({"rev": rev, "ops": ops}, ensure_ascii=False).encode('utf-8') + b"\n")
+            if WRITE_FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        self._state_key = (service.signature(file_path), file_signature(self.path))
+        self._state = (updated, rev, pending + 1)
+        return updated, rev, pending + 1
+
+    def compact(self, service, campaign_id, file_path):
+        """Vuelca los cambios pendientes al JSON de la sesión y vacía el log."""
+        session, rev, pending = self.materialize(service, file_path)
+        if session is not None and pending:
+            session = {**session, 'rev': rev}
+            # El log se borra a continuación: la sesión tiene que estar ya en disco
+            service.flush_writes([service.save_session(campaign_id, session)])
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._state = self._state_key = None
+        return session
+
+
+_logs = {}
+_registry_lock = threading.Lock()
+
+def oplog_path(service, campaign_id, session_id):
+    return os.path.join(service._get_campaign_path(campaign_id), OPLOG_DIR, f"{session_id}.jsonl")
+
+def get_log(service, campaign_id, session_id):
+    key = os.path.abspath(oplog_path(service, campaign_id, session_id))
+    with _registry_lock:
+        log = _logs.get(key)
+        if log is None:
+            log = SessionLog(key)
+            _logs[key] = log
+        return log
+
+def patch(service, campaign_id, session_id, ops, expected_rev=None):
+    """Añade operaciones al log de la sesión. Devuelve (sesión actualizada, revisión)."""
+    file_path = service.find_session(campaign_id, session_id)
+    if not file_path:
+        raise PatchError("Session not found", 404)
+    log = get_log(service, campaign_id, session_id)
+    with service.lock(file_path), log.lock:
+        session, rev, pending = log.append(service, file_path, ops, expected_rev)
+        if pending >= SESSION_COMPACT_OPS:
+            log.compact(service, campaign_id, file_path)
+        else:
+            _schedule_compaction(service, campaign_id, session_id, log)
+    event_service.publish_campaign(campaign_id, "session-patched", {"id": session_id, "rev": rev, "ops": ops})
+    return session, rev
+
+def flush(service, campaign_id, session_id):
+    """Compacta la sesión si tiene cambios en el log (antes de leerla o reescribirla entera)."""
+    log = get_log(service, campaign_id, session_id)
+    if not os.path.exists(log.path):
+        return
+    file_path = service.find_session(campaign_id, session_id)
+    if not file_path:
+        return
+    with service.lock(file_path), log.lock:
+        log.compact(service, campaign_id, file_path)
+
+def flush_campaign(service, campaign_id):
+    oplog_dir = os.path.join(service._get_campaign_path(campaign_id), OPLOG_DIR)
+    if os.path.isdir(oplog_dir):
+        for filename in os.listdir(oplog_dir):
+            if filename.endswith('.jsonl'):
+                flush(service, campaign_id, filename[:-len('.jsonl')])
+
+def discard(service, campaign_id, session_id):
+    log = get_log(service, campaign_id, session_id)
+    with log.lock:
+        if os.path.exists(log.path):
+            os.remove(log.path)
+        log._state = log._state_key = None
+
+def _schedule_compaction(service, campaign_id, session_id, log):
+    # Debounce: cada cambio aplaza la compactación
+    if log.timer is not None:
+        log.timer.cancel()
+    if SESSION_COMPACT_DELAY <= 0:
+        return
+    def run():
+        try:
+            flush(service, campaign_id, session_id)
+        except Exception as e:
+            print(f"Error compactando la sesión {session_id}: {e}")
+    log.timer = threading.Timer(SESSION_COMPACT_DELAY, run)
+    log.timer.daemon = True
+    log.timer.start()
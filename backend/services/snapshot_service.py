@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+from services.journal_service import atomic_write_bytes
+
+# Snapshot empaquetado del vault: un único JSON-lines por campaña que se reproduce en
+# una sola lectura secuencial. Registros:
+#   {"op": "sync", "m": <mtime vault/>}                 cabecera tras reconstruir
+#   {"op": "put", "item": {...}, "m": <mtime vault/>}   alta/modificación
+#   {"op": "del", "id": "...", "m": <mtime vault/>}     borrado
+# Los ficheros {type}_{uuid}.json siguen siendo la fuente de verdad. Cada registro
+# guarda el mtime del directorio vault/ tras la escritura: si no coincide con el
+# actual, alguien ha tocado el directorio por fuera y el snapshot se regenera.
+# En memoria se mantienen además índices id por tipo, estado y etiqueta, para
+# que los listados filtrados intersequen conjuntos en vez de recorrer el vault.
+
+SNAPSHOT_FILENAME = "vault_snapshot.jsonl"
+VAULT_SNAPSHOT_ENABLED = os.getenv('VAULT_SNAPSHOT', '1') != '0'
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+
+def _dir_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class VaultSnapshot:
+    def __init__(self, campaign_path):
+        self.vault_path = os.path.join(campaign_path, "vault")
+        self.path = os.path.join(campaign_path, SNAPSHOT_FILENAME)
+        self.lock = threading.RLock()
+        self._sorted = None
+        self._filtered = (None, {})  # (generación, {filtros: (ids, items)})
+        self._reset()
+
+    def _reset(self):
+        self.generation = getattr(self, 'generation', 0) + 1
+        self.items = {}
+        self._index = {"type": {}, "status": {}, "tag": {}}  # campo -> valor -> {ids}
+        self.offset = 0
+        self.inode = None
+        self.lines = 0
+        self.vault_mtime = None
+
+    @staticmethod
+    def _keys(item):
+        keys = [("type", item.get("type")), ("status", item.get("status"))]
+        keys.extend(("tag", tag) for tag in set(item.get("tags") or []) if isinstance(tag, str))
+        return keys
+
+    def _index_item(self, item):
+        for field, value in self._keys(item):
+            self._index[field].setdefault(value, set()).add(item["id"])
+
+    def _unindex_item(self, item):
+        for field, value in self._keys(item):
+            ids = self._index[field].get(value)
+            if ids is not None:
+                ids.discard(item["id"])
+                if not ids:
+                    del self._index[field][value]
+
+    def _apply(self, record):
+        op = record.get("op")
+        if op == "put":
+            item = record["item"]
+            previous = self.items.get(item["id"])
+            if previous is not None:
+                self._unindex_item(previous)
+            self.items[item["id"]] = item
+            self._index_item(item)
+        elif op == "del":
+            previous = self.items.pop(record["id"], None)
+            if previous is not None:
+                self._unindex_item(previous)
+        self.vault_mtime = record.get("m", self.vault_mtime)
+        self.lines += 1
+        self.generation += 1
+
+    def _catch_up(self):
+        """Lee solo lo añadido desde la última lectura; relee entero si se compactó."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return False
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            self._reset()
+            self.inode = st.st_ino
+        if st.st_size > self.offset:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                chunk = f.read()
+            # Ignorar una última línea a medio escribir
+            end = chunk.rfind(b"\n") + 1
+            for line in chunk[:end].splitlines():
+                if line.strip():
+                    self._apply(json.loads(line))
+            self.offset += end
+        return True
+
+    def is_fresh(self):
+        with self.lock:
+            try:
+                loaded = self._catch_up()
+            except ValueError:
+                # Línea corrupta: tratar como desfasado y reconstruir
+                self._reset()
+                return False
+            return loaded and self.vault_mtime is not None and self.vault_mtime == _dir_mtime(self.vault_path)
+
+    def list_items(self, load_fn):
+        """Items del vault (instancias compartidas, solo lectura)."""
+        with self.lock:
+            if not self.is_fresh():
+                self.rebuild(load_fn)
+            return list(self.items.values())
+
+    def sorted_items(self, load_fn):
+        """(ids ordenados, items en ese orden); se recalcula solo si cambió el snapshot."""
+        with self.lock:
+            self.list_items(load_fn)
+            if self._sorted is None or self._sorted[0] != self.generation:
+                ids = sorted(self.items)
+                self._sorted = (self.generation, ids, [self.items[i] for i in ids])
+            return self._sorted[1], self._sorted[2]
+
+    def filtered_items(self, load_fn, item_type=None, status=None, tags=None):
+        """Como sorted_items, pero solo los que cumplen los filtros (intersección de índices)."""
+        with self.lock:
+            ids, items = self.sorted_items(load_fn)
+            if not (item_type or status or tags):
+                return ids, items
+            key = (item_type, status, tuple(sorted(tags or [])))
+            if self._filtered[0] != self.generation:
+                self._filtered = (self.generation, {})
+            cached = self._filtered[1].get(key)
+            if cached is None:
+                wanted = [("type", item_type)] if item_type else []
+                if status:
+                    wanted.append(("status", status))
+                wanted.extend(("tag", tag) for tag in tags or [])
+                sets = sorted((self._index[field].get(value, set()) for field, value in wanted), key=len)
+                matched = sorted(sets[0].intersection(*sets[1:]))
+                cached = (matched, [self.items[i] for i in matched])
+                self._filtered[1][key] = cached
+            return cached
+
+    def rebuild(self, load_fn):
+        """Regenera el snapshot a partir de los ficheros individuales del vault."""
+        with self.lock:
+            if not os.path.isdir(self.vault_path):
+                self._reset()
+                return 0
+            items = {}
+            for filename in os.listdir(self.vault_path):
+                if filename.endswith(".json"):
+                    item = load_fn(os.path.join(self.vault_path, filename))
+                    if item and 'id' in item:
+                        items[item['id']] = item
+            self._write_all(items, _dir_mtime(self.vault_path))
+            return len(items)
+
+    def _write_all(self, items, vault_mtime):
+        lines = [_dumps({"op": "sync", "m": vault_mtime})]
+        lines.extend(_dumps({"op": "put", "item": item}) for item in items.values())
+        # Es un derivado regenerable: atómico pero sin fsync
+        atomic_write_bytes(self.path, "".join(lines).encode('utf-8'), fsync=False)
+        st = os.stat(self.path)
+        self.items = items
+        self._index = {"type": {}, "status": {}, "tag": {}}
+        for item in items.values():
+            self._index_item(item)
+        self.generation += 1
+        self.offset = st.st_size
+        self.inode = st.st_ino
+        self.lines = len(items) + 1
+        self.vault_mtime = vault_mtime
+
+    def _append(self, records, was_fresh):
+        # Si ya estaba desfasado antes de nuestra escritura no añadimos nada:
+        # marcarlo como sincronizado ocultaría los cambios externos.
+        if not was_fresh or not records:
+            return
+        with self.lock:
+            vault_mtime = _dir_mtime(self.vault_path)
+            for record in records:
+                record["m"] = vault_mtime
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write("".join(_dumps(r) for r in records))
+            self._catch_up()
+            # Compactar cuando el log acumula demasiadas operaciones obsoletas
+            if self.lines > 2 * len(self.items) + 64:
+                self._write_all(dict(self.items), self.vault_mtime)
+
+    def append_put(self, item, was_fresh):
+        self._append([{"op": "put", "item": item}], was_fresh)
+
+    def append_puts(self, items, was_fresh):
+        self._append([{"op": "put", "item": item} for item in items], was_fresh)
+
+    def append_delete(self, item_id, was_fresh):
+        self._append([{"op": "del", "id": item_id}], was_fresh)
+
+    def append_sync(self, was_fresh):
+        """Registra el mtime actual de vault/ tras una escritura ya aplicada al snapshot."""
+        self._append([{"op": "sync"}], was_fresh)
+
+
+_snapshots = {}
+_registry_lock = threading.Lock()
+
+def get_snapshot(campaign_path):
+    key = os.path.abspath(campaign_path)
+    with _registry_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None:
+            snapshot = VaultSnapshot(key)
+            _snapshots[key] = snapshot
+        return snapshot
+
+def drop_snapshot(campaign_path):
+    with _registry_lock:
+        _snapshots.pop(os.path.abspath(campaign_path), None)
@@ -0,0 +1,232 @@
+import json
+import os
+import threading
+from datetime import datetime
+from services import index_service
+from services.cache_service import file_signature
+from services.journal_service import atomic_write_bytes
+
+# Resumen por campaña (summary.json) para listar campañas y pintar el panel sin
+# leer metadata.json entero (el 'framework' puede ser enorme) ni recorrer el
+# vault y las sesiones: título, pitch, items por tipo/estado, sesiones, última
+# partida jugada y tamaño de los documentos. Se mantiene en memoria con los
+# avisos de FileService y se guarda en disco SUMMARY_SAVE_DELAY segundos después
+# del último cambio. Guarda las firmas de metadata.json y de los directorios, que
+# se comprueban al leer summary.json y en cada consulta del resumen en memoria:
+# si no coinciden (ediciones externas, otro worker) se reconstruye.
+
+SUMMARY_FILENAME = "summary.json"
+SUMMARY_SAVE_DELAY = float(os.getenv('SUMMARY_SAVE_DELAY', '1'))
+# Campos ligeros de metadata.json que se copian al resumen
+METADATA_FIELDS = ('id', 'title', 'elevator_pitch', 'moods', 'active_session')
+
+
+def _size(path):
+    signature = file_signature(path)
+    return signature[1] if signature else 0
+
+
+class CampaignSummary:
+    def __init__(self, campaign_path):
+        self.campaign_path = campaign_path
+        self.path = os.path.join(campaign_path, SUMMARY_FILENAME)
+        self.lock = threading.RLock()
+        self.built = False
+        self.versions = None  # firmas en disco a las que corresponde el estado en memoria
+        self.timer = None
+        self.meta = {}
+        self.meta_size = 0
+        self.items = {}     # id -> (tipo, estado, bytes)
+        self.sessions = {}  # id -> (estado, fecha, bytes)
+
+    def _versions(self):
+        return [list(file_signature(os.path.join(self.campaign_path, name)) or ())
+                for name in ("metadata.json", "vault", "sessions")]
+
+    def build(self, service):
+        """Recorre metadata, vault y sesiones (con las escrituras pendientes de 'service')."""
+        campaign_id = os.path.basename(self.campaign_path)[len("campaign_"):]
+        with self.lock:
+            metadata_path = os.path.join(self.campaign_path, "metadata.json")
+            metadata = service.peek_json(metadata_path) or {}
+            self.meta = {field: metadata.get(field) for field in METADATA_FIELDS}
+            self.meta_size = _size(metadata_path)
+            self.items, self.sessions = {}, {}
+            for kind, index in (("vault", service.vault_index(campaign_id)),
+                                ("sessions", service.sessions_index(campaign_id))):
+                for doc_id, entry in index.entries_snapshot().items():
+                    path = os.path.join(index.path, entry["filename"])
+                    data = service.peek_json(path)
+                    if data:
+                        self._put(kind, doc_id, data, _size(path))
+            self.built = True
+            self.versions = self._versions()
+
+    def _put(self, kind, doc_id, data, size):
+        if kind == "vault":
+            self.items[doc_id] = (data.get('type'), data.get('status'), size)
+        else:
+            self.sessions[doc_id] = (data.get('status'), data.get('date'), size)
+
+    def apply(self, event, path, data):
+        """Aviso de FileService sobre un documento de esta campaña."""
+        folder, filename = os.path.split(path)
+        with self.lock:
+            if filename == "metadata.json" and folder == self.campaign_path:
+                if event == 'saved' and data:
+                    self.meta = {field: data.get(field) for field in METADATA_FIELDS}
+                    self.meta_size = _size(path)
+                return
+            kind = os.path.basename(folder)
+            parser = {"vault": index_service.parse_vault_filename,
+                      "sessions": index_service.parse_session_filename}.get(kind)
+            parsed = parser(filename) if parser and os.path.dirname(folder) == self.campaign_path else None
+            if not parsed:
+                return
+            docs = self.items if kind == "vault" else self.sessions
+            if event == 'saved' and data:
+                self._put(kind, parsed[0], data, _size(path))
+            elif event == 'deleted' and not (data and data.get("moved_to")):
+                docs.pop(parsed[0], None)
+
+    def is_stale(self):
+        return self._versions() != self.versions
+
+    def flushed(self, directory, before):
+        """Volcado diferido de 'directory': su contenido ya estaba aplicado, solo cambia la firma.
+        Si el resumen seguía al día con la firma anterior pasa a la nueva; si no, se deja desfasado."""
+        with self.lock:
+            position = ("metadata.json", "vault", "sessions").index(os.path.basename(directory))
+            if self.built and self.versions and self.versions[position] == list(before or ()):
+                self.versions[position] = list(file_signature(directory) or ())
+                self.schedule_save()
+
+    def to_dict(self):
+        with self.lock:
+            by_type, by_status = {}, {}
+            for item_type, status, _ in self.items.values():
+                by_type[item_type] = by_type.get(item_type, 0) + 1
+                by_status[status] = by_status.get(status, 0) + 1
+            played = [date for status, date, _ in self.sessions.values() if status == 'completed' and date]
+            size = self.meta_size + sum(i[2] for i in self.items.values()) + sum(s[2] for s in self.sessions.values())
+            return {
+                **self.meta,
+                "vault": {"total": len(self.items), "by_type": by_type, "by_status": by_status},
+                "sessions": {"total": len(self.sessions),
+                             "completed": sum(1 for s in self.sessions.values() if s[0] == 'completed'),
+                             "last_played": max(played) if played else None},
+                "size_bytes": size,
+            }
+
+    def save(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not os.path.isdir(self.campaign_path):
+                return
+            payload = {**self.to_dict(), "updated_at": datetime.now().isoformat(), "versions": self._versions()}
+            atomic_write_bytes(self.path, json.dumps(payload, indent=2, ensure_ascii=False).encode('utf-8'))
+
+    def schedule_save(self):
+        # Debounce: una ráfaga de guardados escribe el resumen una sola vez
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            if SUMMARY_SAVE_DELAY <= 0:
+                self.save()
+                return
+            self.timer = threading.Timer(SUMMARY_SAVE_DELAY, self._save_safely)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _save_safely(self):
+        try:
+            self.save()
+        except Exception as e:
+            print(f"Error guardando el resumen de '{self.campaign_path}': {e}")
+
+    def load(self):
+        """Resumen de summary.json si sigue al día con los ficheros; None si no."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if stored.pop("versions", None) != self._versions():
+            return None
+        return stored
+
+
+_summaries = {}
+_registry_lock = threading.Lock()
+
+def _get_summary(campaign_path):
+    key = os.path.abspath(campaign_path)
+    with _registry_lock:
+        summary = _summaries.get(key)
+        if summary is None:
+            summary = CampaignSummary(key)
+            _summaries[key] = summary
+        return summary
+
+def get_summary(service, campaign_id):
+    """Resumen de una campaña, o None si no existe."""
+    campaign_path = os.path.abspath(service._get_campaign_path(campaign_id))
+    if not os.path.exists(os.path.join(campaign_path, "metadata.json")):
+        return None
+    summary = _get_summary(campaign_path)
+    with summary.lock:
+        if not summary.built:
+            stored = summary.load()
+            if stored is not None:
+                return stored
+            summary.build(service)
+            summary.save()
+        elif summary.is_stale():
+            # Cambios que no pasaron por este proceso
+            summary.build(service)
+            summary.schedule_save()
+        return {**summary.to_dict(), "updated_at": datetime.now().isoformat()}
+
+def list_summaries(service):
+    if not os.path.exists(service.storage_path):
+        return []
+    summaries = []
+    for name in sorted(os.listdir(service.storage_path)):
+        if name.startswith("campaign_") and os.path.isdir(os.path.join(service.storage_path, name)):
+            summary = get_summary(service, name[len("campaign_"):])
+            if summary:
+                summaries.append(summary)
+    return summaries
+
+def on_file_event(event, path, data=None):
+    """Listener de FileService: mantiene los resúmenes con cada guardado/borrado."""
+    path = os.path.abspath(path)
+    if event == 'campaign_deleted':
+        with _registry_lock:
+            summary = _summaries.pop(path, None)
+        if summary is not None and summary.timer is not None:
+            summary.timer.cancel()
+        return
+    if event == 'flushed':
+        if os.path.basename(path) in ("vault", "sessions"):
+            with _registry_lock:
+                summary = _summaries.get(os.path.dirname(path))
+            if summary is not None:
+                summary.flushed(path, (data or {}).get("before"))
+        return
+    folder = os.path.dirname(path)
+    campaign_path = folder if os.path.basename(path) == "metadata.json" else os.path.dirname(folder)
+    if not os.path.basename(campaign_path).startswith("campaign_"):
+        return
+    summary = _get_summary(campaign_path)
+    with summary.lock:
+        if not summary.built:
+            # Primer cambio en este proceso: se parte de lo que hay y se aplica el cambio
+            # encima (con escritura diferida el documento aún no está en el índice)
+            from services.file_service import FileService
+            summary.build(FileService(os.path.dirname(campaign_path)))
+        summary.apply(event, path, data)
+        summary.versions = summary._versions()
+        summary.schedule_save()
@@ -0,0 +1,303 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from bisect import bisect_left
+from services import index_service
+from services.cache_service import file_signature
+from services.text_service import session_document, tokenize, vault_document
+
+# Índice invertido en memoria por campaña (items del vault y sesiones, incluidas
+# las pestañas de notas) para la búsqueda de texto completo: sin tildes ni
+# mayúsculas, con prefijos ('drag*'), frases ("capitán de la guardia"), filtros y
+# facetas por etiqueta/tipo, y orden por BM25 (el título cuenta doble).
+# Se construye al primer uso y después se mantiene al vuelo con los avisos de
+# FileService en cada guardado/borrado; si los directorios cambian por fuera, al
+# refrescar solo se reindexan los ficheros cuya firma ha cambiado.
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_EXPANSIONS = 64
+PHRASE_GAP = 16  # separación de posiciones entre título y cuerpo (no hay frases entre ambos)
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+SOURCES = (("vault", "vault", index_service.parse_vault_filename, vault_document),
+           ("session", "sessions", index_service.parse_session_filename, session_document))
+
+
+def parse_query(query):
+    """Cláusulas ('term'|'prefix', término) y ('phrase', [términos]); todas deben cumplirse."""
+    clauses = []
+    for phrase, word in QUERY_PATTERN.findall(query):
+        if phrase:
+            tokens = tokenize(phrase)
+            if len(tokens) > 1:
+                clauses.append(("phrase", tokens))
+            elif tokens:
+                clauses.append(("term", tokens[0]))
+        elif word.endswith('*'):
+            tokens = tokenize(word[:-1])
+            if tokens:
+                clauses.extend(("term", t) for t in tokens[:-1])
+                clauses.append(("prefix", tokens[-1]))
+        else:
+            clauses.extend(("term", t) for t in tokenize(word))
+    return clauses
+
+
+class TextIndex:
+    def __init__(self, campaign_path):
+        self.campaign_path = campaign_path
+        self.service = None  # FileService para leer también las escrituras diferidas
+        self.lock = threading.RLock()
+        self.docs = {}      # "vault:<id>" / "session:<id>" -> metadatos
+        self.postings = {}  # término -> {clave: [posiciones]}
+        self.tagged = {}    # etiqueta -> {claves}
+        self.total_length = 0
+        self._vocabulary = None  # términos ordenados para expandir prefijos
+        self.versions = None
+
+    def _dir(self, folder):
+        return os.path.join(self.campaign_path, folder)
+
+    def _dir_versions(self):
+        signature = self.service.dir_signature if self.service else file_signature
+        return tuple(signature(self._dir(folder)) for _, folder, _, _ in SOURCES)
+
+    def _signature(self, path):
+        return self.service.signature(path) if self.service else file_signature(path)
+
+    def _read(self, path):
+        if self.service:
+            try:
+                return self.service.peek_json(path)
+            except (FileNotFoundError, ValueError):
+                return None
+        return _read_json(path)
+
+    # --- mantenimiento ---
+    def _remove(self, key):
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        for term in doc["terms"]:
+            postings = self.postings[term]
+            del postings[key]
+            if not postings:
+                del self.postings[term]
+                self._vocabulary = None
+        for tag in doc["tags"]:
+            self.tagged[tag].discard(key)
+            if not self.tagged[tag]:
+                del self.tagged[tag]
+        self.total_length -= doc["length"]
+
+    def _add(self, key, doc_id, filename, document, signature):
+        self._remove(key)
+        title_tokens = tokenize(document["title"] or "")
+        body_tokens = tokenize(document["text"])
+        positions = {}
+        for pos, term in enumerate(title_tokens):
+            positions.setdefault(term, []).append(pos)
+        for pos, term in enumerate(body_tokens, len(title_tokens) + PHRASE_GAP):
+            positions.setdefault(term, []).append(pos)
+        for term, term_positions in positions.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                self._vocabulary = None
+            self.postings[term][key] = term_positions
+        length = len(title_tokens) + len(body_tokens)
+        self.docs[key] = {"id": doc_id, "kind": document["kind"], "type": document["type"],
+                          "status": document["status"], "title": document["title"],
+                          "tags": list(dict.fromkeys(document["tags"])), "file": filename, "sig": signature,
+                          "terms": list(positions), "length": length}
+        for tag in self.docs[key]["tags"]:
+            self.tagged.setdefault(tag, set()).add(key)
+        self.total_length += length
+
+    def refresh(self):
+        """Reindexa lo que haya cambiado en disco desde la última vez (por firma de fichero)."""
+        with self.lock:
+            versions = self._dir_versions()
+            if versions == self.versions:
+                return
+            seen = set()
+            for kind, folder, parser, to_document in SOURCES:
+                directory = self._dir(folder)
+                filenames = os.listdir(directory) if os.path.isdir(directory) else []
+                for filename in filenames:
+                    parsed = parser(filename)
+                    if not parsed:
+                        continue
+                    key = f"{kind}:{parsed[0]}"
+                    path = os.path.join(directory, filename)
+                    signature = self._signature(path)
+                    seen.add(key)
+                    doc = self.docs.get(key)
+                    if doc and doc["sig"] == signature and doc["file"] == filename:
+                        continue
+                    data = self._read(path)
+                    if data:
+                        self._add(key, parsed[0], filename, to_document(data), signature)
+            for key in [k for k in self.docs if k not in seen]:
+                self._remove(key)
+            self.versions = versions
+
+    def apply(self, event, path, data):
+        """Aviso de FileService: un documento del vault o de sesiones guardado o borrado."""
+        folder, filename = os.path.split(path)
+        for kind, source_folder, parser, to_document in SOURCES:
+            if folder != self._dir(source_folder):
+                continue
+            parsed = parser(filename)
+            if not parsed:
+                return
+            key = f"{kind}:{parsed[0]}"
+            with self.lock:
+                in_sync = self.versions is not None
+                if event == 'saved' and data:
+                    self._add(key, parsed[0], filename, to_document(data), self._signature(path))
+                elif event == 'deleted' and self.docs.get(key, {}).get("file") == filename:
+                    self._remove(key)
+                # Si estábamos al día, seguimos estándolo: no hace falta releer el directorio
+                if in_sync:
+                    self.versions = self._dir_versions()
+            return
+
+    # --- búsqueda ---
+    def _vocabulary_terms(self):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        return self._vocabulary
+
+    def _expand(self, prefix):
+        vocabulary = self._vocabulary_terms()
+        start = bisect_left(vocabulary, prefix)
+        terms = []
+        for term in vocabulary[start:start + PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _clause_docs(self, clause):
+        """(claves que cumplen la cláusula, términos con los que puntúa)."""
+        kind, value = clause
+        if kind == "term":
+            return set(self.postings.get(value, ())), [value]
+        if kind == "prefix":
+            terms = self._expand(value)
+            docs = set()
+            for term in terms:
+                docs.update(self.postings[term])
+            return docs, terms
+        # Frase: todos los términos y en posiciones consecutivas
+        postings = [self.postings.get(t) for t in value]
+        if not all(postings):
+            return set(), value
+        candidates = set.intersection(*(set(p) for p in sorted(postings, key=len)))
+        docs = set()
+        for key in candidates:
+            starts = set(postings[0][key])
+            for offset, term_postings in enumerate(postings[1:], 1):
+                starts &= {p - offset for p in term_postings[key]}
+                if not starts:
+                    break
+            if starts:
+                docs.add(key)
+        return docs, value
+
+    def _term_weights(self, terms):
+        """[(postings, idf)] de los términos de la consulta, calculado una vez por búsqueda."""
+        weights = []
+        for term in dict.fromkeys(terms):
+            postings = self.postings.get(term)
+            if postings:
+                df = len(postings)
+                weights.append((postings, math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))))
+        return weights
+
+    def search(self, query, kinds=None, item_type=None, status=None, tags=None, limit=20, offset=0):
+        self.refresh()
+        clauses = parse_query(query)
+        with self.lock:
+            if clauses:
+                matched = [self._clause_docs(c) for c in clauses]
+                matched.sort(key=lambda m: len(m[0]))
+                keys = set(matched[0][0])
+                for docs, _ in matched[1:]:
+                    keys &= docs
+                    if not keys:
+                        break
+                terms = [t for _, clause_terms in matched for t in clause_terms]
+            else:
+                keys, terms = set(self.docs), []
+            for tag in tags or ():
+                keys &= self.tagged.get(tag, set())
+
+            weights = self._term_weights(terms)
+            average = (self.total_length / len(self.docs) if self.docs else 0) or 1
+            tag_counts, type_counts = {}, {}
+            results = []
+            for key in keys:
+                doc = self.docs[key]
+                if kinds and doc["kind"] not in kinds:
+                    continue
+                if item_type and doc["type"] != item_type:
+                    continue
+                if status and doc["status"] != status:
+                    continue
+                for tag in doc["tags"]:
+                    tag_counts[tag] = tag_counts.get(tag, 0) + 1
+                type_counts[doc["type"]] = type_counts.get(doc["type"], 0) + 1
+                # BM25
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc["length"] / average)
+                score = 0.0
+                for postings, idf in weights:
+                    positions = postings.get(key)
+                    if positions:
+                        score += idf * len(positions) * (BM25_K1 + 1) / (len(positions) + norm)
+                results.append((score, doc))
+        top = heapq.nlargest(offset + limit, results, key=lambda r: r[0])
+        return {"total": len(results), "results": top[offset:], "facets": {"tags": tag_counts, "types": type_counts}}
+
+    def stats(self):
+        with self.lock:
+            return {"documents": len(self.docs), "terms": len(self.postings)}
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+_indexes = {}
+_registry_lock = threading.Lock()
+
+def get_index(campaign_path, service=None):
+    key = os.path.abspath(campaign_path)
+    with _registry_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = TextIndex(key)
+            _indexes[key] = index
+        if service is not None:
+            index.service = service
+        return index
+
+def on_file_event(event, path, data=None):
+    """Listener de FileService: mantiene al día los índices ya construidos."""
+    if event == 'campaign_deleted':
+        with _registry_lock:
+            _indexes.pop(path, None)
+        return
+    campaign_path = os.path.dirname(os.path.dirname(path))
+    with _registry_lock:
+        index = _indexes.get(campaign_path)
+    if index is not None:
+        index.apply(event, path, data)
@@ -0,0 +1,42 @@
+import re
+import unicodedata
+
+# Texto indexable de los documentos de una campaña, compartido por la búsqueda
+# semántica (vector_service) y la de texto completo (text_index_service).
+
+STOPWORDS = set("""
+a al algo como con de del el en entre es esta este esto la las le les lo los mas me mi no o para pero
+por que se si sin su sus te tu un una uno unos unas y ya the of and to in is it for on with
+""".split())
+
+
+def fold(text):
+    """Minúsculas y sin tildes ('Dragón' -> 'dragon')."""
+    normalized = unicodedata.normalize('NFKD', text.lower())
+    return "".join(c for c in normalized if not unicodedata.combining(c))
+
+def tokenize(text):
+    return [t for t in re.findall(r'\w+', fold(text)) if len(t) > 1 and t not in STOPWORDS]
+
+def text_of(value):
+    """Texto plano de un valor JSON (solo los valores, no las claves)."""
+    if isinstance(value, dict):
+        return " ".join(text_of(v) for v in value.values())
+    if isinstance(value, list):
+        return " ".join(text_of(v) for v in value)
+    return str(value) if value not in (None, "") else ""
+
+
+def vault_document(item):
+    content = item.get('content') or {}
+    title = content.get('name') or content.get('title') or item.get('id')
+    tags = item.get('tags') or []
+    return {"kind": "vault", "title": title, "type": item.get('type'), "status": item.get('status'), "tags": tags,
+            "text": f"{title} {item.get('type', '')} {text_of(content)} {text_of(tags)}"}
+
+def session_document(session):
+    title = f"Sesión {session.get('number', '?')}: {session.get('title', 'Sin título')}"
+    parts = [title, session.get('strong_start', ''), session.get('recap', ''), session.get('summary', ''),
+             text_of(session.get('notes'))]
+    return {"kind": "session", "title": title, "type": "session", "status": session.get('status'), "tags": [],
+            "text": " ".join(p for p in parts if p)}
@@ -0,0 +1,190 @@
+import hashlib
+import math
+import os
+import shutil
+import subprocess
+import time
+import wave
+from services.journal_service import TMP_SUFFIX
+from services.job_service import run_in_process
+
+try:
+    import audioop  # Incluido hasta Python 3.12; en 3.13+ lo aporta 'audioop-lts'
+except ImportError:
+    audioop = None
+
+# Versiones ligeras de las pistas para el navegador. Con ffmpeg se genera un MP3
+# comprimido y una variante con loudnorm. Sin ffmpeg no hay versión comprimida
+# (se sirve el original, sin perder calidad) y de los WAV solo se genera la
+# variante normalizada: ganancia por sonoridad media (RMS con puerta de silencio,
+# hacia LOUDNESS_TARGET) limitada para que el pico no pase de PEAK_TARGET. Las
+# versiones se nombran por la huella del original y el original nunca se toca.
+
+FFMPEG = os.getenv('FFMPEG_PATH') or shutil.which('ffmpeg')
+TRANSCODE_ON_UPLOAD = os.getenv('TRANSCODE', '1') != '0'
+TRANSCODE_BITRATE = os.getenv('TRANSCODE_BITRATE', '128k')
+TRANSCODE_TIMEOUT = 600
+LOUDNESS_TARGET = float(os.getenv('LOUDNESS_TARGET', '-16'))  # LUFS
+PEAK_TARGET = 0.89  # -1 dBFS
+SILENCE_GATE_DB = -70.0  # bloques más bajos no cuentan para la sonoridad
+LOUDNESS_BLOCK_SECONDS = 0.4
+CHUNK_FRAMES = 65536
+FINGERPRINT_BYTES = 64 * 1024
+
+def fingerprint(path):
+    """Huella barata: tamaño, mtime y los primeros 64 KB del fichero."""
+    st = os.stat(path)
+    h = hashlib.sha1(f"{st.st_size}:{st.st_mtime_ns}:".encode('ascii'))
+    with open(path, 'rb') as f:
+        h.update(f.read(FINGERPRINT_BYTES))
+    return h.hexdigest()
+
+def _describe(out_dir, filename, kind, fmt):
+    return {"kind": kind, "file": filename, "format": fmt, "bytes": os.path.getsize(os.path.join(out_dir, filename))}
+
+def _tmp_path(path):
+    return os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}{TMP_SUFFIX}")
+
+# --- ffmpeg ---
+def _ffmpeg(src_path, dest_path, args):
+    tmp_path = _tmp_path(dest_path)
+    cmd = [FFMPEG, '-nostdin', '-y', '-loglevel', 'error', '-i', src_path, '-vn', *args, '-f', 'mp3', tmp_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=TRANSCODE_TIMEOUT)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip() or "ffmpeg failed")
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _render_ffmpeg(src_path, out_dir, fp):
+    compressed = f"{fp}.compressed.mp3"
+    normalized = f"{fp}.normalized.mp3"
+    encode = ['-c:a', 'libmp3lame', '-b:a', TRANSCODE_BITRATE]
+    _ffmpeg(src_path, os.path.join(out_dir, compressed), encode)
+    _ffmpeg(src_path, os.path.join(out_dir, normalized),
+            ['-af', f'loudnorm=I={LOUDNESS_TARGET}:TP=-1.5:LRA=11', *encode])
+    return [_describe(out_dir, compressed, "compressed", "mp3"),
+            _describe(out_dir, normalized, "normalized", "mp3")]
+
+# --- Alternativa en Python puro (solo WAV PCM) ---
+def _read_chunks(reader):
+    while True:
+        data = reader.readframes(CHUNK_FRAMES)
+        if not data:
+            return
+        yield data
+
+def _write_wav(dest_path, channels, width, rate, chunks):
+    tmp_path = _tmp_path(dest_path)
+    try:
+        with wave.open(tmp_path, 'wb') as writer:
+            writer.setnchannels(channels)
+            writer.setsampwidth(width)
+            writer.setframerate(rate)
+            for data in chunks:
+                writer.writeframes(data)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _pcm_chunks(src_path):
+    """PCM con signo a la resolución y frecuencia originales (los WAV de 8 bits pasan a 16)."""
+    with wave.open(src_path, 'rb') as reader:
+        width = reader.getsampwidth()
+        for data in _read_chunks(reader):
+            if width == 1:
+                # WAV de 8 bits es sin signo
+                data = audioop.lin2lin(audioop.bias(data, 1, -128), 1, 2)
+            yield data
+
+def _loudness_gain(src_path, channels, width, rate):
+    """Ganancia lineal hacia LOUDNESS_TARGET según el RMS de los bloques de
+    LOUDNESS_BLOCK_SECONDS con sonido, limitada por el pico; None si es silencio."""
+    full_scale = float(2 ** (8 * width - 1))
+    block_bytes = max(1, int(rate * LOUDNESS_BLOCK_SECONDS)) * channels * width
+    energy, samples, peak = 0.0, 0, 0
+    for data in _pcm_chunks(src_path):
+        peak = max(peak, audioop.max(data, width))
+        for start in range(0, len(data), block_bytes):
+            block = data[start:start + block_bytes]
+            count = len(block) // width
+            rms = audioop.rms(block, width) if count else 0
+            if rms and 20 * math.log10(rms / full_scale) > SILENCE_GATE_DB:
+                energy += rms * rms * count
+                samples += count
+    if not samples or not peak:
+        return None
+    loudness_db = 20 * math.log10(math.sqrt(energy / samples) / full_scale)
+    gain = 10 ** ((LOUDNESS_TARGET - loudness_db) / 20)
+    return min(gain, PEAK_TARGET * full_scale / peak)
+
+def _render_wav(src_path, out_dir, fp):
+    if audioop is None:
+        return []
+    with wave.open(src_path, 'rb') as reader:
+        channels, width, rate = reader.getnchannels(), reader.getsampwidth(), reader.getframerate()
+    width = max(width, 2)
+    gain = _loudness_gain(src_path, channels, width, rate)
+    if gain is None:
+        return []
+    normalized = f"{fp}.normalized.wav"
+    _write_wav(os.path.join(out_dir, normalized), channels, width, rate,
+               (audioop.mul(data, width, gain) for data in _pcm_chunks(src_path)))
+    return [_describe(out_dir, normalized, "normalized", "wav")]
+
+def render(src_path, out_dir, fp):
+    """Genera las versiones de una pista (se ejecuta en el pool de procesos)."""
+    os.makedirs(out_dir, exist_ok=True)
+    if FFMPEG:
+        renditions = _render_ffmpeg(src_path, out_dir, fp)
+    elif src_path.lower().endswith('.wav'):
+        renditions = _render_wav(src_path, out_dir, fp)
+    else:
+        renditions = []  # MP3/OGG ya van comprimidos y sin ffmpeg no se pueden decodificar
+
+    # Una versión "comprimida" que no pesa menos que el original no aporta nada
+    original_size = os.path.getsize(src_path)
+    kept = []
+    for rendition in renditions:
+        if rendition["kind"] == "compressed" and rendition["bytes"] >= original_size:
+            os.remove(os.path.join(out_dir, rendition["file"]))
+        else:
+            kept.append(rendition)
+    return kept
+
+def transcode_job(job, src_path, out_dir, on_done):
+    """Trabajo de job_service: calcula la huella, renderiza en el pool y avisa con el resultado."""
+    fp = fingerprint(src_path)
+    job.progress(0.1, "transcoding")
+    renditions = run_in_process(render, src_path, out_dir, fp)
+    job.progress(0.9, "recording")
+    on_done(fp, renditions)
+    return {"fingerprint": fp, "renditions": renditions}
+
+def lightest(renditions, kind):
+    candidates = [r for r in renditions or [] if r.get("kind") == kind]
+    return min(candidates, key=lambda r: r.get("bytes", 0)) if candidates else None
+
+def remove_orphans(out_dir, fingerprints, dry_run=False, grace=600):
+    """Borra ficheros cuya huella ya no está en los metadatos y devuelve sus nombres.
+
+    Los recientes (menos de 'grace' segundos) se respetan: pueden ser de un trabajo
+    que todavía no ha registrado su resultado.
+    """
+    if not os.path.isdir(out_dir):
+        return []
+    removed = []
+    cutoff = time.time() - grace
+    for filename in sorted(os.listdir(out_dir)):
+        path = os.path.join(out_dir, filename)
+        if filename.startswith('.') or filename.split('.', 1)[0] in fingerprints:
+            continue
+        if os.path.getmtime(path) >= cutoff:
+            continue
+        if not dry_run:
+            os.remove(path)
+        removed.append(filename)
+    return removed
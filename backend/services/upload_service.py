@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from services.journal_service import atomic_write_bytes
+from services.lock_service import path_lock
+
+# Subidas por trozos reanudables: init -> PUT de trozos en orden -> finalize con checksum.
+# Los bytes van directos a un '.part' en el directorio destino (sin pasar por memoria
+# ni por temporales de multipart) y el estado de cada subida se guarda en un JSON,
+# así que una subida cortada se puede retomar desde el último offset confirmado.
+
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', '1024')) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_MB', '8')) * 1024 * 1024
+UPLOAD_TTL = 24 * 3600
+STREAM_BUFFER = 1024 * 1024
+PART_SUFFIX = ".part"
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+    def to_dict(self):
+        return {"error": str(self), **self.extra}
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_BUFFER), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadStore:
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.state_dir, f"{upload_id}.json")
+
+    def _save(self, state):
+        state["updated"] = time.time()
+        atomic_write_bytes(self._state_path(state["id"]), json.dumps(state).encode('utf-8'))
+
+    def get(self, upload_id):
+        try:
+            uuid.UUID(upload_id)
+            with open(self._state_path(upload_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (ValueError, FileNotFoundError):
+            return None
+
+    def _require(self, upload_id):
+        state = self.get(upload_id)
+        if state is None:
+            raise UploadError("Upload not found", 404)
+        return state
+
+    def create(self, dest_path, size, extra=None):
+        if size <= 0:
+            raise UploadError("Invalid size")
+        if size > MAX_UPLOAD_BYTES:
+            raise UploadError("File too large", 413, max_bytes=MAX_UPLOAD_BYTES)
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.sweep()
+        upload_id = str(uuid.uuid4())
+        dest_dir, filename = os.path.split(dest_path)
+        os.makedirs(dest_dir, exist_ok=True)
+        part_path = os.path.join(dest_dir, f".{filename}.{upload_id}{PART_SUFFIX}")
+        open(part_path, 'wb').close()
+        state = {
+            "id": upload_id,
+            "dest_path": dest_path,
+            "part_path": part_path,
+            "size": size,
+            "offset": 0,
+            "created": time.time(),
+            **(extra or {}),
+        }
+        self._save(state)
+        return state
+
+    def append(self, upload_id, offset, stream, length, chunk_sha256=None):
+        """Escribe un trozo en 'offset'. Solo se admite continuar (o repetir) desde lo confirmado."""
+        with path_lock(self._state_path(upload_id)):
+            state = self._require(upload_id)
+            if offset > state["offset"]:
+                raise UploadError("Offset mismatch", 409, offset=state["offset"])
+            if length is None:
+                raise UploadError("Content-Length required", 411)
+            if offset + length > state["size"]:
+                raise UploadError("Chunk exceeds declared size", 413, offset=state["offset"])
+
+            digest = hashlib.sha256()
+            written = 0
+            with open(state["part_path"], 'r+b') as f:
+                f.seek(offset)
+                f.truncate()
+                while written < length:
+                    block = stream.read(min(STREAM_BUFFER, length - written))
+                    if not block:
+                        break
+                    f.write(block)
+                    digest.update(block)
+                    written += len(block)
+                # Trozo incompleto o corrupto: se descarta y el offset no avanza
+                if written != length or (chunk_sha256 and digest.hexdigest() != chunk_sha256.lower()):
+                    f.truncate(offset)
+                    state["offset"] = offset
+                    self._save(state)
+                    message = "Incomplete chunk" if written != length else "Chunk checksum mismatch"
+                    raise UploadError(message, 400 if written != length else 422, offset=offset)
+            state["offset"] = offset + written
+            self._save(state)
+            return state
+
+    def finalize(self, upload_id, sha256=None):
+        """Comprueba tamaño y checksum y mueve el '.part' a su nombre definitivo."""
+        with path_lock(self._state_path(upload_id)):
+            state = self._require(upload_id)
+            if state["offset"] != state["size"]:
+                raise UploadError("Upload incomplete", 409, offset=state["offset"])
+            actual = _sha256_file(state["part_path"])
+            if sha256 and actual != sha256.lower():
+                raise UploadError("Checksum mismatch", 422, sha256=actual)
+            os.replace(state["part_path"], state["dest_path"])
+            os.remove(self._state_path(upload_id))
+            state["sha256"] = actual
+            return state
+
+    def abort(self, upload_id):
+        with path_lock(self._state_path(upload_id)):
+            state = self._require(upload_id)
+            self._discard(state)
+
+    def _discard(self, state):
+        for path in (state["part_path"], self._state_path(state["id"])):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def sweep(self):
+        """Elimina subidas abandonadas hace más de UPLOAD_TTL."""
+        cutoff = time.time() - UPLOAD_TTL
+        for filename in os.listdir(self.state_dir):
+            if not filename.endswith('.json'):
+                continue
+            state = self.get(filename[:-len('.json')])
+            if state and state.get("updated", 0) < cutoff:
+                self._discard(state)
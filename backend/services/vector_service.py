@@ -0,0 +1,180 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from services.journal_service import atomic_write_bytes
+from services.text_service import session_document, tokenize, vault_document
+
+# Índice vectorial local por campaña sobre los items del vault y las sesiones,
+# para la búsqueda semántica y para llevar al asistente solo lo relevante.
+# Se guarda en vector_index.json junto a la campaña con la firma de cada fichero,
+# así que al refrescar solo se vuelven a embeber los documentos que han cambiado.
+# El embebedor es intercambiable (register_embedder + EMBEDDER); el de serie
+# ('hash') es determinista y no necesita red ni modelos: palabras, raíces y
+# pares de palabras repartidos en EMBED_DIM posiciones por hash. Los vectores se guardan
+# dispersos ({posición: valor}), así que una dimensión grande no cuesta nada.
+
+VECTOR_INDEX_FILENAME = "vector_index.json"
+EMBEDDER = os.getenv('EMBEDDER', 'hash')
+EMBED_DIM = int(os.getenv('EMBED_DIM', str(2 ** 20)))
+SEARCH_TOP_K = 10
+VECTOR_PRECISION = 5
+STEM_LENGTH = 6
+
+
+class HashingEmbedder:
+    name = "hash"
+
+    def __init__(self, dim=EMBED_DIM):
+        self.dim = dim
+
+    def _slot(self, feature):
+        digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+        return digest % self.dim, 1.0 if (digest >> 63) else -1.0
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            tokens = tokenize(text)
+            counts = {}
+            # Palabras, raíces (para plurales y derivadas: 'contrabandistas' ~ 'contrabando') y pares
+            stems = [f"{t[:STEM_LENGTH]}*" for t in tokens if len(t) > STEM_LENGTH]
+            for feature in tokens + stems + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                counts[feature] = counts.get(feature, 0) + 1
+            vector = {}
+            for feature, count in counts.items():
+                slot, sign = self._slot(feature)
+                vector[slot] = vector.get(slot, 0.0) + sign * (1 + math.log(count))
+            vectors.append(vector)
+        return vectors
+
+
+def _sparse(vector):
+    """Vector disperso normalizado a partir de una lista densa o de un dict posición -> valor."""
+    if not isinstance(vector, dict):
+        vector = {i: v for i, v in enumerate(vector) if v}
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {i: v / norm for i, v in vector.items()} if norm else {}
+
+def _dot(query, vector):
+    return sum(v * vector.get(i, 0.0) for i, v in query.items())
+
+
+EMBEDDERS = {"hash": HashingEmbedder}
+_embedders = {}
+
+def register_embedder(name, factory):
+    """Añade un embebedor: factory() -> objeto con name, dim y embed(textos) -> vectores
+    (listas densas o dicts posición -> valor; se normalizan aquí)."""
+    EMBEDDERS[name] = factory
+
+def get_embedder(name=None):
+    name = name or EMBEDDER
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unknown embedder '{name}'")
+    if name not in _embedders:
+        _embedders[name] = EMBEDDERS[name]()
+    return _embedders[name]
+
+
+class VectorIndex:
+    def __init__(self, campaign_path, embedder):
+        self.path = os.path.join(campaign_path, VECTOR_INDEX_FILENAME)
+        self.embedder = embedder
+        self.lock = threading.Lock()
+        self.docs = {}  # "vault:<id>" / "session:<id>" -> metadatos + vector
+        self.dir_versions = None
+        self.loaded = False
+
+    def _load(self):
+        self.loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        # Otro embebedor u otra dimensión: los vectores no son comparables, se rehace
+        if data.get("embedder") == self.embedder.name and data.get("dim") == self.embedder.dim:
+            self.docs = {key: {**doc, "vector": dict(zip(*doc["vector"]))} for key, doc in data.get("docs", {}).items()}
+
+    def _save(self):
+        # En disco cada vector va como [posiciones, valores]
+        docs = {key: {**doc, "vector": [list(doc["vector"]), list(doc["vector"].values())]}
+                for key, doc in self.docs.items()}
+        payload = {"embedder": self.embedder.name, "dim": self.embedder.dim, "docs": docs}
+        atomic_write_bytes(self.path, json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    def refresh(self, service, campaign_id):
+        """Pone el índice al día: embebe solo lo nuevo o modificado y olvida lo borrado."""
+        versions = (service.dir_signature(service._get_vault_path(campaign_id)),
+                    service.dir_signature(service._get_sessions_path(campaign_id)))
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            if versions == self.dir_versions:
+                return 0
+            sources = [("vault", service.vault_index(campaign_id), vault_document),
+                       ("session", service.sessions_index(campaign_id), session_document)]
+            seen, pending = set(), []
+            for kind, index, to_document in sources:
+                for doc_id, entry in index.entries_snapshot().items():
+                    key = f"{kind}:{doc_id}"
+                    path = os.path.join(index.path, entry["filename"])
+                    signature = list(service.signature(path) or ())
+                    seen.add(key)
+                    if key in self.docs and self.docs[key]["sig"] == signature:
+                        continue
+                    data = service.peek_json(path)
+                    if data:
+                        pending.append((key, signature, entry["filename"], to_document(data)))
+            removed = [k for k in self.docs if k not in seen]
+            for key in removed:
+                del self.docs[key]
+            vectors = self.embedder.embed([doc.pop("text") for _, _, _, doc in pending]) if pending else []
+            for (key, signature, filename, doc), vector in zip(pending, vectors):
+                self.docs[key] = {**doc, "id": key.split(":", 1)[1], "file": filename, "sig": signature,
+                                  "vector": {i: round(v, VECTOR_PRECISION) for i, v in _sparse(vector).items()}}
+            if pending or removed:
+                self._save()
+            self.dir_versions = versions
+            return len(pending)
+
+    def search(self, query, k=SEARCH_TOP_K, kinds=None, exclude=()):
+        """[(puntuación, documento)] de los k más parecidos a la consulta."""
+        if not query.strip():
+            return []
+        query_vector = _sparse(self.embedder.embed([query])[0])
+        with self.lock:
+            scored = [(_dot(query_vector, doc["vector"]), doc) for doc in self.docs.values()
+                      if (not kinds or doc["kind"] in kinds) and doc["id"] not in exclude]
+        scored = [s for s in scored if s[0] > 0]
+        scored.sort(key=lambda s: s[0], reverse=True)
+        return scored[:k]
+
+    def stats(self):
+        with self.lock:
+            return {"documents": len(self.docs), "embedder": self.embedder.name, "dim": self.embedder.dim}
+
+
+_indexes = {}
+_registry_lock = threading.Lock()
+
+def get_index(campaign_path):
+    key = os.path.abspath(campaign_path)
+    with _registry_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = VectorIndex(key, get_embedder())
+            _indexes[key] = index
+        return index
+
+def drop_index(campaign_path):
+    with _registry_lock:
+        _indexes.pop(os.path.abspath(campaign_path), None)
+
+def search(service, campaign_id, query, k=SEARCH_TOP_K, kinds=None, exclude=()):
+    """Búsqueda semántica en una campaña (refresca el índice antes si hace falta)."""
+    index = get_index(service._get_campaign_path(campaign_id))
+    index.refresh(service, campaign_id)
+    return index.search(query, k, kinds, exclude)
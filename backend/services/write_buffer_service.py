@@ -0,0 +1,193 @@
+import atexit
+import json
+import os
+import signal
+import threading
+import uuid
+from contextlib import nullcontext
+from services import journal_service
+from services.cache_service import file_signature
+
+# Escritura diferida (write-behind) de los documentos del vault y de las sesiones.
+# Con WRITE_BEHIND_INTERVAL > 0, guardar un documento que ya existe solo deja la
+# copia en memoria: los guardados seguidos del mismo documento se funden en uno y
+# se vuelcan a disco cada WRITE_BEHIND_INTERVAL segundos, en cuanto hay
+# WRITE_BEHIND_MAX_DIRTY documentos pendientes, al pedirlo (flush) y al salir
+# (atexit y SIGTERM/SIGINT). Mientras tanto las lecturas de FileService devuelven
+# la copia pendiente. Las altas, renombrados y borrados van directos a disco.
+# Los cambios pendientes solo los ve este proceso: pensado para un único worker.
+
+WRITE_BEHIND_INTERVAL = float(os.getenv('WRITE_BEHIND_INTERVAL', '0'))  # 0 = desactivado
+WRITE_BEHIND_MAX_DIRTY = int(os.getenv('WRITE_BEHIND_MAX_DIRTY', '256'))
+BUFFERED_FOLDERS = ("vault", "sessions")
+# Las generaciones vuelven a empezar en cada arranque: el ETag lleva este prefijo
+# para que uno de un proceso anterior no coincida con otra versión del documento
+EPOCH = uuid.uuid4().hex[:8]
+
+
+class WriteBuffer:
+    def __init__(self, root, on_flushed=None, guard=None):
+        self.root = root
+        self.on_flushed = on_flushed  # on_flushed(ruta, firma en disco, datos) tras volcar
+        # guard(directorios): contexto alrededor de cada volcado, para que quien sigue el
+        # mtime de esos directorios (snapshot del vault, resúmenes) no lo tome por un cambio externo
+        self.guard = guard
+        # Reentrante: el manejador de señales puede volcar en mitad de otra operación
+        self.lock = threading.RLock()
+        self._dirty = {}            # ruta -> (generación, datos)
+        self._generation = 0
+        self._dir_generations = {}  # directorio -> generación del último cambio en él
+        self._flushed_etags = {}    # ruta -> (firma en disco, etag) del último volcado
+        self._wake = threading.Event()
+        self._thread = None
+        self.saves = 0
+        self.coalesced = 0
+        self.writes = 0
+        self.flushes = 0
+
+    def accepts(self, path):
+        """Solo documentos del vault/sesiones que ya existen (el índice necesita el fichero)."""
+        if os.path.basename(os.path.dirname(path)) not in BUFFERED_FOLDERS:
+            return False
+        return path in self._dirty or os.path.exists(path)
+
+    def put(self, path, data):
+        with self.lock:
+            self._generation += 1
+            if path in self._dirty:
+                self.coalesced += 1
+            self._dirty[path] = (self._generation, data)
+            self._dir_generations[os.path.dirname(path)] = self._generation
+            self._flushed_etags.pop(path, None)
+            self.saves += 1
+            full = len(self._dirty) >= WRITE_BEHIND_MAX_DIRTY
+            self._start()
+        if full:
+            self._wake.set()
+
+    def get(self, path):
+        entry = self._dirty.get(path)
+        return entry[1] if entry else None
+
+    def generation(self, path):
+        entry = self._dirty.get(path)
+        return entry[0] if entry else None
+
+    def dir_generation(self, directory):
+        return self._dir_generations.get(directory, 0)
+
+    def etag(self, path):
+        """ETag de la copia pendiente; se conserva tras volcarla mientras el fichero no cambie."""
+        entry = self._dirty.get(path)
+        if entry:
+            return f"w{EPOCH}-{entry[0]:x}"
+        flushed = self._flushed_etags.get(path)
+        if flushed and flushed[0] == file_signature(path):
+            return flushed[1]
+        return None
+
+    def discard(self, path):
+        with self.lock:
+            self._dirty.pop(path, None)
+            self._flushed_etags.pop(path, None)
+
+    def discard_prefix(self, prefix):
+        with self.lock:
+            for path in [p for p in self._dirty if p.startswith(prefix)]:
+                del self._dirty[path]
+            for path in [p for p in self._flushed_etags if p.startswith(prefix)]:
+                del self._flushed_etags[path]
+
+    def flush(self, paths=None):
+        """Vuelca a disco lo pendiente (o solo 'paths'). Devuelve el nº de documentos escritos."""
+        with self.lock:
+            directories = {os.path.dirname(path) for path in self._dirty if paths is None or path in paths}
+        if not directories:
+            return 0
+        # El guard se toma antes que el lock del buffer: quien guarda toma primero el del snapshot
+        with (self.guard(directories) if self.guard else nullcontext()), self.lock:
+            batch = [(path, entry) for path, entry in self._dirty.items()
+                     if (paths is None or path in paths) and os.path.dirname(path) in directories]
+            if not batch:
+                return 0
+            writes = [(path, json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8'))
+                      for path, (_, data) in batch]
+            journal_service.write_many(self.root, writes)
+            for path, (generation, data) in batch:
+                del self._dirty[path]
+                signature = file_signature(path)
+                self._flushed_etags[path] = (signature, f"w{EPOCH}-{generation:x}")
+                if self.on_flushed:
+                    self.on_flushed(path, signature, data)
+            self.writes += len(batch)
+            self.flushes += 1
+            return len(batch)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(WRITE_BEHIND_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error volcando escrituras diferidas en '{self.root}': {e}")
+
+    def stats(self):
+        with self.lock:
+            return {"pending": len(self._dirty), "saves": self.saves, "coalesced": self.coalesced,
+                    "writes": self.writes, "flushes": self.flushes}
+
+
+_buffers = {}
+_registry_lock = threading.Lock()
+
+def get_buffer(root, on_flushed=None, guard=None):
+    key = os.path.abspath(root)
+    with _registry_lock:
+        buffer = _buffers.get(key)
+        if buffer is None:
+            buffer = WriteBuffer(key, on_flushed, guard)
+            _buffers[key] = buffer
+        return buffer
+
+def flush_all():
+    with _registry_lock:
+        buffers = list(_buffers.values())
+    written = 0
+    for buffer in buffers:
+        try:
+            written += buffer.flush()
+        except Exception as e:
+            print(f"Error volcando escrituras diferidas en '{buffer.root}': {e}")
+    return written
+
+def buffer_stats():
+    with _registry_lock:
+        return {root: buffer.stats() for root, buffer in _buffers.items()}
+
+def _shutdown_handler(previous):
+    def handler(signum, frame):
+        written = flush_all()
+        if written:
+            print(f"Escrituras diferidas volcadas al salir: {written}")
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            # Terminar ahora que no queda nada pendiente; SystemExit (y no la acción por
+            # defecto de la señal) para que se ejecuten los atexit, como el cierre del journal
+            raise SystemExit(128 + signum)
+    return handler
+
+def install_shutdown_handlers():
+    """Vuelca lo pendiente al terminar el proceso (salida normal, SIGTERM o Ctrl+C)."""
+    atexit.register(flush_all)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            signal.signal(signum, _shutdown_handler(signal.getsignal(signum)))
+        except ValueError:
+            pass  # Solo se pueden instalar desde el hilo principal
@@ -17,7 +17,7 @@ export function AudioSidebar() {
   
   const {
     currentFrame, setFrame, activeMusic, isPlayingMusic, pauseMusic, playMusic,
-    fetchTracks, fetchPresets, loadSettings, musicCurrentTime, musicDuration, requestSeek,
+    fetchTracks, fetchPresets, subscribeEvents, loadSettings, musicCurrentTime, musicDuration, requestSeek,
     masterVolume, setMasterVolume, musicMasterVolume, setMusicMasterVolume,
     ambienceMasterVolume, setAmbienceMasterVolume, sfxMasterVolume, setSFXMasterVolume,
     isMasterMuted, toggleMasterMute, isMusicMasterMuted, toggleMusicMasterMute,
@@ -25,7 +25,7 @@ export function AudioSidebar() {
     panic, skipTrack, playbackMode, setPlaybackMode
   } = useAppStore()
 
-  useEffect(() => { fetchTracks(); fetchPresets(); loadSettings(); }, []);
+  useEffect(() => { fetchTracks(); fetchPresets(); loadSettings(); return subscribeEvents(); }, []);
 
   const formatTime = (seconds: number) => {
     const mins = Math.floor(seconds / 60);
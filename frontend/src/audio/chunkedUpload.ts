@@ -0,0 +1,91 @@
+// Subida por trozos reanudable contra /api/uploads (init -> PUT trozos -> finalize).
+// El id de cada subida se guarda en localStorage para retomarla si se corta la conexión.
+
+const API_URL = 'http://localhost:5000/api/uploads';
+const MAX_RETRIES = 3;
+
+export interface UploadFields {
+    name: string;
+    type: 'music' | 'ambience' | 'sfx';
+    is_global: boolean;
+    icon: string;
+    frame?: string;
+    category?: string;
+    subcategory?: string;
+}
+
+const resumeKey = (file: File, fields: UploadFields) =>
+    `upload:${file.name}:${file.size}:${file.lastModified}:${fields.type}:${fields.category ?? ''}:${fields.subcategory ?? ''}:${fields.name}`;
+
+const sha256Hex = async (data: ArrayBuffer) => {
+    const digest = await crypto.subtle.digest('SHA-256', data);
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+};
+
+const initUpload = async (file: File, fields: UploadFields) => {
+    const res = await fetch(API_URL, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...fields, filename: file.name, size: file.size }),
+    });
+    if (!res.ok) throw new Error((await res.json()).error || `Error al iniciar la subida de ${file.name}`);
+    return res.json() as Promise<{ id: string; offset: number; chunkSize: number }>;
+};
+
+const currentOffset = async (uploadId: string): Promise<number | null> => {
+    const res = await fetch(`${API_URL}/${uploadId}`);
+    if (!res.ok) return null;
+    return (await res.json()).offset;
+};
+
+export const uploadInChunks = async (file: File, fields: UploadFields, onProgress?: (fraction: number) => void) => {
+    const key = resumeKey(file, fields);
+    let uploadId = localStorage.getItem(key);
+    let offset = uploadId ? await currentOffset(uploadId) : null;
+    let chunkSize = 8 * 1024 * 1024;
+
+    if (!uploadId || offset === null) {
+        const init = await initUpload(file, fields);
+        uploadId = init.id;
+        offset = init.offset;
+        chunkSize = init.chunkSize;
+        localStorage.setItem(key, uploadId);
+    }
+
+    let retries = 0;
+    while (offset < file.size) {
+        const chunk = await file.slice(offset, offset + chunkSize).arrayBuffer();
+        try {
+            const res = await fetch(`${API_URL}/${uploadId}?offset=${offset}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': await sha256Hex(chunk) },
+                body: chunk,
+            });
+            const body = await res.json();
+            if (!res.ok && body.offset === undefined) throw new Error(body.error);
+            // Con error, el servidor indica hasta dónde tiene confirmado y se continúa desde ahí
+            if (!res.ok && ++retries > MAX_RETRIES) throw new Error(body.error);
+            if (res.ok) retries = 0;
+            offset = body.offset as number;
+        } catch (err) {
+            if (++retries > MAX_RETRIES) throw err;
+            const confirmed = await currentOffset(uploadId).catch(() => null);
+            if (confirmed !== null) offset = confirmed;
+        }
+        onProgress?.(offset / file.size);
+    }
+
+    const res = await fetch(`${API_URL}/${uploadId}/finalize`, { method: 'POST' });
+    if (!res.ok) throw new Error((await res.json()).error || `Error al finalizar ${file.name}`);
+    localStorage.removeItem(key);
+    return res.json();
+};
+
+// Ejecuta las subidas con un máximo de 'limit' a la vez
+export const runWithConcurrency = async <T>(items: T[], limit: number, worker: (item: T) => Promise<void>) => {
+    const queue = [...items];
+    const runners = Array.from({ length: Math.min(limit, queue.length) }, async () => {
+        while (queue.length > 0) await worker(queue.shift() as T);
+    });
+    await Promise.all(runners);
+};
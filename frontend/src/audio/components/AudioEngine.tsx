@@ -1,6 +1,10 @@
 import { useEffect, useRef } from 'react';
 import { Howl } from 'howler';
 import { useAppStore } from '../store';
+import type { Track } from '../types';
+
+// Versión ligera primero; Howler recurre al original si el navegador no admite su formato
+const trackSources = (track: Track) => track.originalUrl && track.originalUrl !== track.url ? [track.url, track.originalUrl] : [track.url];
 
 export const AudioEngine = () => {
     const {
@@ -50,7 +54,7 @@ export const AudioEngine = () => {
 
         if (isPlayingMusic) {
             const newHowl = new Howl({
-                src: [activeMusic.url],
+                src: trackSources(activeMusic),
                 html5: true,
                 loop: playbackMode === 'loop',
                 volume: 0,
@@ -102,7 +106,7 @@ export const AudioEngine = () => {
         activeAmbience.forEach(amb => {
             let howl = ambienceHowlsRef.current.get(amb.instanceId);
             if (!howl) {
-                howl = new Howl({ src: [amb.track.url], html5: true, loop: true, volume: 0 });
+                howl = new Howl({ src: trackSources(amb.track), html5: true, loop: true, volume: 0 });
                 ambienceHowlsRef.current.set(amb.instanceId, howl);
                 howl.play();
                 const initialVol = amb.isMuted ? 0 : (amb.volume / 100) * ambienceFactor;
@@ -120,7 +124,7 @@ export const AudioEngine = () => {
             const { track } = sfxTrigger;
             if (sfxHowlsRef.current.has(track.id)) sfxHowlsRef.current.get(track.id)?.stop();
             const sfx = new Howl({
-                src: [track.url],
+                src: trackSources(track),
                 volume: sfxFactor,
                 onend: () => { sfxFinished(track.id); sfxHowlsRef.current.delete(track.id); }
             });
@@ -3,6 +3,9 @@ import { X, Upload, Check, AlertCircle, Files } from 'lucide-react';
 import { useAppStore } from '../store';
 import { SFX_CATEGORIES, AMBIENCE_ICONS } from '../types';
 import * as LucideIcons from 'lucide-react';
+import { uploadInChunks, runWithConcurrency } from '../chunkedUpload';
+
+const PARALLEL_UPLOADS = 3;
 
 interface UploadModalProps {
     isOpen: boolean;
@@ -11,7 +14,7 @@ interface UploadModalProps {
 }
 
 export const UploadModal = ({ isOpen, onClose, preselectedType = 'music' }: UploadModalProps) => {
-    const { currentFrame, fetchTracks, folderStructure } = useAppStore();
+    const { currentFrame, folderStructure } = useAppStore();
     const [files, setFiles] = useState<File[]>([]);
     const [name, setName] = useState('');
     const [type, setType] = useState<'music' | 'ambience' | 'sfx'>(preselectedType);
@@ -20,6 +23,7 @@ export const UploadModal = ({ isOpen, onClose, preselectedType = 'music' }: Uplo
     const [isGlobal, setIsGlobal] = useState(false); // Default false to fix music issue
     const [selectedIcon, setSelectedIcon] = useState('CloudRain'); 
     const [isUploading, setIsUploading] = useState(false);
+    const [progress, setProgress] = useState(0);
     const [error, setError] = useState<string | null>(null);
     const fileInputRef = useRef<HTMLInputElement>(null);
 
@@ -83,35 +87,29 @@ export const UploadModal = ({ isOpen, onClose, preselectedType = 'music' }: Uplo
     const handleUpload = async () => {
         if (!isFormValid()) return;
         setIsUploading(true);
+        setProgress(0);
         setError(null);
 
         try {
-            for (const file of files) {
-                const formData = new FormData();
-                formData.append('file', file);
-                const finalName = files.length > 1 ? file.name.replace(/\.[^/.]+$/, "").replace(/_/g, " ") : name;
+            // Subidas por trozos reanudables, varias en paralelo
+            const fractions = new Map<File, number>();
+            const totalBytes = files.reduce((sum, f) => sum + f.size, 0) || 1;
+            const reportProgress = () => setProgress(Math.round(files.reduce((sum, f) => sum + (fractions.get(f) || 0) * f.size, 0) / totalBytes * 100));
 
-                formData.append('name', finalName);
-                formData.append('type', type);
-                formData.append('is_global', String(isGlobal));
-                formData.append('icon', selectedIcon);
-                
-                if (!isGlobal) {
-                    formData.append('frame', currentFrame); 
-                }
-                
-                if (category) formData.append('category', category);
-                if (subcategory) formData.append('subcategory', subcategory);
-
-                const response = await fetch('http://localhost:5000/api/tracks', {
-                    method: 'POST',
-                    body: formData,
-                });
-
-                if (!response.ok) throw new Error(`Error al subir ${file.name}`);
-            }
-
-            await fetchTracks();
+            await runWithConcurrency(files, PARALLEL_UPLOADS, async (file) => {
+                const finalName = files.length > 1 ? file.name.replace(/\.[^/.]+$/, "").replace(/_/g, " ") : name;
+                await uploadInChunks(file, {
+                    name: finalName,
+                    type,
+                    is_global: isGlobal,
+                    icon: selectedIcon,
+                    ...(!isGlobal ? { frame: currentFrame } : {}),
+                    ...(category ? { category } : {}),
+                    ...(subcategory ? { subcategory } : {}),
+                }, (fraction) => { fractions.set(file, fraction); reportProgress(); });
+            });
+
+            // Las pistas nuevas llegan por los avisos de audio (track-added)
             onClose();
             setFiles([]);
             setName('');
@@ -240,7 +238,7 @@ export const UploadModal = ({ isOpen, onClose, preselectedType = 'music' }: Uplo
 
                     <button onClick={handleUpload} disabled={!isFormValid()} className="w-full py-3 bg-amber-600 hover:bg-amber-500 disabled:bg-white/5 disabled:text-zinc-600 text-white font-bold rounded-lg transition-all flex items-center justify-center gap-2 mt-4">
                         {isUploading ? <div className="w-4 h-4 border-2 border-white/30 border-t-white rounded-full animate-spin" /> : <Upload size={18} />}
-                        {files.length > 1 ? 'Subir Pistas' : 'Subir Pista'}
+                        {isUploading ? `Subiendo... ${progress}%` : files.length > 1 ? 'Subir Pistas' : 'Subir Pista'}
                     </button>
                 </div>
             </div>
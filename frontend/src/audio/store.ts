@@ -1,5 +1,6 @@
 import { create } from 'zustand';
 import type { Frame, Track, ActiveAmbience, AmbiencePreset, PlaybackMode } from './types';
+import { api } from '../services/api';
 
 interface AIContextState {
     campaignId?: string;
@@ -49,6 +50,7 @@ interface AppState {
     fetchTracks: () => Promise<void>;
     fetchStructure: () => Promise<void>;
     fetchPresets: () => Promise<void>;
+    subscribeEvents: () => () => void;
     loadSettings: () => Promise<void>;
     saveSettings: () => void;
 
@@ -163,6 +165,43 @@ export const useAppStore = create<AppState>((set, get) => ({
             set({ presets: await res.json() });
         } catch (e) { console.error(e); }
     },
+    // Cambios de la biblioteca en tiempo real: se aplican sobre el estado en vez de
+    // volver a pedir pistas y estructura tras cada operación (de esta u otra pestaña)
+    subscribeEvents: () => api.events.audio((type, data) => {
+        const { tracks } = get();
+        if (type === 'track-added') {
+            set({ tracks: [...tracks.filter(t => t.id !== data.track.id), data.track] });
+            get().fetchStructure();
+        } else if (type === 'track-deleted') {
+            set({ tracks: tracks.filter(t => t.id !== data.id) });
+        } else if (type === 'track-moved') {
+            set({ tracks: tracks.map(t => t.id === data.from ? { ...t, ...data.track } : t) });
+            get().fetchStructure();
+        } else if (type === 'track-metadata') {
+            const { icon, duration, sampleRate, channels, peaks, renditions } = data.changes;
+            // Las URLs de las versiones ligeras las calcula el servidor
+            if (renditions?.length) { get().fetchTracks(); return; }
+            set({ tracks: tracks.map(t => t.id !== data.id ? t : {
+                ...t,
+                ...(icon ? { icon } : {}),
+                ...(duration !== undefined ? { duration, sampleRate, channels, hasPeaks: !!peaks } : {})
+            }) });
+        } else if (type === 'category-created') {
+            get().fetchStructure();
+        } else if (type === 'category-deleted') {
+            set({ tracks: tracks.filter(t => !t.id.startsWith(`${data.path}/`)) });
+            get().fetchStructure();
+        } else if (type === 'category-renamed' || type === 'orphans-pruned' || type === 'reset') {
+            get().fetchTracks();
+            if (type === 'reset') get().fetchPresets();
+        } else if (type === 'preset-saved') {
+            set(state => ({ presets: [...state.presets.filter(p => p.id !== data.preset.id), data.preset] }));
+        } else if (type === 'preset-deleted') {
+            set(state => ({ presets: state.presets.filter(p => p.id !== data.id) }));
+        } else if (type === 'order-saved') {
+            set(state => ({ playlistOrders: { ...state.playlistOrders, [data.key]: data.trackIds } }));
+        }
+    }),
     loadSettings: async () => {
         try {
             const res = await fetch('http://localhost:5000/api/settings');
@@ -256,8 +295,6 @@ export const useAppStore = create<AppState>((set, get) => ({
                 })
             });
             if (!res.ok) throw new Error('Move failed');
-            await get().fetchTracks();
-            await get().fetchStructure();
         } catch (e) { console.error(e); }
     },
 
@@ -268,7 +305,6 @@ export const useAppStore = create<AppState>((set, get) => ({
                 body: JSON.stringify({ trackId: track.id, newName })
             });
             if (!res.ok) throw new Error('Rename failed');
-            await get().fetchTracks();
         } catch (e) { console.error(e); }
     },
 
@@ -282,8 +318,6 @@ export const useAppStore = create<AppState>((set, get) => ({
             if (newAmbience.length !== activeAmbience.length) set({ activeAmbience: newAmbience });
 
             if (activeSFXIds.includes(track.id)) set({ activeSFXIds: activeSFXIds.filter(id => id !== track.id) });
-
-            await get().fetchTracks();
         } catch (e) { console.error(e); }
     },
 
@@ -293,7 +327,6 @@ export const useAppStore = create<AppState>((set, get) => ({
                 method: 'PATCH', headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({ trackId: track.id, icon: iconName })
             });
-            await get().fetchTracks();
         } catch(e) { console.error(e); }
     },
 
@@ -303,8 +336,6 @@ export const useAppStore = create<AppState>((set, get) => ({
             method: 'POST', headers: {'Content-Type': 'application/json'},
             body: JSON.stringify({ type, name, parent, frame: currentFrame })
         });
-        await get().fetchTracks();
-        await get().fetchStructure();
     },
     renameCategory: async (type, oldName, newName, parent) => {
         const { currentFrame } = get();
@@ -312,16 +343,12 @@ export const useAppStore = create<AppState>((set, get) => ({
             method: 'POST', headers: {'Content-Type': 'application/json'},
             body: JSON.stringify({ type, oldName, newName, parent, frame: currentFrame })
         });
-        await get().fetchTracks();
-        await get().fetchStructure();
     },
     deleteCategory: async (type, name, parent) => {
         const { currentFrame } = get();
         await fetch(`http://localhost:5000/api/categories?type=${type}&name=${name}&frame=${currentFrame}${parent ? '&parent='+parent : ''}`, {
             method: 'DELETE'
         });
-        await get().fetchTracks();
-        await get().fetchStructure();
     },
 
     setMusicVolume: (volume) => set({ musicVolume: volume }),
@@ -353,7 +380,7 @@ export const useAppStore = create<AppState>((set, get) => ({
             tracks: activeAmbience.map(a => ({ trackId: a.track.id, volume: a.volume }))
         };
         await fetch('http://localhost:5000/api/presets', { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(presetData) });
-        await get().fetchPresets();
+        set(state => ({ presets: [...state.presets.filter(p => p.id !== newId), presetData] }));
         set({ activePresetId: newId });
     },
     updateCurrentPreset: async () => {
@@ -363,12 +390,11 @@ export const useAppStore = create<AppState>((set, get) => ({
         if (!existing) return;
         const updated = { ...existing, frame: currentFrame, tracks: activeAmbience.map(a => ({ trackId: a.track.id, volume: a.volume })) };
         await fetch('http://localhost:5000/api/presets', { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(updated) });
-        await get().fetchPresets();
+        set(state => ({ presets: state.presets.map(p => p.id === updated.id ? updated : p) }));
     },
     deletePreset: async (id) => {
         await fetch(`http://localhost:5000/api/presets/${id}`, { method: 'DELETE' });
-        set(state => state.activePresetId === id ? { activePresetId: null } : {});
-        get().fetchPresets();
+        set(state => ({ presets: state.presets.filter(p => p.id !== id), ...(state.activePresetId === id ? { activePresetId: null } : {}) }));
     },
 
     toggleSFX: (track) => {
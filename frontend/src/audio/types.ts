@@ -6,11 +6,16 @@ export interface Track {
     id: string;
     name: string;
     url: string;
+    originalUrl?: string; // El backend sirve una versión ligera en 'url' y el original aquí
+    normalizedUrl?: string;
     type: TrackType;
     frame?: Frame;
     category?: string; 
     subcategory?: string; 
-    duration?: number;
+    duration?: number; // Precalculada por el backend; la forma de onda en /api/tracks/<id>/peaks
+    sampleRate?: number;
+    channels?: number;
+    hasPeaks?: boolean;
     icon?: string; 
 }
 
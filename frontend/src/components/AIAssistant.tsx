@@ -22,6 +22,9 @@ export default function AIAssistant() {
     const [loading, setLoading] = useState(false);
     
     const messagesEndRef = useRef<HTMLDivElement>(null);
+    // El servidor guarda el historial por conversación; una nueva por cada carga del panel
+    const conversationId = useRef(crypto.randomUUID());
+    const abortRef = useRef<AbortController | null>(null);
 
     const addMessage = (msg: Message) => {
         setMessages(prev => [...prev, msg]);
@@ -35,6 +38,9 @@ export default function AIAssistant() {
         if (isOpen) scrollToBottom();
     }, [messages, isOpen]);
 
+    // Cortar la respuesta en curso si el componente se desmonta
+    useEffect(() => () => abortRef.current?.abort(), []);
+
     const handleSend = async () => {
         if (!query.trim() || loading || !campaignId) return;
 
@@ -43,11 +49,20 @@ export default function AIAssistant() {
         setQuery('');
         setLoading(true);
 
+        // La respuesta se va pintando según llegan los trozos
+        let started = false;
+        const onText = (text: string) => {
+            const first = !started;
+            started = true;
+            setMessages(prev => first
+                ? [...prev, { role: 'ai', text }]
+                : [...prev.slice(0, -1), { ...prev[prev.length - 1], text: prev[prev.length - 1].text + text }]);
+        };
+
         try {
-            const res = await api.ai.ask(campaignId, currentQuery, mode, sessionId);
-            if (res.response) {
-                addMessage({ role: 'ai', text: res.response });
-            } else {
+            abortRef.current = new AbortController();
+            const res = await api.ai.stream(campaignId, currentQuery, mode, sessionId, conversationId.current, onText, abortRef.current.signal);
+            if (!res.response) {
                 addMessage({ role: 'ai', text: "Lo siento, hubo un error conectando con la mente colmena." });
             }
         } catch (error) {
@@ -116,7 +131,7 @@ export default function AIAssistant() {
                             </div>
                         </div>
                     ))}
-                    {loading && (
+                    {loading && messages[messages.length - 1]?.role === 'user' && (
                         <div className="flex justify-start">
                             <div className="bg-gray-800 rounded-lg p-3 border border-gray-700">
                                 <FontAwesomeIcon icon={faCommentDots} className="text-gray-500 animate-pulse" />
@@ -81,6 +81,26 @@ export default function CampaignSidebar({ isOpen, onClose, campaignId }: Campaig
         }
     }, [isOpen, campaignId]);
 
+    // Sesiones y personajes se mantienen al día con los avisos de la campaña
+    useEffect(() => {
+        if (!campaignId) return;
+        return api.events.campaign(campaignId, (type, data) => {
+            if (type === 'session-changed') {
+                setSessions(prev => [...prev.filter(s => s.id !== data.id), data.session].sort((a, b) => b.number - a.number));
+            } else if (type === 'session-deleted') {
+                setSessions(prev => prev.filter(s => s.id !== data.id));
+            } else if (type === 'item-changed') {
+                setCharacters(prev => data.item.type === 'character'
+                    ? (prev.some(c => c.id === data.id) ? prev.map(c => c.id === data.id ? data.item : c) : [...prev, data.item])
+                    : prev.filter(c => c.id !== data.id));
+            } else if (type === 'item-deleted') {
+                setCharacters(prev => prev.filter(c => c.id !== data.id));
+            } else if (type === 'reset') {
+                loadData();
+            }
+        });
+    }, [campaignId]);
+
     const loadData = async () => {
         const meta = await api.campaigns.get(campaignId);
         const truths = meta.truths || [];
@@ -188,7 +208,7 @@ export default function CampaignSidebar({ isOpen, onClose, campaignId }: Campaig
         }
         if (confirm("¿Estás seguro de eliminar esta sesión? Todos los recursos vinculados volverán al Vault.")) {
             await api.sessions.delete(campaignId, session.id);
-            loadData();
+            setSessions(prev => prev.filter(s => s.id !== session.id));
         }
     };
 
@@ -45,7 +45,7 @@ export default function TopNavBar({
     const handleGoToSession = async () => {
         try {
             const [campaign, sessions] = await Promise.all([
-                api.campaigns.get(campaignId),
+                api.campaigns.summary(campaignId),
                 api.sessions.list(campaignId)
             ]);
             let targetSessionId = campaign.active_session;
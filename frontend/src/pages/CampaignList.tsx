@@ -11,7 +11,7 @@ export default function CampaignList() {
     }, []);
 
     const loadCampaigns = () => {
-        api.campaigns.list().then(setCampaigns);
+        api.campaigns.summaries().then(setCampaigns);
     };
 
     const handleCreate = async (e: React.FormEvent) => {
@@ -44,6 +44,10 @@ export default function CampaignList() {
                     <Link key={campaign.id} to={`/campaign/${campaign.id}/vault`} className="block p-6 bg-gray-800 rounded-lg border border-gray-700 hover:border-purple-500 transition-colors">
                         <h2 className="text-2xl font-bold mb-2 text-white">{campaign.title}</h2>
                         <p className="text-gray-400 line-clamp-2">{campaign.elevator_pitch || "Sin descripción definida..."}</p>
+                        <p className="text-gray-500 text-sm mt-3">
+                            {campaign.vault?.total ?? 0} elementos · {campaign.sessions?.completed ?? 0}/{campaign.sessions?.total ?? 0} sesiones jugadas
+                            {campaign.sessions?.last_played && ` · última: ${new Date(campaign.sessions.last_played).toLocaleDateString()}`}
+                        </p>
                     </Link>
                 ))}
             </div>
@@ -201,7 +201,40 @@ export default function SessionRunner() {
         return () => document.removeEventListener('mousedown', handleClickOutside);
     }, [editingId, editData]);
 
-    const loadVault = () => { if (id) api.vault.list(id).then(setVaultItems); };
+    // El vault se sincroniza por versiones: tras la carga inicial solo se piden los cambios
+    const vaultCursor = useRef<{ campaignId?: string, log?: string, version: number }>({ version: 0 });
+    const loadVault = async () => {
+        if (!id) return;
+        const cursor = vaultCursor.current.campaignId === id ? vaultCursor.current : { version: 0 };
+        const res = await api.campaigns.changes(id, cursor.version, cursor.log, ['vault']);
+        if (res.error) return;
+        vaultCursor.current = { campaignId: id, log: res.log, version: res.version };
+        const changed = res.changes.filter((c: any) => !c.deleted).map((c: any) => c.item);
+        if (res.reset || cursor.version === 0) {
+            setVaultItems(changed);
+            return;
+        }
+        const deleted = new Set(res.changes.filter((c: any) => c.deleted).map((c: any) => c.id));
+        setVaultItems(prev => {
+            const byId = new Map(prev.filter(i => !deleted.has(i.id)).map(i => [i.id, i]));
+            changed.forEach((item: any) => byId.set(item.id, item));
+            return Array.from(byId.values());
+        });
+    };
+    const upsertItem = (item: any) => {
+        if (!item?.id) return;
+        setVaultItems(prev => prev.some(i => i.id === item.id) ? prev.map(i => i.id === item.id ? item : i) : [...prev, item]);
+    };
+
+    // Cambios del vault en tiempo real (de esta u otras pestañas): se aplican sin recargar la lista
+    useEffect(() => {
+        if (!id) return;
+        return api.events.campaign(id, (type, data) => {
+            if (type === 'item-changed') upsertItem(data.item);
+            else if (type === 'item-deleted') setVaultItems(prev => prev.filter(i => i.id !== data.id));
+            else if (type === 'reset') loadVault();
+        });
+    }, [id]);
 
     const initSession = async () => {
         if (!id) return;
@@ -245,12 +278,50 @@ export default function SessionRunner() {
         else newUsed.add(itemId);
         setUsedItems(newUsed);
         const updatedSession = { ...session, used_items: Array.from(newUsed) };
+        await dropPatches();
         await api.sessions.update(id, session.id, updatedSession);
         setSession((prev: any) => ({ ...prev, used_items: Array.from(newUsed) }));
     };
 
+    // Autoguardado de notas: solo se envía el trozo de texto cambiado (PATCH con 'splice')
+    const sessionRef = useRef<any>(null);
+    sessionRef.current = session;
+    const pendingOps = useRef<any[]>([]);
+    const patchTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+    const patchInFlight = useRef<Promise<void>>(Promise.resolve());
+
+    const flushPatches = () => {
+        if (patchTimer.current) { clearTimeout(patchTimer.current); patchTimer.current = null; }
+        const ops = pendingOps.current;
+        const current = sessionRef.current;
+        if (!id || !current || ops.length === 0) return patchInFlight.current;
+        pendingOps.current = [];
+        patchInFlight.current = patchInFlight.current.then(async () => {
+            const res = await api.sessions.patch(id, current.id, ops);
+            // Si el servidor no puede aplicar el cambio, se guarda la sesión completa
+            if (res.error) await api.sessions.update(id, current.id, sessionRef.current);
+        });
+        return patchInFlight.current;
+    };
+
+    const queuePatch = (op: any) => {
+        pendingOps.current.push(op);
+        if (patchTimer.current) clearTimeout(patchTimer.current);
+        patchTimer.current = setTimeout(flushPatches, 400);
+    };
+
+    // Antes de enviar la sesión completa (que ya lleva las notas) los cambios en cola sobran
+    const dropPatches = () => {
+        if (patchTimer.current) { clearTimeout(patchTimer.current); patchTimer.current = null; }
+        pendingOps.current = [];
+        return patchInFlight.current;
+    };
+
+    useEffect(() => () => { flushPatches(); }, [id]);
+
     const saveSession = async (updated = session) => {
         if (!id || !updated) return;
+        await dropPatches();
         await api.sessions.update(id, updated.id, updated);
         setSession(updated);
     };
@@ -263,6 +334,21 @@ export default function SessionRunner() {
         const currentNotes = (typeof session.notes === 'string') ? { general: session.notes } : (session.notes || { general: '' });
         const updatedNotes = { ...currentNotes, [activeNoteTab]: val };
         updateField('notes', updatedNotes);
+        // Diferencia por prefijo/sufijo común, en caracteres completos (como los cuenta el servidor)
+        const before = Array.from(currentNotes[activeNoteTab] || '');
+        const after = Array.from(val);
+        let start = 0;
+        while (start < before.length && start < after.length && before[start] === after[start]) start++;
+        let end = 0;
+        while (end < before.length - start && end < after.length - start
+               && before[before.length - 1 - end] === after[after.length - 1 - end]) end++;
+        queuePatch({
+            op: 'splice',
+            path: `/notes/${activeNoteTab}`,
+            at: start,
+            delete: before.length - start - end,
+            insert: after.slice(start, after.length - end).join('')
+        });
     };
 
     const getNoteContent = () => {
@@ -282,19 +368,18 @@ export default function SessionRunner() {
         let newLinked;
         if (isLinked) {
             newLinked = session.linked_items.filter((i: string) => i !== itemId);
-            await api.vault.update(id, itemId, { status: 'reserve' });
+            upsertItem(await api.vault.update(id, itemId, { status: 'reserve' }));
             const newUsed = new Set(usedItems);
             newUsed.delete(itemId);
             setUsedItems(newUsed);
             await api.sessions.update(id, session.id, { linked_items: newLinked, used_items: Array.from(newUsed) });
         } else {
             newLinked = [...(session.linked_items || []), itemId];
-            await api.vault.update(id, itemId, { status: 'active' });
+            upsertItem(await api.vault.update(id, itemId, { status: 'active' }));
             await api.sessions.update(id, session.id, { linked_items: newLinked });
         }
         const updated = await api.sessions.get(id, session.id);
         setSession(updated);
-        loadVault();
     };
 
     const startConclusion = async () => {
@@ -310,7 +395,9 @@ export default function SessionRunner() {
             : Object.entries(session.notes).map(([k, v]) => `Notas de ${k === 'general' ? 'DM' : k}: ${v}`).join('\n');
         const prompt = `Genera un resumen narrativo y conciso... Título: ${session.title}. Notas: ${notesText}. Elementos: ${usedItemsList}`;
         try {
-            const res = await api.ai.ask(id, prompt, 'session', session.id);
+            // Resumen en su propia conversación, sin turnos de intentos anteriores
+            await api.ai.reset(id, 'session', session.id, 'summary');
+            const res = await api.ai.ask(id, prompt, 'session', session.id, 'summary');
             if (res.response) setGeneratedSummary(res.response);
             else setGeneratedSummary("No se pudo generar el resumen automáticamente.");
         } catch (e) { setGeneratedSummary("Error conectando con la IA."); } 
@@ -319,26 +406,16 @@ export default function SessionRunner() {
 
     const confirmConclusion = async () => {
         if (!id || !session) return;
-        const finalDate = new Date().toISOString();
-        const linkedIds = session.linked_items || [];
-        const finalLinkedItems = [];
-        for (const itemId of linkedIds) {
-            const item = vaultItems.find(i => i.id === itemId);
-            if (!item) continue;
-            const wasUsed = usedItems.has(itemId);
-            if (wasUsed) {
-                finalLinkedItems.push(itemId);
-                const isReusable = REUSABLE_TYPES.includes(item.type);
-                const newUsage = (item.usage_count || 0) + 1;
-                await api.vault.update(id, itemId, { status: isReusable ? 'reserve' : 'archived', usage_count: newUsage });
-            } else {
-                await api.vault.update(id, itemId, { status: 'reserve' });
-            }
-        }
-        const finalSession = { ...session, status: 'completed', date: finalDate, linked_items: finalLinkedItems, summary: generatedSummary };
-        await api.sessions.update(id, session.id, finalSession);
-        const newSession = await api.sessions.create(id, { recap: generatedSummary });
-        await api.campaigns.update(id, { active_session: newSession.id });
+        await dropPatches();
+        const { next_session: newSession } = await api.sessions.close(id, session.id, {
+            title: session.title,
+            strong_start: session.strong_start,
+            recap: session.recap,
+            notes: session.notes,
+            used_items: Array.from(usedItems),
+            summary: generatedSummary,
+            reusable_types: REUSABLE_TYPES
+        });
         setShowConclusionModal(false);
         navigate(`/campaign/${id}/sessions`, { state: { sessionId: newSession.id } });
         window.location.reload(); 
@@ -355,17 +432,19 @@ export default function SessionRunner() {
             const newLinked = [...(session.linked_items || []), newItem.id];
             const updatedSession = { ...session, linked_items: newLinked };
             setSession(updatedSession);
+            await dropPatches();
             await api.sessions.update(id, session.id, updatedSession);
-            await api.vault.update(id, newItem.id, { status: 'active' });
+            upsertItem(await api.vault.update(id, newItem.id, { status: 'active' }));
+        } else {
+            upsertItem(newItem);
         }
-        await loadVault();
         setEditingId(newItem.id);
         setEditData(newItem);
         if (filterType === 'all') setOpenGroups(prev => ({ ...prev, [type]: true }));
     };
 
     const startEditingItem = (item: any) => { setEditingId(item.id); setEditData(JSON.parse(JSON.stringify(item))); };
-    const saveItemEdit = async () => { if (!id || !editingId) return; await api.vault.update(id, editingId, editData); setEditingId(null); loadVault(); };
+    const saveItemEdit = async () => { if (!id || !editingId) return; upsertItem(await api.vault.update(id, editingId, editData)); setEditingId(null); };
     const updateItemContent = (field: string, val: any) => {
         const newContent = { ...editData.content, [field]: val };
         if (field === 'name') newContent.title = val; if (field === 'title') newContent.name = val;
@@ -550,7 +629,7 @@ export default function SessionRunner() {
                     <textarea 
                         value={getNoteContent()} 
                         onChange={e => updateNote(e.target.value)} 
-                        onBlur={() => saveSession()} 
+                        onBlur={() => flushPatches()} 
                         className="flex-1 w-full bg-gray-900 p-4 text-gray-300 font-mono text-sm resize-none focus:outline-none" 
                         placeholder={loading ? "Cargando notas..." : "Notas..."}
                         disabled={loading} 
@@ -1,8 +1,62 @@
 const API_BASE_URL = 'http://localhost:5000/api';
 
+// Lee una respuesta SSE (text/event-stream) y llama a onEvent por cada evento completo
+const readEventStream = async (res: Response, onEvent: (event: string, data: any) => void) => {
+    const reader = res.body!.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let end;
+        while ((end = buffer.indexOf('\n\n')) >= 0) {
+            const block = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            let event = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+};
+
+// Avisos de cambios en tiempo real (EventSource): onEvent(tipo, datos) para cada tipo de 'types'.
+// 'reset' llega si el servidor ya no tiene los eventos perdidos: hay que recargar.
+// EventSource reconecta solo y reenvía el último id, así que no se pierden cambios.
+const subscribe = (url: string, types: string[], onEvent: (type: string, data: any) => void) => {
+    const source = new EventSource(url);
+    for (const type of [...types, 'reset']) {
+        source.addEventListener(type, (e) => {
+            const payload = JSON.parse((e as MessageEvent).data);
+            onEvent(type, type === 'reset' ? payload : payload.data);
+        });
+    }
+    return () => source.close();
+};
+
+export const CAMPAIGN_EVENTS = ['item-changed', 'item-deleted', 'session-changed', 'session-patched',
+                                'session-deleted', 'campaign-changed', 'campaign-deleted'];
+export const AUDIO_EVENTS = ['track-added', 'track-deleted', 'track-moved', 'track-metadata', 'category-created',
+                             'category-renamed', 'category-deleted', 'preset-saved', 'preset-deleted',
+                             'order-saved', 'settings-saved', 'orphans-pruned'];
+
 export const api = {
     campaigns: {
         list: () => fetch(`${API_BASE_URL}/campaigns/`).then(res => res.json()),
+        // Resúmenes ligeros (título, pitch, contadores...) sin el 'framework'
+        summaries: () => fetch(`${API_BASE_URL}/campaigns/summaries`).then(res => res.json()),
+        summary: (id: string) => fetch(`${API_BASE_URL}/campaigns/${id}/summary`).then(res => res.json()),
+        // Cambios del vault y las sesiones desde 'since' (0 = todo); 'log' es el de la última respuesta
+        changes: (id: string, since = 0, log?: string, kinds?: string[]) => {
+            const params = new URLSearchParams({ since: String(since) });
+            if (log) params.set('log', log);
+            kinds?.forEach(kind => params.append('kind', kind));
+            return fetch(`${API_BASE_URL}/campaigns/${id}/changes?${params}`).then(res => res.json());
+        },
         create: (data: any) => fetch(`${API_BASE_URL}/campaigns/`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -17,7 +71,10 @@ export const api = {
         delete: (id: string) => fetch(`${API_BASE_URL}/campaigns/${id}`, { method: 'DELETE' }).then(res => res.json())
     },
     vault: {
-        list: (campaignId: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/vault`).then(res => res.json()),
+        list: (campaignId: string, params?: Record<string, string>) => {
+            const query = params ? `?${new URLSearchParams(params).toString()}` : '';
+            return fetch(`${API_BASE_URL}/campaigns/${campaignId}/vault${query}`).then(res => res.json());
+        },
         create: (campaignId: string, data: any) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/vault`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -28,6 +85,11 @@ export const api = {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(data)
         }).then(res => res.json()),
+        batch: (campaignId: string, updates: any[]) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/vault/batch`, {
+            method: 'PATCH',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ updates })
+        }).then(res => res.json()),
         delete: (campaignId: string, itemId: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/vault/${itemId}`, { method: 'DELETE' }).then(res => res.json())
     },
    sessions: {
@@ -43,13 +105,55 @@ export const api = {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(data)
         }).then(res => res.json()),
+        // Cambios parciales (JSON-Patch o 'splice' de texto); responde { id, rev } o { error }
+        patch: (campaignId: string, sessionId: string, ops: any[], rev?: number) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/sessions/${sessionId}`, {
+            method: 'PATCH',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(rev === undefined ? { ops } : { ops, rev })
+        }).then(res => res.json()),
+        close: (campaignId: string, sessionId: string, data: any) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/sessions/${sessionId}/close`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(data)
+        }).then(res => res.json()),
         delete: (campaignId: string, sessionId: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/sessions/${sessionId}`, { method: 'DELETE' }).then(res => res.json())
     },
+    events: {
+        campaign: (campaignId: string, onEvent: (type: string, data: any) => void) =>
+            subscribe(`${API_BASE_URL}/campaigns/${campaignId}/events`, CAMPAIGN_EVENTS, onEvent),
+        audio: (onEvent: (type: string, data: any) => void) =>
+            subscribe(`${API_BASE_URL}/audio/events`, AUDIO_EVENTS, onEvent)
+    },
     ai: {
-        ask: (campaignId: string, query: string, mode: 'vault' | 'session', sessionId?: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/chat`, {
+        ask: (campaignId: string, query: string, mode: 'vault' | 'session', sessionId?: string, conversationId?: string) => fetch(`${API_BASE_URL}/campaigns/${campaignId}/chat`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ query, mode, sessionId })
-        }).then(res => res.json())
+            body: JSON.stringify({ query, mode, sessionId, conversationId })
+        }).then(res => res.json()),
+        // Igual que ask, pero la respuesta llega a trozos por SSE; onText recibe cada trozo
+        stream: async (campaignId: string, query: string, mode: 'vault' | 'session', sessionId: string | undefined, conversationId: string | undefined, onText: (text: string) => void, signal?: AbortSignal) => {
+            const res = await fetch(`${API_BASE_URL}/campaigns/${campaignId}/chat/stream`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ query, mode, sessionId, conversationId }),
+                signal
+            });
+            if (!res.ok || !res.body) return res.json();
+            const result: any = { response: '' };
+            await readEventStream(res, (event, data) => {
+                if (event === 'context') result.context = data;
+                else if (event === 'done') result.conversation = data.conversation;
+                else if (event === 'error') result.error = data.error;
+                else {
+                    result.response += data.text;
+                    onText(data.text);
+                }
+            });
+            return result.error ? { ...result, response: undefined } : result;
+        },
+        reset: (campaignId: string, mode: 'vault' | 'session', sessionId?: string, conversationId?: string) => {
+            const params = new URLSearchParams({ mode, sessionId: sessionId ?? '', conversationId: conversationId ?? '' });
+            return fetch(`${API_BASE_URL}/campaigns/${campaignId}/chat?${params}`, { method: 'DELETE' }).then(res => res.json());
+        }
     }
 };
\ No newline at end of file